@@ -1 +1,2 @@
-from .graph import build_graph, get_chat_response
\ No newline at end of file
+from .graph import build_graph, get_chat_response, stream_chat_response, has_history, record_exchange
+from .registry import GraphRegistry, graph_registry, get_agent_graph
\ No newline at end of file
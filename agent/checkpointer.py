@@ -0,0 +1,542 @@
+import asyncio
+import datetime
+import json
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+import zstandard
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SessionLocal
+from database.models import GraphCheckpoint, GraphCheckpointWrite
+from utils import logger, config
+from utils.metrics import CHECKPOINT_CACHE_LOOKUPS, CHECKPOINT_READ_SECONDS, CHECKPOINT_WRITE_SECONDS
+
+
+_COMPRESSED = "+zstd"
+
+ThreadKey = Tuple[str, str]
+
+
+@dataclass
+class _Saved:
+    """A checkpoint as stored, serialized but not compressed."""
+    checkpoint_id: str
+    parent_checkpoint_id: Optional[str]
+    type: str
+    checkpoint: bytes
+    metadata: str
+    writes: Dict[Tuple[str, int], Tuple[str, str, bytes, str]] = field(default_factory=dict)
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class DatabaseCheckpointer(BaseCheckpointSaver):
+    """
+    Checkpointer of the agent graph stored with the SQLAlchemy async engine.
+
+    Unlike the MemorySaver it replaces, threads survive restarts and are shared by
+    every worker process, and their footprint is bounded:
+
+    - a checkpoint is one row holding the whole state, serialized by the graph's
+      serializer and compressed with zstd above `compress_min_bytes`
+    - only the last `keep` checkpoints of a thread are kept, older ones and their
+      pending writes are deleted as new ones are saved
+    - threads idle for more than `ttl` seconds are deleted, by a background sweep
+      run every `sweep_interval` seconds between start and stop
+    - the latest checkpoint of the `cache_size` most recently used threads is kept
+      in memory. A lookup then only reads the id of the latest checkpoint, and the
+      state is loaded from the database when another worker has moved the thread on.
+
+    Only the async API is implemented; the graph is always run asynchronously. The
+    sync methods, which the graph's get_state, invoke and stream call, raise a
+    NotImplementedError naming the async method to use instead.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        keep: int = config.CHECKPOINT_KEEP,
+        ttl: Optional[float] = config.CHECKPOINT_TTL,
+        sweep_interval: float = config.CHECKPOINT_SWEEP_INTERVAL,
+        cache_size: int = config.CHECKPOINT_CACHE_SIZE,
+        compress_min_bytes: int = config.CHECKPOINT_COMPRESS_MIN_BYTES,
+        serde=None,
+    ) -> None:
+        """
+        Initialize a DatabaseCheckpointer object.
+
+        Args:
+            session_factory: Creates the AsyncSession the checkpoints are stored with.
+            keep (int): The number of checkpoints kept per thread.
+            ttl (Optional[float]): The number of seconds after which an idle thread
+                is deleted, None to keep threads forever.
+            sweep_interval (float): The number of seconds between two sweeps of the
+                idle threads.
+            cache_size (int): The number of threads whose latest checkpoint is kept
+                in memory.
+            compress_min_bytes (int): The size from which serialized values are compressed.
+            serde: The serializer of the checkpoints, defaults to the graph's own.
+        """
+        super().__init__(serde=serde)
+        self.session_factory = session_factory
+        self.keep = max(1, keep)
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.cache_size = cache_size
+        self.compress_min_bytes = compress_min_bytes
+        self._cache: "OrderedDict[ThreadKey, _Saved]" = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    # serialization
+
+    def _dump(self, value: Any) -> Tuple[str, bytes]:
+        return self.serde.dumps_typed(value)
+
+    def _compress(self, type_: str, data: bytes) -> Tuple[str, bytes]:
+        if len(data) < self.compress_min_bytes:
+            return type_, data
+        return type_ + _COMPRESSED, zstandard.ZstdCompressor(level=3).compress(data)
+
+    @staticmethod
+    def _decompress(type_: str, data: bytes) -> Tuple[str, bytes]:
+        if type_.endswith(_COMPRESSED):
+            return type_[:-len(_COMPRESSED)], zstandard.ZstdDecompressor().decompress(data)
+        return type_, data
+
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, saved: _Saved) -> CheckpointTuple:
+        def thread_config(checkpoint_id: str) -> RunnableConfig:
+            return {
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            }
+
+        return CheckpointTuple(
+            config=thread_config(saved.checkpoint_id),
+            checkpoint=self.serde.loads_typed((saved.type, saved.checkpoint)),
+            metadata=json.loads(saved.metadata),
+            parent_config=thread_config(saved.parent_checkpoint_id) if saved.parent_checkpoint_id else None,
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((type_, value)))
+                for (task_id, _), (channel, type_, value, _) in sorted(saved.writes.items())
+            ],
+        )
+
+    # cache
+
+    def _cache_get(self, key: ThreadKey) -> Optional[_Saved]:
+        saved = self._cache.get(key)
+        if saved is not None:
+            self._cache.move_to_end(key)
+        return saved
+
+    def _cache_put(self, key: ThreadKey, saved: _Saved) -> None:
+        self._cache[key] = saved
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _cache_drop(self, thread_ids: Sequence[str]) -> None:
+        thread_ids = set(thread_ids)
+        for key in [key for key in self._cache if key[0] in thread_ids]:
+            del self._cache[key]
+
+    # database
+
+    async def _load(
+        self, session: AsyncSession, thread_id: str, checkpoint_ns: str, rows: List[GraphCheckpoint]
+    ) -> List[_Saved]:
+        """
+        Turn checkpoint rows into _Saved entries, with their pending writes.
+        """
+        if not rows:
+            return []
+        saved = {
+            row.checkpoint_id: _Saved(
+                row.checkpoint_id,
+                row.parent_checkpoint_id,
+                *self._decompress(row.type, row.checkpoint),
+                row.checkpoint_metadata,
+            )
+            for row in rows
+        }
+        writes = await session.execute(
+            select(GraphCheckpointWrite).where(
+                GraphCheckpointWrite.thread_id == thread_id,
+                GraphCheckpointWrite.checkpoint_ns == checkpoint_ns,
+                GraphCheckpointWrite.checkpoint_id.in_(list(saved)),
+            )
+        )
+        for write in writes.scalars():
+            type_, value = self._decompress(write.type, write.value)
+            saved[write.checkpoint_id].writes[(write.task_id, write.idx)] = (write.channel, type_, value, write.task_path)
+        return [saved[row.checkpoint_id] for row in rows]
+
+    async def _prune(self, session: AsyncSession, thread_id: str, checkpoint_ns: str) -> None:
+        """
+        Delete all but the last `keep` checkpoints of a thread, with their writes.
+        """
+        kept = await session.execute(
+            select(GraphCheckpoint.checkpoint_id)
+            .where(GraphCheckpoint.thread_id == thread_id, GraphCheckpoint.checkpoint_ns == checkpoint_ns)
+            .order_by(GraphCheckpoint.checkpoint_id.desc())
+            .limit(self.keep)
+        )
+        kept_ids = kept.scalars().all()
+        if len(kept_ids) < self.keep:
+            return
+        for model in (GraphCheckpoint, GraphCheckpointWrite):
+            await session.execute(
+                delete(model).where(
+                    model.thread_id == thread_id,
+                    model.checkpoint_ns == checkpoint_ns,
+                    model.checkpoint_id < kept_ids[-1],
+                )
+            )
+
+    async def expire(self) -> int:
+        """
+        Delete the threads whose latest checkpoint is older than the TTL.
+
+        Returns:
+            int: The number of threads deleted.
+        """
+        if self.ttl is None:
+            return 0
+        cutoff = _utcnow() - datetime.timedelta(seconds=self.ttl)
+        async with self.session_factory() as session, session.begin():
+            expired = await session.execute(
+                select(GraphCheckpoint.thread_id)
+                .group_by(GraphCheckpoint.thread_id)
+                .having(func.max(GraphCheckpoint.created_at) < cutoff)
+            )
+            thread_ids = expired.scalars().all()
+            for i in range(0, len(thread_ids), 500):
+                batch = thread_ids[i:i + 500]
+                for model in (GraphCheckpoint, GraphCheckpointWrite):
+                    await session.execute(delete(model).where(model.thread_id.in_(batch)))
+        self._cache_drop(thread_ids)
+        if thread_ids:
+            logger.info(f"Expired {len(thread_ids)} idle conversation threads")
+        return len(thread_ids)
+
+    async def start(self) -> None:
+        """
+        Start the task sweeping the idle threads, unless threads never expire.
+        """
+        if self.ttl is not None and self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep(), name="checkpoint-sweeper")
+
+    async def stop(self) -> None:
+        """
+        Stop the task sweeping the idle threads.
+        """
+        if self._sweeper is None:
+            return
+        self._sweeper.cancel()
+        await asyncio.gather(self._sweeper, return_exceptions=True)
+        self._sweeper = None
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.expire()
+            except Exception as e:
+                logger.error(f"Error expiring conversation threads: {str(e)}")
+
+    # checkpointer API
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """
+        Get a checkpoint of a thread, the latest one unless the config names one.
+
+        Args:
+            config (RunnableConfig): The config holding the thread id, and optionally
+                the checkpoint namespace and id.
+
+        Returns:
+            Optional[CheckpointTuple]: The checkpoint, or None if there is none.
+        """
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        key = (thread_id, checkpoint_ns)
+
+        cached = self._cache_get(key)
+        if cached is not None and cached.checkpoint_id == checkpoint_id:
+            CHECKPOINT_CACHE_LOOKUPS.labels(result="hit").inc()
+            return self._to_tuple(thread_id, checkpoint_ns, cached)
+
+        with CHECKPOINT_READ_SECONDS.time():
+            async with self.session_factory() as session:
+                query = select(GraphCheckpoint).where(
+                    GraphCheckpoint.thread_id == thread_id, GraphCheckpoint.checkpoint_ns == checkpoint_ns
+                )
+                if checkpoint_id:
+                    query = query.where(GraphCheckpoint.checkpoint_id == checkpoint_id)
+                else:
+                    latest = await session.execute(
+                        select(GraphCheckpoint.checkpoint_id)
+                        .where(GraphCheckpoint.thread_id == thread_id, GraphCheckpoint.checkpoint_ns == checkpoint_ns)
+                        .order_by(GraphCheckpoint.checkpoint_id.desc())
+                        .limit(1)
+                    )
+                    latest_id = latest.scalar_one_or_none()
+                    if latest_id is None:
+                        return None
+                    if cached is not None and cached.checkpoint_id == latest_id:
+                        CHECKPOINT_CACHE_LOOKUPS.labels(result="hit").inc()
+                        return self._to_tuple(thread_id, checkpoint_ns, cached)
+                    query = query.where(GraphCheckpoint.checkpoint_id == latest_id)
+
+                rows = (await session.execute(query)).scalars().all()
+                saved = await self._load(session, thread_id, checkpoint_ns, rows)
+
+        CHECKPOINT_CACHE_LOOKUPS.labels(result="miss").inc()
+        if not saved:
+            return None
+        if not checkpoint_id:
+            self._cache_put(key, saved[0])
+        return self._to_tuple(thread_id, checkpoint_ns, saved[0])
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """
+        List checkpoints, newest first.
+
+        Args:
+            config (Optional[RunnableConfig]): Restricts the listing to a thread, and
+                optionally to a namespace and checkpoint id.
+            filter (Optional[Dict[str, Any]]): Metadata values the checkpoints must have.
+            before (Optional[RunnableConfig]): Only list checkpoints older than this one.
+            limit (Optional[int]): The maximum number of checkpoints listed.
+
+        Yields:
+            CheckpointTuple: The matching checkpoints.
+        """
+        query = select(GraphCheckpoint)
+        if config:
+            configurable = config["configurable"]
+            query = query.where(GraphCheckpoint.thread_id == str(configurable["thread_id"]))
+            if configurable.get("checkpoint_ns") is not None:
+                query = query.where(GraphCheckpoint.checkpoint_ns == configurable["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                query = query.where(GraphCheckpoint.checkpoint_id == get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            query = query.where(GraphCheckpoint.checkpoint_id < get_checkpoint_id(before))
+        query = query.order_by(GraphCheckpoint.checkpoint_id.desc())
+        if limit is not None and not filter:
+            query = query.limit(limit)
+
+        async with self.session_factory() as session:
+            rows = (await session.execute(query)).scalars().all()
+            if filter:
+                rows = [
+                    row for row in rows
+                    if all(json.loads(row.checkpoint_metadata).get(name) == value for name, value in filter.items())
+                ][:limit]
+
+            for row in rows:
+                saved = await self._load(session, row.thread_id, row.checkpoint_ns, [row])
+                yield self._to_tuple(row.thread_id, row.checkpoint_ns, saved[0])
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """
+        Save a checkpoint and prune the older checkpoints of its thread.
+
+        Args:
+            config (RunnableConfig): The config of the thread, holding the id of the
+                parent checkpoint.
+            checkpoint (Checkpoint): The checkpoint to save.
+            metadata (CheckpointMetadata): The metadata of the checkpoint.
+            new_versions (ChannelVersions): The channel versions changed by this
+                checkpoint; unused, as the whole state is stored.
+
+        Returns:
+            RunnableConfig: The config pointing at the saved checkpoint.
+        """
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        saved = _Saved(
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),
+            *self._dump(checkpoint),
+            json.dumps(get_checkpoint_metadata(config, metadata), default=str),
+        )
+        type_, data = self._compress(saved.type, saved.checkpoint)
+
+        with CHECKPOINT_WRITE_SECONDS.time():
+            async with self.session_factory() as session, session.begin():
+                await session.merge(
+                    GraphCheckpoint(
+                        thread_id=thread_id,
+                        checkpoint_ns=checkpoint_ns,
+                        checkpoint_id=saved.checkpoint_id,
+                        parent_checkpoint_id=saved.parent_checkpoint_id,
+                        type=type_,
+                        checkpoint=data,
+                        checkpoint_metadata=saved.metadata,
+                        created_at=_utcnow(),
+                    )
+                )
+                await self._prune(session, thread_id, checkpoint_ns)
+
+        self._cache_put((thread_id, checkpoint_ns), saved)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": saved.checkpoint_id,
+            }
+        }
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """
+        Save the writes of a task against a checkpoint.
+
+        Regular writes already saved for the task are kept as they are; special
+        writes (errors, interrupts, ...) replace the previous ones.
+
+        Args:
+            config (RunnableConfig): The config pointing at the checkpoint.
+            writes (Sequence[Tuple[str, Any]]): The (channel, value) writes.
+            task_id (str): The id of the task that made the writes.
+            task_path (str): The path of the task.
+        """
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        entries = {
+            (task_id, WRITES_IDX_MAP.get(channel, idx)): (channel, *self._dump(value), task_path)
+            for idx, (channel, value) in enumerate(writes)
+        }
+
+        with CHECKPOINT_WRITE_SECONDS.time():
+            async with self.session_factory() as session, session.begin():
+                existing = await session.execute(
+                    select(GraphCheckpointWrite.idx).where(
+                        GraphCheckpointWrite.thread_id == thread_id,
+                        GraphCheckpointWrite.checkpoint_ns == checkpoint_ns,
+                        GraphCheckpointWrite.checkpoint_id == checkpoint_id,
+                        GraphCheckpointWrite.task_id == task_id,
+                    )
+                )
+                existing_idx = set(existing.scalars().all())
+                entries = {key: entry for key, entry in entries.items() if key[1] < 0 or key[1] not in existing_idx}
+
+                for (_, idx), (channel, type_, value, path) in entries.items():
+                    type_, value = self._compress(type_, value)
+                    await session.merge(
+                        GraphCheckpointWrite(
+                            thread_id=thread_id,
+                            checkpoint_ns=checkpoint_ns,
+                            checkpoint_id=checkpoint_id,
+                            task_id=task_id,
+                            idx=idx,
+                            channel=channel,
+                            type=type_,
+                            value=value,
+                            task_path=path,
+                        )
+                    )
+
+        cached = self._cache.get((thread_id, checkpoint_ns))
+        if cached is not None and cached.checkpoint_id == checkpoint_id:
+            cached.writes.update(entries)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """
+        Delete every checkpoint and write of a thread.
+
+        Args:
+            thread_id (str): The id of the thread.
+        """
+        thread_id = str(thread_id)
+        async with self.session_factory() as session, session.begin():
+            for model in (GraphCheckpoint, GraphCheckpointWrite):
+                await session.execute(delete(model).where(model.thread_id == thread_id))
+        self._cache_drop([thread_id])
+
+    # sync API, not supported
+
+    @staticmethod
+    def _async_only(async_method: str):
+        raise NotImplementedError(
+            f"DatabaseCheckpointer only supports the async API: use {async_method}, "
+            "and run the graph with aget_state, ainvoke or astream"
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self._async_only("aget_tuple")
+
+    def list(self, config: Optional[RunnableConfig], **kwargs: Any):
+        self._async_only("alist")
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        self._async_only("aput")
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        self._async_only("aput_writes")
+
+    def delete_thread(self, thread_id: str) -> None:
+        self._async_only("adelete_thread")
+
+
+def create_checkpointer():
+    """
+    Create the checkpointer configured by CHECKPOINTER.
+
+    Returns:
+        BaseCheckpointSaver: A DatabaseCheckpointer for "database", a MemorySaver
+            for "memory".
+
+    Raises:
+        ValueError: If CHECKPOINTER names an unknown checkpointer.
+    """
+    if config.CHECKPOINTER == "database":
+        return DatabaseCheckpointer()
+    if config.CHECKPOINTER == "memory":
+        return MemorySaver()
+    raise ValueError(f"Unknown checkpointer: {config.CHECKPOINTER}, expected 'database' or 'memory'")
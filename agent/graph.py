@@ -1,17 +1,24 @@
+import time
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable, RunnableConfig
-from langchain_core.messages import ToolMessage
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from langchain_core.runnables import RunnableLambda
 from langgraph.prebuilt import ToolNode
+from typing import List, Optional, Tuple
 from utils import logger, llm, Chroma_VectorStore
+from utils.huggingface_wrapper import is_local_model
+from utils.inference import InferenceExecutor, InferenceOverloaded, inference_executor
 from agent.state import State
-from langgraph.checkpoint.memory import MemorySaver
+from agent.history import HistoryPolicy, summary_section
+from agent.checkpointer import create_checkpointer
 from langgraph.graph import END, StateGraph, START
 from langgraph.prebuilt import tools_condition
 from agent.tools import lookup_informations
+from utils.metrics import ASSISTANT_RETRIES, CHAT_TTFT_SECONDS, LLM_CALL_SECONDS, LLM_TOKENS
+from utils.tracing import set_attributes, start_span
 
 
-memory = MemorySaver()
+memory = create_checkpointer()
 
     
 def handle_tool_error(state) -> dict:
@@ -50,23 +57,80 @@ def create_tool_node_with_fallback(tools: list) -> dict:
     )
 
 
+def count_tokens(message) -> Tuple[int, int]:
+    """
+    Add the token usage reported with an LLM message to llm_tokens_total.
+
+    Models that report no usage, in usage_metadata or in the token_usage of the
+    response metadata, are not counted.
+
+    :param message: the message generated by the LLM
+    :type message: AIMessage
+    :return: the input and output tokens, 0 when not reported
+    :rtype: Tuple[int, int]
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        tokens_in, tokens_out = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    else:
+        usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+        tokens_in, tokens_out = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    if tokens_in:
+        LLM_TOKENS.labels(direction="input").inc(tokens_in)
+    if tokens_out:
+        LLM_TOKENS.labels(direction="output").inc(tokens_out)
+    return tokens_in, tokens_out
+
  
 class Assistant:
-    def __init__(self, runnable: Runnable):
+    def __init__(self, runnable: Runnable, executor: Optional[InferenceExecutor] = None):
         """
         Initialize an Assistant object.
 
         :param runnable: the runnable that will be executed
         :type runnable: Runnable
+        :param executor: the inference executor to run a local model on, if any
+        :type executor: InferenceExecutor
         """
         self.runnable = runnable
+        self.executor = executor
+
+    async def invoke(self, state: State, config: RunnableConfig):
+        """
+        Invoke the runnable without blocking the event loop.
+
+        Local models are synchronous, so they run on the bounded inference executor;
+        any other runnable is awaited through its native ainvoke.
+
+        :param state: the state of the conversation
+        :type state: State
+        :param config: the configuration of the runnable
+        :type config: RunnableConfig
+        :return: the message generated by the runnable
+        :rtype: AIMessage
+        """
+        with LLM_CALL_SECONDS.time(), start_span("llm.call", **{"llm.local": self.executor is not None}) as span:
+            if self.executor is not None:
+                result = await self.executor.run(self.runnable.invoke, state, config)
+            else:
+                result = await self.runnable.ainvoke(state, config)
+            tokens_in, tokens_out = count_tokens(result)
+            set_attributes(
+                span,
+                **{
+                    "llm.input_tokens": tokens_in or None,
+                    "llm.output_tokens": tokens_out or None,
+                    "llm.tool_calls": len(getattr(result, "tool_calls", None) or []),
+                }
+            )
+        return result
 
-    def __call__(self, state: State, config: RunnableConfig):
+    async def __call__(self, state: State, config: RunnableConfig):
         """
         Invoke the runnable with the given state and configuration.
 
         This function is a simple wrapper around the invoke method of the
-        runnable. It adds the passenger_id to the state and breaks the loop
+        runnable. It adds the conversation summary to the state and breaks the loop
         if the result of the invoke method is not empty.
 
         :param state: the state of the conversation
@@ -76,27 +140,38 @@ class Assistant:
         :return: a dictionary with the result of the invoke method
         :rtype: dict
         """
-
-        while True:
-            configuration = config.get("configurable", {})
-            state = {**state}
-            result = self.runnable.invoke(state)
-            
-            if not result.tool_calls and (
-                not result.content
-                or isinstance(result.content, list)
-                and not result.content[0].get("text")
-            ):
-                messages = state["messages"] + [("user", "Respond with a real output.")]
-                state = {**state, "messages": messages}
-            else:
-                break
+        state = {**state, "summary": summary_section(state.get("summary"))}
+        with start_span("agent.assistant", thread_id=config.get("configurable", {}).get("thread_id")) as span:
+            retries = 0
+            while True:
+                configuration = config.get("configurable", {})
+                state = {**state}
+                result = await self.invoke(state, config)
+                
+                if not result.tool_calls and (
+                    not result.content
+                    or isinstance(result.content, list)
+                    and not result.content[0].get("text")
+                ):
+                    ASSISTANT_RETRIES.inc()
+                    retries += 1
+                    messages = state["messages"] + [("user", "Respond with a real output.")]
+                    state = {**state, "messages": messages}
+                else:
+                    break
+            set_attributes(span, **{"agent.retries": retries})
         return {"messages": result}
 
 
 
+DEFAULT_TOOLS = [
+    lookup_informations,
+]
+
+
 async def build_graph(
-    agent_prompt: str
+    agent_prompt: str,
+    tools: list = None,
 ):
     """
     Build the state graph for the agent.
@@ -104,10 +179,13 @@ async def build_graph(
     This function builds the state graph for the agent. The state graph is a
     directed graph where each node is a state and each edge is a conditional
     transition between states. The state graph is built using the agent prompt
-    and the tools provided.
+    and the tools provided. Every turn first goes through the history policy,
+    which keeps the conversation sent to the LLM bounded.
 
     :param agent_prompt: the prompt of the agent
     :type agent_prompt: str
+    :param tools: the tools bound to the agent, defaults to DEFAULT_TOOLS
+    :type tools: list
     :return: the state graph for the agent
     :rtype: StateGraph
     """
@@ -115,16 +193,14 @@ async def build_graph(
     [
         (
             "system",
-                agent_prompt
+                agent_prompt + "{summary}"
         ),
         ("placeholder", "{messages}"),
     ]
     )
 
-    tools = [
-        lookup_informations,
-    ]
-
+    if tools is None:
+        tools = DEFAULT_TOOLS
     
     agent_runnable = agent_prompt | llm.bind_tools(tools)
 
@@ -132,9 +208,13 @@ async def build_graph(
     builder = StateGraph(State)
 
 
-    builder.add_node("assistant", Assistant(agent_runnable))
+    executor = inference_executor if is_local_model(llm) else None
+
+    builder.add_node("history", HistoryPolicy(llm, executor=executor))
+    builder.add_node("assistant", Assistant(agent_runnable, executor=executor))
     builder.add_node("tools", create_tool_node_with_fallback(tools))
-    builder.add_edge(START, "assistant")
+    builder.add_edge(START, "history")
+    builder.add_edge("history", "assistant")
     builder.add_conditional_edges(
         "assistant",
         tools_condition,
@@ -147,30 +227,205 @@ async def build_graph(
     return noopy_agent_graph
 
 
-async def get_chat_response(graph, question:str, thread_id:str, vector_store: Chroma_VectorStore):
+def set_usage_attributes(span, usage: dict) -> None:
+    """
+    Record the retrieved-context usage of a turn on its span.
+
+    :param span: the span of the turn
+    :type span: Span
+    :param usage: the usage returned by context_usage
+    :type usage: dict
+    """
+    set_attributes(
+        span,
+        **{
+            "rag.context_tokens": usage["context_tokens"],
+            "rag.context_chunks": usage["context_chunks"],
+            "rag.context_truncated": usage["context_truncated"],
+        }
+    )
+
+
+def context_usage(artifacts: List[dict]) -> dict:
+    """
+    Sum the retrieved-context usage reported by the tool calls of one turn.
+
+    :param artifacts: the artifacts of the turn's tool messages
+    :type artifacts: List[dict]
+    :return: the total context tokens and chunks, whether any context was truncated,
+        and the distinct sources
+    :rtype: dict
+    """
+    usage = {"context_tokens": 0, "context_chunks": 0, "context_truncated": False, "sources": []}
+    for artifact in artifacts:
+        if not isinstance(artifact, dict):
+            continue
+        usage["context_tokens"] += artifact.get("context_tokens", 0)
+        usage["context_chunks"] += artifact.get("context_chunks", 0)
+        usage["context_truncated"] = usage["context_truncated"] or artifact.get("context_truncated", False)
+        usage["sources"] += [source for source in artifact.get("sources", []) if source not in usage["sources"]]
+    return usage
+
+
+async def has_history(graph, thread_id: str) -> bool:
+    """
+    Check whether a thread already has messages in its checkpointed state.
+
+    :param graph: the compiled agent graph
+    :type graph: CompiledStateGraph
+    :param thread_id: the id of the thread
+    :type thread_id: str
+    :return: True if the thread has a history
+    :rtype: bool
+    """
+    state = await graph.aget_state({"configurable": {"thread_id": thread_id}})
+    return bool(state.values.get("messages"))
+
+
+async def record_exchange(graph, thread_id: str, question: str, answer: str) -> None:
+    """
+    Add a question and an answer produced outside the graph, e.g. served from the
+    answer cache, to the history of a thread, as if the assistant had answered it.
+
+    :param graph: the compiled agent graph
+    :type graph: CompiledStateGraph
+    :param thread_id: the id of the thread
+    :type thread_id: str
+    :param question: the question of the user
+    :type question: str
+    :param answer: the answer given to the user
+    :type answer: str
+    """
+    await graph.aupdate_state(
+        {"configurable": {"thread_id": thread_id}},
+        {"messages": [HumanMessage(content=question), AIMessage(content=answer)]},
+        as_node="assistant",
+    )
+
+
+async def get_chat_response(graph, question:str, thread_id:str, vector_store: Chroma_VectorStore, retrieval: Optional[dict] = None):
     """
     This function takes in a graph, a question, a thread id, and a Chroma VectorStore.
     It then uses the graph to generate a response to the question.
-    It will return the response as a string.
-    If an error occurs while generating the response, it will log the error and return an empty string.
+    The optional retrieval options (e.g. dense_weight, lexical_weight) are handed to
+    the lookup tool through the config.
+    It will return the response as a string, with the retrieved-context usage of the
+    turn (see context_usage).
+    If an error occurs while generating the response, it will log the error and return None.
     """
     try:
         config = {
             "configurable": {
                 "thread_id": thread_id,
                 "vector_store": vector_store,
+                "retrieval": retrieval or {},
             }
         }
         
         response = ""
+        messages = []
 
-        async for chunk in graph.astream(
-            {"messages": ("user", question)}, config, stream_mode="values"
-        ):
-            if chunk["messages"]:
-                response = chunk["messages"][-1].content
-                
+        with start_span("agent.run", thread_id=thread_id, **{"agent.streaming": False}) as span:
+            async for chunk in graph.astream(
+                {"messages": ("user", question)}, config, stream_mode="values"
+            ):
+                if chunk["messages"]:
+                    messages = chunk["messages"]
+                    response = messages[-1].content
+
+            # the tool calls of this turn are the ones after the last question
+            turn = []
+            for message in reversed(messages):
+                if isinstance(message, HumanMessage):
+                    break
+                turn.append(message)
+            artifacts = [message.artifact for message in turn if isinstance(message, ToolMessage)]
 
-        return response
+            usage = context_usage(artifacts)
+            set_usage_attributes(span, usage)
+            return response, usage
+    except InferenceOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Error getting chat response: {e}")
+        return None, {}
+
+
+async def stream_chat_response(graph, question:str, thread_id:str, vector_store: Chroma_VectorStore, retrieval: Optional[dict] = None):
+    """
+    This function takes in a graph, a question, a thread id, a Chroma VectorStore and
+    optional retrieval options. It runs the graph like get_chat_response, but yields events as they happen instead
+    of waiting for the final answer:
+
+    - ("token", {"content"}) for every piece of text generated by the assistant
+    - ("tool_start", {"id", "name", "args"}) when the assistant calls a tool
+    - ("tool_end", {"id", "name", "content"}) when a tool returns
+    - ("done", {"response", "latency_ms", "ttft_ms", "tokens", "context"}) once the graph
+      finishes, "context" being the retrieved-context usage of the turn
+
+    If an error occurs, it will log the error and yield ("error", {"detail"}) instead of "done".
+    """
+    config = {
+        "configurable": {
+            "thread_id": thread_id,
+            "vector_store": vector_store,
+            "retrieval": retrieval or {},
+        }
+    }
+
+    start_time = time.perf_counter()
+    ttft_ms = None
+    tokens = 0
+    artifacts = []
+
+    try:
+        with start_span("agent.run", thread_id=thread_id, **{"agent.streaming": True}) as span:
+            async for mode, chunk in graph.astream(
+                {"messages": ("user", question)}, config, stream_mode=["messages", "updates"]
+            ):
+                if mode == "messages":
+                    message, metadata = chunk
+                    if isinstance(message, ToolMessage):
+                        artifacts.append(message.artifact)
+                        yield "tool_end", {
+                            "id": message.tool_call_id,
+                            "name": message.name,
+                            "content": message.content,
+                        }
+                    elif metadata.get("langgraph_node") == "assistant" and isinstance(message.content, str) and message.content:
+                        if ttft_ms is None:
+                            ttft_ms = (time.perf_counter() - start_time) * 1000
+                            CHAT_TTFT_SECONDS.observe(ttft_ms / 1000)
+                        tokens += 1
+                        yield "token", {"content": message.content}
+
+                elif mode == "updates":
+                    for node, update in chunk.items():
+                        if node != "assistant" or not update:
+                            continue
+                        for tool_call in getattr(update["messages"], "tool_calls", None) or []:
+                            yield "tool_start", {
+                                "id": tool_call["id"],
+                                "name": tool_call["name"],
+                                "args": tool_call["args"],
+                            }
+
+            state = await graph.aget_state(config)
+            messages = state.values.get("messages", [])
+            response = messages[-1].content if messages else ""
+
+            usage = context_usage(artifacts)
+            set_usage_attributes(span, usage)
+            set_attributes(span, **{"llm.streamed_tokens": tokens})
+            yield "done", {
+                "response": response,
+                "latency_ms": (time.perf_counter() - start_time) * 1000,
+                "ttft_ms": ttft_ms,
+                "tokens": tokens,
+                "context": usage,
+            }
+    except InferenceOverloaded as e:
+        yield "error", {"detail": str(e), "status_code": e.status_code, "retry_after": e.retry_after}
+    except Exception as e:
+        logger.error(f"Error streaming chat response: {e}")
+        yield "error", {"detail": "An internal error occurred while processing the request."}
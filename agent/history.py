@@ -0,0 +1,215 @@
+from typing import Callable, List, Optional
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+from agent.state import State
+from utils import logger, config
+from utils.context import load_token_counter, split_sentences
+from utils.inference import InferenceExecutor
+from utils.tracing import start_span
+
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Update the current summary with the new exchanges. Keep the facts, names, numbers and "
+    "open questions the assistant may need later, drop greetings and repetition, and write "
+    "at most {max_words} words of plain prose."
+)
+
+TOOL_OUTPUT_STUB = "[Output of {name} omitted from the history.]"
+
+
+def split_turns(messages: List[AnyMessage]) -> List[List[AnyMessage]]:
+    """
+    Split a conversation into turns, each starting with a message of the user.
+
+    :param messages: the messages of the conversation
+    :type messages: List[AnyMessage]
+    :return: the turns, oldest first
+    :rtype: List[List[AnyMessage]]
+    """
+    turns: List[List[AnyMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def summary_section(summary: Optional[str]) -> str:
+    """
+    Format the running summary for the system prompt of the assistant.
+
+    :param summary: the running summary, if any
+    :type summary: str
+    :return: the text appended to the system prompt, empty without a summary
+    :rtype: str
+    """
+    if not summary:
+        return ""
+    return f"\n\nSummary of the earlier conversation:\n{summary}"
+
+
+class HistoryPolicy:
+    """
+    Graph node bounding the conversation history sent to the LLM.
+
+    It runs at the start of every turn and rewrites the checkpointed state, so both
+    the prompt and the memory of a thread stay bounded however long it gets:
+
+    - the last `max_turns` turns are kept verbatim
+    - tool outputs of all but the last `tool_turns` finished turns are replaced by
+      a short stub; the tool calls themselves are kept so the history stays valid
+    - older turns are removed and, if `summarize` is set, folded into a running
+      summary of at most `summary_max_tokens` tokens, appended to the system prompt
+
+    Turns are folded `fold_batch` at a time, so the summary is rewritten by the LLM
+    once every `fold_batch` turns rather than on every turn.
+    """
+
+    def __init__(
+        self,
+        model: Runnable,
+        executor: Optional[InferenceExecutor] = None,
+        max_turns: int = config.HISTORY_MAX_TURNS,
+        tool_turns: int = config.HISTORY_TOOL_TURNS,
+        summarize: bool = config.HISTORY_SUMMARIZE,
+        fold_batch: int = config.HISTORY_FOLD_BATCH,
+        summary_max_tokens: int = config.HISTORY_SUMMARY_MAX_TOKENS,
+        count_tokens: Optional[Callable[[str], int]] = None,
+    ):
+        """
+        Initialize a HistoryPolicy object.
+
+        :param model: the chat model writing the summary
+        :type model: Runnable
+        :param executor: the inference executor to run a local model on, if any
+        :type executor: InferenceExecutor
+        :param max_turns: the number of turns kept verbatim, the current one included
+        :type max_turns: int
+        :param tool_turns: the number of previous turns whose tool outputs are kept
+        :type tool_turns: int
+        :param summarize: fold removed turns into a summary instead of dropping them
+        :type summarize: bool
+        :param fold_batch: the number of turns removed at once
+        :type fold_batch: int
+        :param summary_max_tokens: the maximum number of tokens of the summary
+        :type summary_max_tokens: int
+        :param count_tokens: counts the tokens of a text, defaults to the tokenizer
+            of CONTEXT_TOKENIZER or CHAT_MODEL
+        :type count_tokens: Callable[[str], int]
+        """
+        self.model = model
+        self.executor = executor
+        self.max_turns = max(1, max_turns)
+        self.tool_turns = max(0, tool_turns)
+        self.summarize = summarize
+        self.fold_batch = max(1, fold_batch)
+        self.summary_max_tokens = summary_max_tokens
+        self._count_tokens = count_tokens
+
+    def count_tokens(self, text: str) -> int:
+        if self._count_tokens is None:
+            self._count_tokens = load_token_counter(config.CONTEXT_TOKENIZER or config.CHAT_MODEL)
+        return self._count_tokens(text)
+
+    @staticmethod
+    def transcript(turns: List[List[AnyMessage]]) -> str:
+        """
+        Render turns as plain text for the summarizer, without tool calls and outputs.
+
+        :param turns: the turns to render
+        :type turns: List[List[AnyMessage]]
+        :return: one "User:" or "Assistant:" line per message with text
+        :rtype: str
+        """
+        lines = []
+        for message in (message for turn in turns for message in turn):
+            if isinstance(message, (HumanMessage, AIMessage)) and isinstance(message.content, str) and message.content:
+                role = "User" if isinstance(message, HumanMessage) else "Assistant"
+                lines.append(f"{role}: {message.content}")
+        return "\n".join(lines)
+
+    def _bound(self, summary: str) -> str:
+        """
+        Cut a summary at the last sentence within summary_max_tokens.
+        """
+        if self.count_tokens(summary) <= self.summary_max_tokens:
+            return summary
+        kept: List[str] = []
+        for sentence in split_sentences(summary):
+            if self.count_tokens(" ".join(kept + [sentence])) > self.summary_max_tokens:
+                break
+            kept.append(sentence)
+        return " ".join(kept)
+
+    async def fold(self, summary: str, turns: List[List[AnyMessage]]) -> str:
+        """
+        Fold turns into the running summary with the LLM.
+
+        :param summary: the current summary
+        :type summary: str
+        :param turns: the turns to fold in
+        :type turns: List[List[AnyMessage]]
+        :return: the updated summary, within summary_max_tokens
+        :rtype: str
+        """
+        messages = [
+            SystemMessage(content=SUMMARY_PROMPT.format(max_words=int(self.summary_max_tokens * 0.75))),
+            HumanMessage(content=f"Current summary:\n{summary or '(none)'}\n\nNew exchanges:\n{self.transcript(turns)}"),
+        ]
+        if self.executor is not None:
+            result = await self.executor.run(self.model.invoke, messages)
+        else:
+            result = await self.model.ainvoke(messages)
+        content = result.content if isinstance(result.content, str) else ""
+        return self._bound(content.strip()) or summary
+
+    @staticmethod
+    def stub(message: ToolMessage) -> ToolMessage:
+        """
+        Replace the content of a tool message by a stub, keeping its id so the
+        checkpointed message is overwritten.
+        """
+        return ToolMessage(
+            content=TOOL_OUTPUT_STUB.format(name=message.name or "the tool"),
+            tool_call_id=message.tool_call_id,
+            name=message.name,
+            id=message.id,
+        )
+
+    async def __call__(self, state: State, config: RunnableConfig) -> dict:
+        """
+        Apply the policy to the state of the thread.
+
+        :param state: the state of the conversation, the new question included
+        :type state: State
+        :param config: the configuration of the run
+        :type config: RunnableConfig
+        :return: the removed and stubbed messages and the updated summary
+        :rtype: dict
+        """
+        turns = split_turns(state["messages"])
+        summary = state.get("summary") or ""
+        updates: List[AnyMessage] = []
+
+        if len(turns) - self.max_turns >= self.fold_batch:
+            folded, turns = turns[:-self.max_turns], turns[-self.max_turns:]
+            if self.summarize:
+                try:
+                    with start_span("agent.history_summary", **{"agent.folded_turns": len(folded)}):
+                        summary = await self.fold(summary, folded)
+                except Exception as e:
+                    # the turns are dropped anyway, the history must not grow
+                    logger.error(f"Error summarizing the conversation history: {e}")
+            updates += [RemoveMessage(id=message.id) for turn in folded for message in turn]
+
+        # the last turn is the current question; keep the outputs of the tool_turns before it
+        previous = turns[:-1]
+        for turn in previous[:len(previous) - self.tool_turns]:
+            for message in turn:
+                if isinstance(message, ToolMessage) and message.content != self.stub(message).content:
+                    updates.append(self.stub(message))
+
+        if not updates and summary == (state.get("summary") or ""):
+            return {}
+        return {"messages": updates, "summary": summary}
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from agent.graph import build_graph, DEFAULT_TOOLS
+from prompt import load_agent_prompt, AGENT_PROMPT_PATH
+from utils import logger, config
+from utils.metrics import GRAPH_BUILD_SECONDS, GRAPH_BUILDS, GRAPH_CACHED
+
+
+GraphKey = Tuple[str, Tuple[str, ...]]
+
+
+class GraphRegistry:
+    """
+    Builds and compiles each agent graph once and hands out the shared instance.
+
+    Graphs are keyed by the prompt version (a hash of the prompt text) and the
+    names of the bound tools. The prompt file is re-checked at most every
+    `reload_interval` seconds; when its contents change the graphs built from
+    the old prompt are dropped and rebuilt on the next request, so prompt edits
+    are picked up without a restart. Requests already running keep the graph
+    they started with.
+    """
+
+    def __init__(
+        self,
+        prompt_path: Path = AGENT_PROMPT_PATH,
+        reload_interval: float = config.PROMPT_RELOAD_INTERVAL,
+    ) -> None:
+        """
+        Initialize a GraphRegistry object.
+
+        :param prompt_path: the path of the agent prompt file
+        :type prompt_path: Path
+        :param reload_interval: the minimum number of seconds between prompt file checks
+        :type reload_interval: float
+        """
+        self.prompt_path = prompt_path
+        self.reload_interval = reload_interval
+        self._graphs: Dict[GraphKey, object] = {}
+        self._prompt: Optional[str] = None
+        self._prompt_version: Optional[str] = None
+        self._prompt_mtime: Optional[float] = None
+        self._last_check = 0.0
+        self._build_count = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def prompt_version(self) -> Optional[str]:
+        return self._prompt_version
+
+    def _load_prompt(self) -> None:
+        """
+        Read the prompt file and update the prompt version.
+
+        Graphs compiled from a previous version of the prompt are evicted.
+        """
+        prompt = load_agent_prompt(self.prompt_path)
+        version = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+        if version != self._prompt_version:
+            if self._prompt_version is not None:
+                logger.info(f"Agent prompt changed: {self._prompt_version} -> {version}")
+            self._graphs = {
+                key: graph for key, graph in self._graphs.items() if key[0] == version
+            }
+            GRAPH_CACHED.set(len(self._graphs))
+
+        self._prompt = prompt
+        self._prompt_version = version
+
+    def _check_prompt(self) -> None:
+        """
+        Reload the prompt if its file has been modified since the last check.
+
+        The check is a single stat call and is throttled by reload_interval.
+        """
+        now = time.monotonic()
+        if self._prompt_version is not None and now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+
+        mtime = os.stat(self.prompt_path).st_mtime
+        if self._prompt_version is None or mtime != self._prompt_mtime:
+            self._prompt_mtime = mtime
+            self._load_prompt()
+
+    async def get_graph(self, tools: list = None):
+        """
+        Get the compiled agent graph for the current prompt and the given tools.
+
+        :param tools: the tools bound to the agent, defaults to DEFAULT_TOOLS
+        :type tools: list
+        :return: the shared compiled state graph
+        :rtype: CompiledStateGraph
+        """
+        if tools is None:
+            tools = DEFAULT_TOOLS
+
+        self._check_prompt()
+        key = (self._prompt_version, tuple(tool.name for tool in tools))
+
+        graph = self._graphs.get(key)
+        if graph is not None:
+            return graph
+
+        async with self._lock:
+            graph = self._graphs.get(key)
+            if graph is None:
+                graph = await self._build(key, tools)
+        return graph
+
+    async def _build(self, key: GraphKey, tools: list):
+        """
+        Build and compile a graph and store it under the given key.
+        """
+        reason = "reload" if self._build_count else "startup"
+        self._build_count += 1
+        start_time = time.perf_counter()
+
+        graph = await build_graph(agent_prompt=self._prompt, tools=tools)
+
+        build_seconds = time.perf_counter() - start_time
+        GRAPH_BUILD_SECONDS.observe(build_seconds)
+        GRAPH_BUILDS.labels(reason=reason).inc()
+
+        if key[0] == self._prompt_version:
+            self._graphs[key] = graph
+            GRAPH_CACHED.set(len(self._graphs))
+
+        logger.info(
+            f"Agent graph built for prompt {key[0]} with tools {list(key[1])} "
+            f"in {build_seconds * 1000:.1f} ms"
+        )
+        return graph
+
+    def clear(self) -> None:
+        """
+        Drop all compiled graphs and force the prompt to be re-read.
+        """
+        self._graphs = {}
+        self._prompt_version = None
+        self._prompt_mtime = None
+        GRAPH_CACHED.set(0)
+
+
+graph_registry = GraphRegistry()
+
+
+async def get_agent_graph():
+    """
+    FastAPI dependency returning the shared compiled agent graph.
+
+    :return: the compiled state graph for the current prompt
+    :rtype: CompiledStateGraph
+    """
+    return await graph_registry.get_graph()
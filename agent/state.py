@@ -8,4 +8,5 @@ from langchain_core.messages import AnyMessage
 
 class State(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
+    summary: str
     
@@ -1,36 +1,75 @@
+import asyncio
+from typing import Tuple
 from langchain_core.tools import tool
 from langchain_core.runnables import RunnableConfig
-from utils import Chroma_VectorStore
+from utils import Chroma_VectorStore, get_chroma_vector_store
+from utils.config import config as settings
+from utils.reranker import get_reranker
+from utils.context import context_assembler
+from utils.metrics import RERANK_SECONDS, RETRIEVAL_SECONDS, TOOL_SECONDS
+from utils.tracing import set_attributes, start_span
 
 
-@tool
-async def lookup_informations(query: str, config:RunnableConfig) -> str:
+@tool(response_format="content_and_artifact")
+async def lookup_informations(query: str, config:RunnableConfig) -> Tuple[str, dict]:
     """
     This tool takes in a query and a configuration that contains a reference to a Chroma VectorStore.
     It uses the vector store to query the documents and then returns the relevant information.
     
-    If the vector store is not provided, it will return "No information available for the query."
+    If the vector store is not provided, the shared process-wide vector store is used.
+    Retrieval options found in the configuration (e.g. dense_weight, lexical_weight)
+    are passed on to the retriever.
     
     If the query does not return any results, it will return "No relevant information found for the query."
     
-    Otherwise, it will return the page content of the relevant documents, separated by two newline characters.
+    Otherwise, it will return the most relevant passages, separated by two newline characters and kept within a token budget.
     """
-    vector_store: Chroma_VectorStore = config.get("configurable").get("vector_store")
+    thread_id = config.get("configurable", {}).get("thread_id")
+    with TOOL_SECONDS.time(), start_span("tool.lookup_informations", thread_id=thread_id) as span:
+        text, usage = await _lookup(query, config)
+        set_attributes(
+            span,
+            **{
+                "rag.context_chunks": usage.get("context_chunks", 0),
+                "rag.context_tokens": usage.get("context_tokens", 0),
+            }
+        )
+        return text, usage
+
+
+async def _lookup(query: str, config: RunnableConfig) -> Tuple[str, dict]:
+    configuration = config.get("configurable", {})
+    vector_store: Chroma_VectorStore = configuration.get("vector_store") or get_chroma_vector_store()
+    retrieval_options = dict(configuration.get("retrieval") or {})
     
+    # With reranking, over-fetch candidates and let the cross-encoder keep the best k
+    rerank = retrieval_options.pop("rerank", settings.RERANK_ENABLED)
+    k = retrieval_options.get("k", settings.RETRIEVAL_K)
+    if rerank:
+        retrieval_options["k"] = max(settings.RERANK_CANDIDATES, k)
     
-    retriever = await vector_store.query_vector_store() if vector_store else None
+    
+    retriever = await vector_store.query_vector_store(**retrieval_options) if vector_store else None
     
     if not retriever:
-        return "No information available for the query."
+        return "No information available for the query.", {}
 
 
-    results = await retriever.ainvoke(query)
+    with RETRIEVAL_SECONDS.time(), start_span("chroma.query", **{"rag.k": retrieval_options.get("k", k)}) as span:
+        results = await retriever.ainvoke(query)
+        set_attributes(span, **{"rag.retrieved_chunks": len(results)})
+    if rerank:
+        with RERANK_SECONDS.time(), start_span("rerank", **{"rag.candidates": len(results), "rag.k": k}):
+            results = await get_reranker().arerank(query, results, k)
     
     
     if not results:
-        return "No relevant information found for the query."
+        return "No relevant information found for the query.", {}
 
     
-
-    return "\n\n".join([result.page_content for result in results])
+    # Deduplicated, ordered by relevance and cut to CONTEXT_TOKEN_BUDGET; the usage
+    # goes back to the caller as the artifact of the tool message
+    loop = asyncio.get_running_loop()
+    context = await loop.run_in_executor(None, context_assembler.assemble, results)
+    return context.text, context.usage()
 
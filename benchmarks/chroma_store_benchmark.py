@@ -0,0 +1,77 @@
+"""
+Query latency of a per-request Chroma_VectorStore versus the shared instance.
+
+Run from the repository root:
+
+    python -m benchmarks.chroma_store_benchmark --iterations 200
+
+"before" builds a new Chroma_VectorStore for every query, the way the routes used
+to; "after" reuses the process-wide instance from get_chroma_vector_store().
+
+Chroma caches one System per persistent path, so a new client would otherwise reuse
+the collection already open. Each "before" store is closed after its query, which
+drops that System, so the next one really reopens the collection; the closing is
+not timed. Both cases are warmed up first, so the embedding model is loaded.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Callable, List
+from utils import Chroma_VectorStore, get_chroma_vector_store, close_chroma_vector_store
+
+
+QUERIES = [
+    "What is the refund policy?",
+    "How do I reset my password?",
+    "Which file formats can be uploaded?",
+    "What is the maximum upload size?",
+]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run(get_store: Callable[[], Chroma_VectorStore], iterations: int, per_request: bool) -> List[float]:
+    latencies = []
+    for i in range(iterations):
+        start_time = time.perf_counter()
+        vector_store = get_store()
+        retriever = await vector_store.query_vector_store()
+        await retriever.ainvoke(QUERIES[i % len(QUERIES)])
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        if per_request:
+            # releases the client's System and the store's lexical index connection
+            vector_store.close()
+    return latencies
+
+
+def report(name: str, latencies: List[float]) -> None:
+    print(
+        f"{name:<8} p50={percentile(latencies, 50):8.2f} ms  "
+        f"p99={percentile(latencies, 99):8.2f} ms  "
+        f"mean={statistics.mean(latencies):8.2f} ms"
+    )
+
+
+async def main(iterations: int, warmup: int) -> None:
+    await run(Chroma_VectorStore, warmup, per_request=True)
+    report("before", await run(Chroma_VectorStore, iterations, per_request=True))
+
+    shared = get_chroma_vector_store()
+    await shared.warm_up()
+    await run(get_chroma_vector_store, warmup, per_request=False)
+    report("after", await run(get_chroma_vector_store, iterations, per_request=False))
+
+    close_chroma_vector_store()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.warmup))
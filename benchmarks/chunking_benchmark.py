@@ -0,0 +1,97 @@
+"""
+Chunking speed and retrieval recall of each CHUNKING_STRATEGY.
+
+Run from the repository root:
+
+    python -m benchmarks.chunking_benchmark --k 3
+
+The fixture corpus in benchmarks/fixtures/chunking holds a few markdown documents
+and a list of questions, each with the sentence of the corpus that answers it.
+For every strategy the corpus is split, then every chunk and question is embedded:
+
+- chunks/s: chunks produced per second of splitting, including the sentence
+  embeddings the semantic strategy needs to find its breakpoints
+- recall@k: share of questions whose answering sentence is inside one of the k
+  chunks closest to the question
+
+Embeddings bypass the embedding cache, so repeated runs time the same work.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+from utils.config import config
+from utils.chunking import CHUNKING_STRATEGIES, MarkdownSplitter, create_text_splitter, recursive_splitter
+from utils.embedding_cache import CachedEmbeddings
+from utils.huggingface_wrapper import embedding_model
+
+
+FIXTURES = Path(__file__).parent / "fixtures" / "chunking"
+
+
+def normalize_whitespace(text: str) -> str:
+    return " ".join(text.split())
+
+
+def load_corpus() -> List[str]:
+    return [path.read_text(encoding="utf-8") for path in sorted(FIXTURES.glob("*.md"))]
+
+
+def load_queries() -> List[Dict[str, str]]:
+    return json.loads((FIXTURES / "queries.json").read_text(encoding="utf-8"))
+
+
+def embed(embeddings, texts: List[str]) -> np.ndarray:
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall_at_k(embeddings, chunks: List[str], queries: List[Dict[str, str]], k: int) -> float:
+    chunk_vectors = embed(embeddings, chunks)
+    query_vectors = embed(embeddings, [query["question"] for query in queries])
+    normalized_chunks = [normalize_whitespace(chunk) for chunk in chunks]
+
+    hits = 0
+    for query, scores in zip(queries, query_vectors @ chunk_vectors.T):
+        evidence = normalize_whitespace(query["evidence"])
+        top_k = np.argsort(-scores)[:k]
+        if any(evidence in normalized_chunks[i] for i in top_k):
+            hits += 1
+    return hits / len(queries)
+
+
+def main(k: int, chunk_size: int, chunk_overlap: int) -> None:
+    embeddings = embedding_model.embeddings if isinstance(embedding_model, CachedEmbeddings) else embedding_model
+    corpus = load_corpus()
+    queries = load_queries()
+
+    for strategy in CHUNKING_STRATEGIES:
+        if strategy == "recursive":
+            splitter = recursive_splitter(chunk_size, chunk_overlap)
+        elif strategy == "markdown":
+            splitter = MarkdownSplitter(recursive_splitter(chunk_size, chunk_overlap))
+        else:
+            splitter = create_text_splitter(embeddings, strategy)
+
+        start_time = time.perf_counter()
+        chunks = [chunk for text in corpus for chunk in splitter.split_text(text)]
+        elapsed = time.perf_counter() - start_time
+
+        recall = recall_at_k(embeddings, chunks, queries, k)
+        print(
+            f"{strategy:<10} chunks={len(chunks):5d}  "
+            f"chunks/s={len(chunks) / elapsed:10.1f}  "
+            f"avg_chars={sum(map(len, chunks)) / len(chunks):7.1f}  "
+            f"recall@{k}={recall:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=config.CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=config.CHUNK_OVERLAP)
+    args = parser.parse_args()
+    main(args.k, args.chunk_size, args.chunk_overlap)
@@ -0,0 +1,57 @@
+"""
+Throughput of the local LLM with and without dynamic request batching.
+
+Run from the repository root:
+
+    python -m benchmarks.llm_batching_benchmark --batch-size 8 --requests 64
+
+The model is loaded once with batching enabled. The "unbatched" rows force a batch
+size of 1, so every generation runs on its own; the "batched" rows let the micro
+batcher merge up to --batch-size concurrent generations.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.huggingface_wrapper import load_llm_model
+
+
+PROMPTS = [
+    "Summarize the purpose of a vector database in one sentence.",
+    "What is retrieval-augmented generation?",
+    "Explain what an embedding is to a new engineer.",
+    "Why would a service batch requests to a language model?",
+]
+
+
+def run(chat_model, concurrency: int, requests: int) -> float:
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: chat_model.invoke(PROMPTS[i % len(PROMPTS)]), range(requests)))
+    return requests / (time.perf_counter() - start_time)
+
+
+def main(batch_size: int, requests: int, max_new_tokens: int) -> None:
+    chat_model = load_llm_model(batch_size=batch_size)
+    pipeline = chat_model.llm
+    pipeline.max_new_tokens_cap = max_new_tokens
+
+    print(f"{'mode':<10} {'concurrency':>11} {'req/s':>8}")
+    for mode, size in (("unbatched", 1), ("batched", batch_size)):
+        pipeline.shutdown_batcher()
+        pipeline.batch_size = size
+        run(chat_model, 1, 1)
+
+        for concurrency in (1, 8, 32):
+            throughput = run(chat_model, concurrency, max(requests, concurrency))
+            print(f"{mode:<10} {concurrency:>11} {throughput:>8.2f}")
+
+    pipeline.shutdown_batcher()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+    main(args.batch_size, args.requests, args.max_new_tokens)
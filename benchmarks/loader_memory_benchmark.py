@@ -0,0 +1,58 @@
+"""
+Peak Python memory of loading documents whole versus streaming them page by page.
+
+Run from the repository root with one or more large files, ideally multi-page PDFs:
+
+    python -m benchmarks.loader_memory_benchmark manual.pdf report.pdf
+
+For each strategy the tracemalloc peak is reported:
+
+- load: Loader.load(), every page concatenated into one string
+- load_documents: Loader.load_documents(), every page kept as a Document
+- iter_documents: Loader.iter_documents(), one page alive at a time
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from typing import List
+from utils.loaders import Loader
+
+
+async def consume_load(file_paths: List[str]) -> int:
+    return len(await Loader(file_paths=file_paths).load())
+
+
+async def consume_load_documents(file_paths: List[str]) -> int:
+    documents = await Loader(file_paths=file_paths).load_documents()
+    return sum(len(document.page_content) for document in documents)
+
+
+async def consume_iter_documents(file_paths: List[str]) -> int:
+    characters = 0
+    async for document in Loader(file_paths=file_paths).iter_documents():
+        characters += len(document.page_content)
+    return characters
+
+
+async def main(file_paths: List[str]) -> None:
+    print(f"{'strategy':<16} {'peak MiB':>10} {'seconds':>9} {'characters':>12}")
+    for name, consume in (
+        ("load", consume_load),
+        ("load_documents", consume_load_documents),
+        ("iter_documents", consume_iter_documents),
+    ):
+        tracemalloc.start()
+        start_time = time.perf_counter()
+        characters = await consume(file_paths)
+        elapsed = time.perf_counter() - start_time
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:<16} {peak / 2**20:>10.1f} {elapsed:>9.2f} {characters:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file_paths", nargs="+")
+    args = parser.parse_args()
+    asyncio.run(main(args.file_paths))
@@ -0,0 +1,88 @@
+"""
+Latency and recall of dense retrieval with and without cross-encoder reranking.
+
+Run from the repository root:
+
+    python -m benchmarks.rerank_benchmark --k 3 --candidates 20
+
+The fixture corpus of the chunking benchmark is split with the recursive splitter
+and embedded once. For every question:
+
+- plain: the k chunks closest to the question
+- rerank: the `candidates` closest chunks, scored by the cross-encoder, best k kept
+
+recall@k is the share of questions whose answering sentence is in the k chunks;
+latency is per question, retrieval included. Rerank latency is reported cold
+(empty score cache) and warm (every pair already cached).
+"""
+import argparse
+import statistics
+import time
+from typing import Callable, List
+import numpy as np
+from langchain_core.documents import Document
+from benchmarks.chunking_benchmark import embed, load_corpus, load_queries, normalize_whitespace
+from utils.chunking import recursive_splitter
+from utils.config import config
+from utils.embedding_cache import CachedEmbeddings
+from utils.huggingface_wrapper import embedding_model
+from utils.reranker import CrossEncoderReranker
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run(queries, retrieve: Callable[[str], List[str]]):
+    latencies, hits = [], 0
+    for query in queries:
+        start_time = time.perf_counter()
+        chunks = retrieve(query["question"])
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        evidence = normalize_whitespace(query["evidence"])
+        hits += any(evidence in normalize_whitespace(chunk) for chunk in chunks)
+    return latencies, hits / len(queries)
+
+
+def report(name: str, k: int, latencies: List[float], recall: float) -> None:
+    print(
+        f"{name:<12} p50={percentile(latencies, 50):8.2f} ms  "
+        f"p95={percentile(latencies, 95):8.2f} ms  "
+        f"mean={statistics.mean(latencies):8.2f} ms  "
+        f"recall@{k}={recall:.2f}"
+    )
+
+
+def main(k: int, candidates: int, chunk_size: int) -> None:
+    embeddings = embedding_model.embeddings if isinstance(embedding_model, CachedEmbeddings) else embedding_model
+    splitter = recursive_splitter(chunk_size, chunk_size // 8)
+    chunks = [chunk for text in load_corpus() for chunk in splitter.split_text(text)]
+    chunk_vectors = embed(embeddings, chunks)
+    queries = load_queries()
+    reranker = CrossEncoderReranker()
+
+    def nearest(question: str, n: int) -> List[str]:
+        vector = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+        scores = chunk_vectors @ (vector / np.linalg.norm(vector))
+        return [chunks[i] for i in np.argsort(-scores)[:n]]
+
+    def reranked(question: str) -> List[str]:
+        documents = [Document(page_content=chunk) for chunk in nearest(question, candidates)]
+        return [document.page_content for document in reranker.rerank(question, documents, k)]
+
+    reranker.score("warm up", ["warm up"])
+    print(f"{len(chunks)} chunks, {len(queries)} questions, {candidates} candidates for rerank")
+    report("plain", k, *run(queries, lambda question: nearest(question, k)))
+    report("rerank cold", k, *run(queries, reranked))
+    report("rerank warm", k, *run(queries, reranked))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--candidates", type=int, default=config.RERANK_CANDIDATES)
+    parser.add_argument("--chunk-size", type=int, default=config.CHUNK_SIZE)
+    args = parser.parse_args()
+    main(args.k, args.candidates, args.chunk_size)
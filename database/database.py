@@ -1,9 +1,14 @@
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import event, inspect, literal, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv, find_dotenv
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict, Union
 from utils.config import config
+from utils.logging_config import logger
+from utils.metrics import DB_POOL_CONNECTIONS
+from utils.tracing import instrument_engine
 
 
 load_dotenv(find_dotenv())
@@ -11,12 +16,132 @@ load_dotenv(find_dotenv())
 Base = declarative_base()
 
 
-engine = create_async_engine(
-    config.DATABASE_URL, 
-    echo=config.DATABASE_ECHO, 
-    future=True, 
-    pool_pre_ping=True
-)
+def is_sqlite_memory(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(url: URL) -> Dict[str, Any]:
+    """
+    Build the create_async_engine arguments configured in Settings for a database.
+
+    The pool arguments are left out for an in-memory SQLite database, which lives in
+    a single connection held by a StaticPool.
+
+    Args:
+        url (URL): The URL of the database.
+
+    Returns:
+        Dict[str, Any]: The engine arguments.
+    """
+    options: Dict[str, Any] = dict(
+        echo=config.DATABASE_ECHO,
+        pool_pre_ping=config.DATABASE_POOL_PRE_PING,
+        query_cache_size=config.DATABASE_QUERY_CACHE_SIZE,
+    )
+    if not is_sqlite_memory(url):
+        options.update(
+            pool_size=config.DATABASE_POOL_SIZE,
+            max_overflow=config.DATABASE_MAX_OVERFLOW,
+            pool_timeout=config.DATABASE_POOL_TIMEOUT,
+            pool_recycle=config.DATABASE_POOL_RECYCLE,
+        )
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Tune a new SQLite connection: WAL journal so readers do not block the writer,
+    synchronous=NORMAL (safe with WAL), memory-mapped reads and a busy timeout so
+    concurrent writers wait for the lock instead of failing.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+
+def observe_pool(engine: AsyncEngine) -> None:
+    """
+    Export the connection counts of the engine's pool as the db_pool_connections gauge.
+
+    Args:
+        engine (AsyncEngine): The engine whose pool is observed.
+    """
+    for state, read in (
+        ("size", "size"),
+        ("checked_in", "checkedin"),
+        ("checked_out", "checkedout"),
+        ("overflow", "overflow"),
+    ):
+        if hasattr(engine.pool, read):
+            # engine.pool is read on every scrape, as dispose() replaces the pool
+            DB_POOL_CONNECTIONS.labels(state=state).set_function(lambda read=read: getattr(engine.pool, read)())
+
+
+def build_engine(url: Union[str, URL] = config.DATABASE_URL, **overrides) -> AsyncEngine:
+    """
+    Create an async engine with the engine, pool and SQLite settings from Settings.
+
+    With TRACING_ENABLED, every statement is recorded as a span.
+
+    Args:
+        url (Union[str, URL]): The URL of the database.
+        **overrides: create_async_engine arguments replacing the configured ones.
+
+    Returns:
+        AsyncEngine: The engine.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == "postgresql" and url.get_driver_name() == "asyncpg":
+        url = url.update_query_dict(
+            {"prepared_statement_cache_size": str(config.DATABASE_STATEMENT_CACHE_SIZE)}
+        )
+    engine = create_async_engine(url, **{**engine_options(url), **overrides})
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    if config.TRACING_ENABLED:
+        instrument_engine(engine.sync_engine)
+    return engine
+
+
+def add_missing_columns(connection) -> None:
+    """
+    Add the model columns missing from tables created by an earlier version.
+
+    create_all only creates missing tables, so a column added to a model since is
+    added here with ALTER TABLE. The existing rows get the column's `backfill` info,
+    or else its scalar default, which also lets a NOT NULL column be added; a NOT
+    NULL column with neither is added as nullable.
+
+    Args:
+        connection (Connection): A sync connection, e.g. from AsyncConnection.run_sync.
+    """
+    inspector = inspect(connection)
+    dialect = connection.dialect
+    preparer = dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect)}"
+            backfill = column.info.get("backfill")
+            if backfill is None and column.default is not None and column.default.is_scalar:
+                backfill = column.default.arg
+            if backfill is not None:
+                ddl += f" DEFAULT {literal(backfill, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True})}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            connection.execute(text(ddl))
+            logger.info(f"Added column {table.name}.{column.name}")
+
+
+engine = build_engine()
+observe_pool(engine)
 
 
 SessionLocal = sessionmaker(
@@ -2,14 +2,30 @@ from database import Base
 from sqlalchemy import Column, Integer, String, Text, DateTime, func, Float
 from typing import Optional
 import datetime
+import enum
 import decimal
-from sqlalchemy import BigInteger, Boolean, DateTime, Double, Enum, ForeignKeyConstraint, Integer, Numeric, PrimaryKeyConstraint, String, Text, UniqueConstraint, text
+from sqlalchemy import BigInteger, Boolean, DateTime, Double, Enum, ForeignKey, ForeignKeyConstraint, Index, Integer, LargeBinary, Numeric, PrimaryKeyConstraint, String, Text, UniqueConstraint, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import JSONB
 
 
+class JobStatus(str, enum.Enum):
+    """Stages an ingestion job moves through"""
+    QUEUED = "queued"
+    PARSING = "parsing"
+    CHUNKING = "chunking"
+    EMBEDDING = "embedding"
+    INDEXED = "indexed"
+    FAILED = "failed"
+    # documents only: being deleted, see DocumentService.delete_document
+    DELETING = "deleting"
+    
+    
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        Index("ix_documents_upload_date_id", "upload_date", "id"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     filename: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -17,6 +33,24 @@ class Document(Base):
     file_path: Mapped[str] = mapped_column(String(500), nullable=False)
     upload_date: Mapped[datetime.datetime] = mapped_column(DateTime, server_default=func.now())
     file_size: Mapped[int] = mapped_column(Integer, nullable=True)
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
+    # documents uploaded before ingestion jobs existed were indexed on upload
+    status: Mapped[str] = mapped_column(
+        String(20), nullable=False, default=JobStatus.QUEUED.value, info={"backfill": JobStatus.INDEXED.value}
+    )
+    
+    
+class IngestionJob(Base):
+    """Model for tracking background document ingestion"""
+    __tablename__ = "ingestion_jobs"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    document_id: Mapped[int] = mapped_column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default=JobStatus.QUEUED.value)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    chunk_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, server_default=func.now())
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
     
     
 class ChatMessage(Base):
@@ -32,4 +66,32 @@ class ChatMessage(Base):
     
 
     
-    
\ No newline at end of file
+        
+    
+class GraphCheckpoint(Base):
+    """Model for the checkpoints of the agent graph, one row per saved state"""
+    __tablename__ = "graph_checkpoints"
+    
+    thread_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    checkpoint_ns: Mapped[str] = mapped_column(String(255), primary_key=True, default="")
+    checkpoint_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    parent_checkpoint_id: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    type: Mapped[str] = mapped_column(String(32), nullable=False)
+    checkpoint: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    checkpoint_metadata: Mapped[str] = mapped_column("metadata", Text, nullable=False)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, server_default=func.now(), index=True)
+    
+    
+class GraphCheckpointWrite(Base):
+    """Model for the pending writes of the agent graph tasks, per checkpoint"""
+    __tablename__ = "graph_checkpoint_writes"
+    
+    thread_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    checkpoint_ns: Mapped[str] = mapped_column(String(255), primary_key=True, default="")
+    checkpoint_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    task_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    idx: Mapped[int] = mapped_column(Integer, primary_key=True)
+    channel: Mapped[str] = mapped_column(String(255), nullable=False)
+    type: Mapped[str] = mapped_column(String(32), nullable=False)
+    value: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    task_path: Mapped[str] = mapped_column(String(255), nullable=False, default="")
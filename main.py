@@ -1,21 +1,79 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv, find_dotenv
 from database import Base, engine
+from database.database import add_missing_columns
 from routes.routes import router
 from fastapi.exception_handlers import RequestValidationError
 from fastapi.exceptions import HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi import Request
 from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
-from utils import logger, config
+from utils import logger, config, init_chroma_vector_store, close_chroma_vector_store
+from agent import graph_registry
+from agent.checkpointer import DatabaseCheckpointer
+from agent.graph import memory
+from utils.inference import inference_executor
+from utils.huggingface_wrapper import llm, shutdown_llm
+from utils.parsing_pool import parser_pool
+from utils.tracing import TracingMiddleware, setup_tracing, shutdown_tracing
+from service import ingestion_service, chat_service
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The lifespan handler that runs when the application starts up and shuts down.
+
+    On startup it sets up tracing when TRACING_ENABLED is on, initializes the
+    database by creating the tables and the columns they are missing, opens the
+    shared vector store and compiles the agent graph so the first request does not
+    pay for them, then starts the ingestion workers, the chat log writer and the
+    sweep of idle conversation threads. On shutdown it stops the sweep, flushes the
+    chat log, stops the ingestion workers, the parser processes, the inference
+    threads and the LLM batching thread, closes the vector store and flushes the
+    pending spans.
+    """
+
+    load_dotenv(find_dotenv())
+    if config.TRACING_ENABLED:
+        setup_tracing()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+        # create_all skips the indexes of tables that already exist
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
+
+    await init_chroma_vector_store()
+    await graph_registry.get_graph()
+    await ingestion_service.start()
+    await chat_service.start()
+    if isinstance(memory, DatabaseCheckpointer):
+        await memory.start()
+
+    yield
+
+    if isinstance(memory, DatabaseCheckpointer):
+        await memory.stop()
+    await chat_service.stop()
+    await ingestion_service.stop()
+    parser_pool.shutdown()
+    inference_executor.shutdown()
+    shutdown_llm(llm)
+    close_chroma_vector_store()
+    shutdown_tracing()
 
 
 app = FastAPI(
     title=config.APP_NAME,
     description=config.APP_DESCRIPTION,
     version=config.APP_VERSION,
+    lifespan=lifespan,
 )
 
 
@@ -29,21 +87,9 @@ app.add_middleware(
     allow_headers=config.CORS_ALLOW_HEADERS,
 )
 
+app.add_middleware(TracingMiddleware)
 
-@app.on_event("startup")
-async def on_startup():
-    """
-    The event handler that is called when the application is starting up.
-
-    Initializes the database by creating the tables in the database.
-
-    This function is called by FastAPI when the application is starting up.
-    """
 
-    load_dotenv(find_dotenv())
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        
 @app.get("/")
 async def health_check():
     """
@@ -52,6 +98,16 @@ async def health_check():
     Returns a JSON response with a message and a 200 status code.
     """
     return JSONResponse(content={"message": "API is running."}, status_code=200)
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Expose the Prometheus metrics of this process.
+
+    Returns the metrics in the Prometheus text exposition format.
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
     
     
 @app.exception_handler(Exception)
@@ -89,6 +145,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
+        headers=getattr(exc, "headers", None),
     )
 
 
@@ -1,6 +1,7 @@
-from .prompt import load_agent_prompt
+from .prompt import load_agent_prompt, AGENT_PROMPT_PATH
 
 
 __qll__ = [
     "load_agent_prompt",
-]
\ No newline at end of file
+    "AGENT_PROMPT_PATH",
+]
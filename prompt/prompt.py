@@ -1,7 +1,11 @@
+from pathlib import Path
 
 
-def load_agent_prompt()-> str:
-    with open("prompt/agent_prompt.md", "r", encoding="utf-8") as file:
+AGENT_PROMPT_PATH = Path("prompt/agent_prompt.md")
+
+
+def load_agent_prompt(path: Path = AGENT_PROMPT_PATH)-> str:
+    with open(path, "r", encoding="utf-8") as file:
         AGENT_PROMPT =  file.read()
         
-    return AGENT_PROMPT
\ No newline at end of file
+    return AGENT_PROMPT
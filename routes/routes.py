@@ -1,22 +1,37 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Header, Query, Response
+from typing import Dict, List, Optional
+from fastapi.responses import StreamingResponse
 from service import get_document_service
 from sqlalchemy.ext.asyncio import AsyncSession
-import os
-import shutil
 from pathlib import Path
 import time
+import json
+import hashlib
+from datetime import datetime
+import zipfile
+import anyio
 from database import get_db
 from schema import (
     UploadResponse, 
+    BatchUploadItem,
+    BatchUploadResponse,
     ListDocumentsResponse, 
     DocumentInfo,
     ChatRequest,    
-    ChatResponse
+    ChatResponse,
+    JobStatusResponse,
+    DeleteDocumentResponse,
+    ReindexResponse,
 )
 from service.document_service import DocumentService
 from service.chat_service import ChatService, get_chat_service
-from utils import logger, Loader, Chroma_VectorStore, get_chroma_vector_store, config
-from agent import get_chat_response, build_graph
+from service.ingestion_service import IngestionService, IngestionQueueFull, get_ingestion_service
+from database.models import Document, JobStatus
+from utils.inference import InferenceOverloaded, inference_executor
+from utils.answer_cache import AnswerCache, answer_cache
+from utils import logger, Chroma_VectorStore, get_chroma_vector_store, config
+from utils.storage import save_upload, extract_archive, UploadTooLarge, StoredFile
+from agent import get_chat_response, stream_chat_response, get_agent_graph, has_history, record_exchange
 
 
 router = APIRouter(prefix="/api/v1")
@@ -29,27 +44,33 @@ ALLOWED_EXTENSIONS = config.ALLOWED_EXTENSIONS
 
 
 
-@router.post("/upload", response_model=UploadResponse)
+@router.post("/upload", response_model=UploadResponse, status_code=202)
 async def upload_document(
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db),
     doc_service: DocumentService = Depends(get_document_service),
-    vector_store: Chroma_VectorStore = Depends(get_chroma_vector_store),    
+    ingestion: IngestionService = Depends(get_ingestion_service),
 ):
     """
     Upload a document to the server.
 
+    The file is streamed to content-addressed storage and an ingestion job is
+    queued; parsing, chunking and embedding happen in the background. Poll
+    /jobs/{job_id} for progress. If the same content was uploaded before, only a
+    new metadata row is saved, pointing at the existing file and vectors.
+
     Args:
         file (UploadFile): The document to upload.
         db (AsyncSession): The database session to use.
         doc_service (DocumentService): The document service to use.
-        vector_store (Chroma_VectorStore): The vector store to use.
+        ingestion (IngestionService): The ingestion service to queue the job on.
 
     Returns:
-        UploadResponse: The response containing the filename, file type, and file size.
+        UploadResponse: The response containing the filename, file type, file size and job id.
 
     Raises:
-        HTTPException: If the file type is not supported, or if the upload fails.
+        HTTPException: If the file type is not supported, if the file is too large, if
+            the ingestion queue is full, or if the upload fails.
     """
     try:
         file_ext = Path(file.filename).suffix.lower()
@@ -59,55 +80,490 @@ async def upload_document(
                 detail=f"File type {file_ext} not supported. Allowed: {ALLOWED_EXTENSIONS}"
             )
         
-        file_path = UPLOAD_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        try:
+            stored = await save_upload(
+                file=file,
+                upload_dir=UPLOAD_DIR,
+                extension=file_ext,
+                max_size=config.MAX_UPLOAD_SIZE,
+            )
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        
+        existing = await doc_service.find_by_hash(db, stored.sha256)
+        if existing is not None:
+            document = await doc_service.save_document_metadata(
+                db=db,
+                filename=file.filename,
+                file_type=file_ext,
+                file_path=existing.file_path,
+                file_size=stored.size,
+                content_hash=stored.sha256,
+                status=existing.status,
+            )
+            # the content may have been stored again under another extension
+            await doc_service.remove_unused_files(db, [str(stored.path)])
+            job = await ingestion.get_document_job(db, existing.id)
+            
+            return UploadResponse(
+                filename=file.filename,
+                file_type=file_ext,
+                file_size=stored.size,
+                status=document.status,
+                message=f"Identical content already uploaded as document {existing.id}; reusing its vectors.",
+                document_id=document.id,
+                job_id=job.id if job else None,
+            )
         
-        file_size = os.path.getsize(file_path)
+        if ingestion.is_full():
+            raise HTTPException(status_code=503, detail="Ingestion queue is full, try again later.")
         
         document = await doc_service.save_document_metadata(
             db=db,
             filename=file.filename,
             file_type=file_ext,
-            file_path=str(file_path),
-            file_size=file_size
+            file_path=str(stored.path),
+            file_size=stored.size,
+            content_hash=stored.sha256,
         )
         
+        job = await ingestion.create_job(db=db, document=document)
         try:
-            loader = Loader(file_paths=[str(file_path)])
-            text_content = await loader.load()
-
-            await vector_store.build_vector_store(
-                text=text_content
-            )
-        except Exception as e:
-            logger.error(f"Processing error: {str(e)}")
+            ingestion.submit(job.id)
+        except IngestionQueueFull as e:
+            job.status = document.status = JobStatus.FAILED.value
+            job.error = str(e)
+            await db.commit()
+            raise HTTPException(status_code=503, detail=str(e))
         
         return UploadResponse(
             filename=file.filename,
             file_type=file_ext,
-            file_size=file_size,
+            file_size=stored.size,
+            status=job.status,
+            message="Document accepted for processing.",
+            document_id=document.id,
+            job_id=job.id,
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+@router.post("/upload/batch", response_model=BatchUploadResponse, status_code=202)
+async def upload_documents_batch(
+    files: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_db),
+    doc_service: DocumentService = Depends(get_document_service),
+    ingestion: IngestionService = Depends(get_ingestion_service),
+):
+    """
+    Upload many documents at once, as separate files and/or zip archives.
+
+    Every file, and every member of every archive, is stored like /upload does, then
+    all the new ones are queued as a single batch: they are parsed in parallel and
+    their chunks are embedded and written to the vector store in large pooled
+    batches. Each file gets its own document and ingestion job, so progress is
+    polled per file on /jobs/{job_id}. Files whose content is already uploaded, in
+    the store or earlier in the same batch, reuse its vectors.
+
+    Args:
+        files (List[UploadFile]): The documents and zip archives to upload.
+        db (AsyncSession): The database session to use.
+        doc_service (DocumentService): The document service to use.
+        ingestion (IngestionService): The ingestion service to queue the batch on.
+
+    Returns:
+        BatchUploadResponse: The status of every file, with its document and job ids
+            when it was accepted, and the number of files accepted, deduplicated and
+            rejected.
+
+    Raises:
+        HTTPException: If more than MAX_BATCH_FILES files are sent, if the ingestion
+            queue is full, or if the upload fails.
+    """
+    if len(files) > config.MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files: {len(files)}, the maximum is {config.MAX_BATCH_FILES}",
+        )
+    if ingestion.is_full():
+        raise HTTPException(status_code=503, detail="Ingestion queue is full, try again later.")
+    
+    try:
+        items: List[BatchUploadItem] = []
+        stored_files: Dict[int, StoredFile] = {}
+        
+        def reject(filename: str, message: str) -> None:
+            items.append(BatchUploadItem(filename=filename, status="rejected", message=message))
+        
+        for file in files:
+            file_ext = Path(file.filename).suffix.lower()
+            
+            if file_ext == ".zip":
+                try:
+                    members = await anyio.to_thread.run_sync(
+                        extract_archive,
+                        file.file,
+                        UPLOAD_DIR,
+                        ALLOWED_EXTENSIONS,
+                        config.MAX_UPLOAD_SIZE,
+                        config.MAX_BATCH_FILES - len(stored_files),
+                    )
+                except (zipfile.BadZipFile, ValueError) as e:
+                    reject(file.filename, str(e))
+                    continue
+                for member in members:
+                    if member.error:
+                        reject(member.filename, member.error)
+                    else:
+                        stored_files[len(items)] = member.stored
+                        items.append(BatchUploadItem(filename=member.filename, status="", message=""))
+                continue
+            
+            if file_ext not in ALLOWED_EXTENSIONS:
+                reject(file.filename, f"File type {file_ext} not supported. Allowed: {ALLOWED_EXTENSIONS}")
+                continue
+            try:
+                stored = await save_upload(
+                    file=file,
+                    upload_dir=UPLOAD_DIR,
+                    extension=file_ext,
+                    max_size=config.MAX_UPLOAD_SIZE,
+                )
+            except UploadTooLarge as e:
+                reject(file.filename, str(e))
+                continue
+            stored_files[len(items)] = stored
+            items.append(BatchUploadItem(filename=file.filename, status="", message=""))
+        
+        # Resolve duplicates, against the store and within the batch
+        existing_by_hash: Dict[str, Optional[Document]] = {}
+        first_in_batch: Dict[str, int] = {}
+        entries, new_indexes = [], []
+        for index, stored in stored_files.items():
+            item = items[index]
+            if stored.sha256 not in existing_by_hash:
+                existing_by_hash[stored.sha256] = await doc_service.find_by_hash(db, stored.sha256)
+            existing = existing_by_hash[stored.sha256]
+            
+            entry = dict(
+                filename=item.filename,
+                file_type=Path(item.filename).suffix.lower(),
+                file_path=str(stored.path),
+                file_size=stored.size,
+                content_hash=stored.sha256,
+                status=JobStatus.QUEUED.value,
+            )
+            if existing is not None:
+                entry.update(file_path=existing.file_path, status=existing.status)
+                item.message = f"Identical content already uploaded as document {existing.id}; reusing its vectors."
+            elif stored.sha256 in first_in_batch:
+                entry.update(file_path=str(stored_files[first_in_batch[stored.sha256]].path))
+                item.message = f"Identical content to {items[first_in_batch[stored.sha256]].filename} in this batch; reusing its vectors."
+            else:
+                first_in_batch[stored.sha256] = index
+                new_indexes.append(index)
+                item.message = "Document accepted for processing."
+            item.status = entry["status"]
+            item.file_size = stored.size
+            entries.append(entry)
+        
+        documents = await doc_service.save_documents_metadata(db, entries) if entries else []
+        # duplicates point at the first copy of their content, stored under its extension
+        await doc_service.remove_unused_files(db, [str(stored.path) for stored in stored_files.values()])
+        document_by_index = dict(zip(stored_files.keys(), documents))
+        
+        new_documents = [document_by_index[index] for index in new_indexes]
+        jobs = await ingestion.create_jobs(db, new_documents) if new_documents else []
+        job_by_hash = {document.content_hash: job for document, job in zip(new_documents, jobs)}
+        for content_hash, existing in existing_by_hash.items():
+            if existing is not None:
+                job = await ingestion.get_document_job(db, existing.id)
+                if job is not None:
+                    job_by_hash[content_hash] = job
+        
+        for index, document in document_by_index.items():
+            job = job_by_hash.get(document.content_hash)
+            items[index].document_id = document.id
+            items[index].job_id = job.id if job else None
+        
+        if jobs:
+            try:
+                ingestion.submit_batch([job.id for job in jobs])
+            except IngestionQueueFull as e:
+                for document in document_by_index.values():
+                    if document.content_hash in first_in_batch:
+                        document.status = JobStatus.FAILED.value
+                for job in jobs:
+                    job.status = JobStatus.FAILED.value
+                    job.error = str(e)
+                await db.commit()
+                raise HTTPException(status_code=503, detail=str(e))
+        
+        return BatchUploadResponse(
+            files=items,
+            accepted=len(new_indexes),
+            duplicates=len(stored_files) - len(new_indexes),
+            rejected=len(items) - len(stored_files),
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch upload error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch upload failed: {str(e)}")
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    ingestion: IngestionService = Depends(get_ingestion_service),
+):
+    """
+    Get the status of an ingestion job.
+
+    Args:
+        job_id (int): The id of the job returned by /upload.
+        db (AsyncSession): The database session to use.
+        ingestion (IngestionService): The ingestion service to use.
+
+    Returns:
+        JobStatusResponse: The current stage of the job and, if it failed, the error.
+
+    Raises:
+        HTTPException: If the job does not exist.
+    """
+    job = await ingestion.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    
+    return JobStatusResponse(
+        job_id=job.id,
+        document_id=job.document_id,
+        status=job.status,
+        error=job.error,
+        chunk_count=job.chunk_count,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+    )
+
+
+@router.delete("/documents/{document_id}", response_model=DeleteDocumentResponse)
+async def delete_document(
+    document_id: int,
+    db: AsyncSession = Depends(get_db),
+    doc_service: DocumentService = Depends(get_document_service),
+    vector_store: Chroma_VectorStore = Depends(get_chroma_vector_store),
+    ingestion: IngestionService = Depends(get_ingestion_service),
+):
+    """
+    Delete a document, its vectors and its file.
+
+    Args:
+        document_id (int): The id of the document.
+        db (AsyncSession): The database session to use.
+        doc_service (DocumentService): The document service to use.
+        vector_store (Chroma_VectorStore): The vector store to delete the chunks from.
+        ingestion (IngestionService): The ingestion service running the document's jobs.
+
+    Returns:
+        DeleteDocumentResponse: The number of chunks deleted.
+
+    Raises:
+        HTTPException: If the document does not exist, if it is being ingested, or
+            if the deletion fails.
+    """
+    document = await doc_service.get_document(db, document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+    
+    if await ingestion.has_pending_job(db, document_id):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Document {document_id} is being ingested; delete it once its job is done.",
+        )
+    
+    try:
+        chunks_deleted = await doc_service.delete_document(db, document, vector_store)
+    except Exception as e:
+        logger.error(f"Delete document error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to delete document: {str(e)}")
+    
+    return DeleteDocumentResponse(
+        document_id=document_id,
+        chunks_deleted=chunks_deleted,
+        message="Document deleted.",
+    )
+
+
+@router.post("/documents/{document_id}/reindex", response_model=ReindexResponse, status_code=202)
+async def reindex_document(
+    document_id: int,
+    file: Optional[UploadFile] = File(None),
+    db: AsyncSession = Depends(get_db),
+    doc_service: DocumentService = Depends(get_document_service),
+    ingestion: IngestionService = Depends(get_ingestion_service),
+    vector_store: Chroma_VectorStore = Depends(get_chroma_vector_store),
+):
+    """
+    Re-index a document, optionally from a new version of its file.
+
+    Chunks are diffed by content hash against the stored vectors, so only the chunks
+    that changed are embedded and written. A new version of a file other documents
+    were uploaded with leaves them the vectors of the old one, and a new version
+    whose content was uploaded before reuses its vectors like /upload does, without
+    a job.
+
+    Args:
+        document_id (int): The id of the document.
+        file (Optional[UploadFile]): A new version of the file; the stored file is re-read if omitted.
+        db (AsyncSession): The database session to use.
+        doc_service (DocumentService): The document service to use.
+        ingestion (IngestionService): The ingestion service to queue the job on.
+        vector_store (Chroma_VectorStore): The vector store holding the document's chunks.
+
+    Returns:
+        ReindexResponse: The id of the queued ingestion job, or of the job of the
+            document whose vectors are reused.
+
+    Raises:
+        HTTPException: If the document does not exist, if it is being ingested or
+            deleted, if the file is not supported or too large, if the document only
+            references a duplicate's vectors, or if the ingestion queue is full.
+    """
+    document = await doc_service.get_document(db, document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+    
+    if document.status == JobStatus.DELETING.value or await ingestion.has_pending_job(db, document_id):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Document {document_id} is being ingested or deleted; re-index it once that is done.",
+        )
+    
+    if ingestion.is_full():
+        raise HTTPException(status_code=503, detail="Ingestion queue is full, try again later.")
+    
+    if file is not None:
+        file_ext = Path(file.filename).suffix.lower()
+        if file_ext not in ALLOWED_EXTENSIONS:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"File type {file_ext} not supported. Allowed: {ALLOWED_EXTENSIONS}"
+            )
+        try:
+            stored = await save_upload(
+                file=file,
+                upload_dir=UPLOAD_DIR,
+                extension=file_ext,
+                max_size=config.MAX_UPLOAD_SIZE,
+            )
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        
+        existing = await doc_service.find_by_hash(db, stored.sha256)
+        if existing is not None and existing.id == document.id:
+            existing = None
+        await doc_service.update_document_file(
+            db=db,
+            document=document,
+            filename=file.filename,
+            file_type=file_ext,
+            file_path=str(stored.path),
+            file_size=stored.size,
+            content_hash=stored.sha256,
+            vector_store=vector_store,
+            duplicate_of=existing,
+        )
+        if existing is not None:
+            job = await ingestion.get_document_job(db, existing.id)
+            return ReindexResponse(
+                document_id=document_id,
+                job_id=job.id if job else None,
+                status=document.status,
+                message=f"Identical content already uploaded as document {existing.id}; reusing its vectors.",
+            )
+    elif document.content_hash:
+        canonical = await doc_service.find_by_hash(db, document.content_hash)
+        if canonical is not None and canonical.id != document.id:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Document {document_id} shares its vectors with document {canonical.id}; re-index that one.",
+            )
+    
+    job = await ingestion.create_job(db=db, document=document)
+    try:
+        ingestion.submit(job.id)
+    except IngestionQueueFull as e:
+        job.status = document.status = JobStatus.FAILED.value
+        job.error = str(e)
+        await db.commit()
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return ReindexResponse(
+        document_id=document_id,
+        job_id=job.id,
+        status=job.status,
+        message="Document queued for re-indexing.",
+    )
+
+
 @router.get("/list_documents", response_model=ListDocumentsResponse)
 async def list_documents(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(config.LIST_DOCUMENTS_PAGE_SIZE, ge=1, le=config.LIST_DOCUMENTS_MAX_PAGE_SIZE),
+    file_type: Optional[str] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+    include_total: bool = True,
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db),
     doc_service: DocumentService = Depends(get_document_service)
 ):
     """
-    List all uploaded documents with their metadata.
+    List uploaded documents with their metadata, newest first, a page at a time.
+    
+    Query parameters:
+    - cursor: the next_cursor of the previous page; omit it for the first page
+    - limit: the number of documents per page
+    - file_type, uploaded_after, uploaded_before: only list matching documents
+    - include_total: whether to count the matching documents
+    
+    The response carries an ETag; a request whose If-None-Match matches it gets an
+    empty 304, so polling clients only download a page when it changed.
     
     Returns:
     - List of documents with id, filename, type, upload date, size, and status
-    - Total count of documents
+    - Total count of matching documents, if requested
+    - The cursor of the next page, or null on the last page
     """
     try:
-        documents = await doc_service.list_all_documents(db)
+        try:
+            documents, next_cursor = await doc_service.list_documents(
+                db,
+                limit=limit,
+                cursor=cursor,
+                file_type=file_type,
+                uploaded_after=uploaded_after,
+                uploaded_before=uploaded_before,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        total_count = None
+        if include_total:
+            total_count = await doc_service.count_documents(
+                db,
+                file_type=file_type,
+                uploaded_after=uploaded_after,
+                uploaded_before=uploaded_before,
+            )
         
         document_infos = [
             DocumentInfo(
@@ -116,15 +572,26 @@ async def list_documents(
                 file_type=doc.file_type,
                 upload_date=doc.upload_date,
                 file_size=doc.file_size,
+                status=doc.status,
             )
             for doc in documents
         ]
-        
-        return ListDocumentsResponse(
+        page = ListDocumentsResponse(
             documents=document_infos,
-            total_count=len(document_infos)
+            total_count=total_count,
+            next_cursor=next_cursor,
         )
         
+        etag = f'W/"{hashlib.sha1(page.model_dump_json().encode()).hexdigest()}"'
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+        return page
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"List documents error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to list documents: {str(e)}")
@@ -132,47 +599,73 @@ async def list_documents(
 
 
 
+async def get_answer_cache(graph, thread_id: str, retrieval: dict) -> Optional[AnswerCache]:
+    """
+    Get the answer cache a chat request may use, if any.
+
+    Only the first turn of a thread goes through the cache: the answer to a follow-up
+    depends on the thread's history, which the cache does not key on. Answers
+    retrieved with custom settings are neither served from nor added to the cache.
+    """
+    if answer_cache is None or retrieval or await has_history(graph, thread_id):
+        return None
+    return answer_cache
+
+
 @router.post("/query", response_model=ChatResponse)
 async def chat(
     request: ChatRequest, 
-    background_tasks: BackgroundTasks,
-    graph=Depends(build_graph), 
+    graph=Depends(get_agent_graph), 
     vector_store: Chroma_VectorStore = Depends(get_chroma_vector_store),
-    db: AsyncSession = Depends(get_db),
     chat_service: ChatService = Depends(get_chat_service)
 ):
     """
     Process a chat request using the provided graph and vector store.
 
     Args:
-    - request (ChatRequest): The chat request containing the question and thread id.
-    - background_tasks (BackgroundTasks): The background tasks to add the logging task to.
+    - request (ChatRequest): The chat request containing the question, the thread id and
+      optional retrieval settings (top_k, search_type, fetch_k, score_threshold, weights,
+      rerank).
     - graph (StateGraph): The graph to use for the chat.
     - vector_store (Chroma_VectorStore): The vector store to use for the chat.
-    - db (AsyncSession): The database session to use for logging the chat message.
-    - chat_service (ChatService): The chat service to use for logging the chat message.
+    - chat_service (ChatService): The chat service to queue the chat message on.
 
     Returns:
-    - ChatResponse: The response containing the answer to the chat request.
+    - ChatResponse: The response containing the answer to the chat request, flagged
+      as cached when it was served from the semantic answer cache, with the usage of
+      the retrieved context in its metadata.
 
     Raises:
-    - HTTPException: If an internal error occurred while processing the request.
+    - HTTPException: 429 or 503 if the inference queue is saturated, 500 if an internal
+      error occurred while processing the request.
     """
     try:
         start_time = time.time()
+        retrieval = request.retrieval_options()
+        cache = await get_answer_cache(graph, request.thread_id, retrieval)
         
-        response = await get_chat_response(
-            graph=graph,
-            question=request.question,
-            thread_id=request.thread_id,
-            vector_store=vector_store
-        )
+        response = await cache.lookup(request.question) if cache else None
+        cached = response is not None
+        metadata = {}
+        
+        if cached:
+            await record_exchange(graph, request.thread_id, request.question, response)
+        else:
+            response, metadata = await get_chat_response(
+                graph=graph,
+                question=request.question,
+                thread_id=request.thread_id,
+                vector_store=vector_store,
+                retrieval=retrieval,
+            )
+            if response is None:
+                raise HTTPException(status_code=500, detail="An internal error occurred while processing the request.")
+            if cache:
+                await cache.store(request.question, response)
         
         latency_ms = (time.time() - start_time) * 1000
         
-        background_tasks.add_task(
-            chat_service.log_chat_message,
-            db=db,
+        chat_service.log_chat_message(
             thread_id=request.thread_id,
             question=request.question,
             answer=response,
@@ -181,10 +674,114 @@ async def chat(
         
         return ChatResponse( 
             response=response,
+            cached=cached,
+            metadata=metadata,
         )
         
-        
+    except HTTPException:
+        raise
+    except InferenceOverloaded as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
         raise HTTPException(status_code=500, detail="An internal error occurred while processing the request.")
-  
+
+
+
+def format_sse(event: str, data: dict) -> str:
+    """
+    Format an event as a Server-Sent Events message.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/query/stream")
+async def chat_stream(
+    request: ChatRequest,
+    graph=Depends(get_agent_graph),
+    vector_store: Chroma_VectorStore = Depends(get_chroma_vector_store),
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """
+    Process a chat request and stream the answer as Server-Sent Events.
+
+    Emits `token` events as the answer is generated, `tool_start` and `tool_end`
+    events around tool calls, and a final `done` event with the full response,
+    latency and time to first token (or an `error` event). An answer served from
+    the semantic answer cache comes as a single `token` event and a `done` event
+    flagged `cached`. The exchange is logged once the stream completes.
+
+    Args:
+    - request (ChatRequest): The chat request containing the question, the thread id and
+      optional retrieval settings (top_k, search_type, fetch_k, score_threshold, weights,
+      rerank).
+    - graph (StateGraph): The graph to use for the chat.
+    - vector_store (Chroma_VectorStore): The vector store to use for the chat.
+    - chat_service (ChatService): The chat service to queue the chat message on.
+
+    Returns:
+    - StreamingResponse: A text/event-stream response.
+
+    Raises:
+    - HTTPException: 429 if the inference queue is already full.
+    """
+    if inference_executor.is_full():
+        raise HTTPException(
+            status_code=429,
+            detail="Too many generations in flight, try again later.",
+            headers={"Retry-After": "1"},
+        )
+
+    async def cached_stream(response: str, start_time: float):
+        latency_ms = (time.perf_counter() - start_time) * 1000
+        yield "token", {"content": response}
+        yield "done", {
+            "response": response,
+            "latency_ms": latency_ms,
+            "ttft_ms": latency_ms,
+            "tokens": 1,
+            "cached": True,
+        }
+
+    retrieval = request.retrieval_options()
+
+    async def event_stream():
+        start_time = time.perf_counter()
+        cache = await get_answer_cache(graph, request.thread_id, retrieval)
+        cached = await cache.lookup(request.question) if cache else None
+        
+        if cached is not None:
+            await record_exchange(graph, request.thread_id, request.question, cached)
+            events = cached_stream(cached, start_time)
+        else:
+            events = stream_chat_response(
+                graph=graph,
+                question=request.question,
+                thread_id=request.thread_id,
+                vector_store=vector_store,
+                retrieval=retrieval,
+            )
+        
+        async for event, data in events:
+            yield format_sse(event, data)
+
+            if event == "done":
+                if cached is None and cache:
+                    await cache.store(request.question, data["response"])
+
+                chat_service.log_chat_message(
+                    thread_id=request.thread_id,
+                    question=request.question,
+                    answer=data["response"],
+                    latency_ms=data["latency_ms"]
+                )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
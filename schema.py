@@ -1,15 +1,47 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field, model_validator
+from typing import Literal, Optional, List
 from datetime import datetime
+from utils.config import config
 
 class ChatRequest(BaseModel):
     thread_id: str = "1"
     question: str
+    top_k: Optional[int] = Field(None, ge=1, le=50)
+    search_type: Optional[Literal["similarity", "mmr", "similarity_score_threshold"]] = None
+    fetch_k: Optional[int] = Field(None, ge=1, le=200)
+    score_threshold: Optional[float] = Field(None, ge=0, le=1)
+    dense_weight: Optional[float] = Field(None, ge=0)
+    lexical_weight: Optional[float] = Field(None, ge=0)
+    rerank: Optional[bool] = None
+
+    @model_validator(mode="after")
+    def check_retrieval(self) -> "ChatRequest":
+        """Reject retrieval settings that would be ignored or return fewer than top_k chunks."""
+        if self.fetch_k is not None and self.fetch_k < (self.top_k or config.RETRIEVAL_K):
+            raise ValueError("fetch_k must be at least top_k")
+        if self.dense_weight is not None or self.lexical_weight is not None:
+            if not config.HYBRID_SEARCH_ENABLED:
+                raise ValueError("dense_weight and lexical_weight only apply with hybrid search enabled")
+            if self.dense_weight == 0 and self.lexical_weight == 0:
+                raise ValueError("dense_weight and lexical_weight cannot both be 0")
+        return self
+
+    def retrieval_options(self) -> dict:
+        """The retrieval settings overridden by this request, as taken by query_vector_store."""
+        options = self.model_dump(
+            include={"search_type", "fetch_k", "score_threshold", "dense_weight", "lexical_weight", "rerank"},
+            exclude_none=True,
+        )
+        if self.top_k is not None:
+            options["k"] = self.top_k
+        return options
     
     
 
 class ChatResponse(BaseModel):
     response: str
+    cached: bool = False
+    metadata: dict = Field(default_factory=dict)
 
 
 # New schemas for document QA service
@@ -19,6 +51,47 @@ class UploadResponse(BaseModel):
     file_size: int
     status: str
     message: str
+    document_id: Optional[int] = None
+    job_id: Optional[int] = None
+
+
+class BatchUploadItem(BaseModel):
+    filename: str
+    status: str
+    message: str
+    file_size: Optional[int] = None
+    document_id: Optional[int] = None
+    job_id: Optional[int] = None
+
+
+class BatchUploadResponse(BaseModel):
+    files: List[BatchUploadItem]
+    accepted: int
+    duplicates: int
+    rejected: int
+
+
+class JobStatusResponse(BaseModel):
+    job_id: int
+    document_id: int
+    status: str
+    error: Optional[str] = None
+    chunk_count: Optional[int] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class DeleteDocumentResponse(BaseModel):
+    document_id: int
+    chunks_deleted: int
+    message: str
+
+
+class ReindexResponse(BaseModel):
+    document_id: int
+    job_id: Optional[int] = None
+    status: str
+    message: str
 
 
 class DocumentInfo(BaseModel):
@@ -32,7 +105,8 @@ class DocumentInfo(BaseModel):
 
 class ListDocumentsResponse(BaseModel):
     documents: List[DocumentInfo]
-    total_count: int
+    total_count: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 
 class QueryRequest(BaseModel):
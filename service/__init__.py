@@ -1,4 +1,6 @@
 from .document_service import get_document_service
+from .chat_service import chat_service, get_chat_service
+from .ingestion_service import ingestion_service, get_ingestion_service
 
 
 __all__ = [
@@ -6,4 +8,8 @@ __all__ = [
     "get_cached_graph",
     "get_cached_prompt",
     "get_document_service",
+    "chat_service",
+    "get_chat_service",
+    "ingestion_service",
+    "get_ingestion_service",
 ]
\ No newline at end of file
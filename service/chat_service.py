@@ -1,59 +1,186 @@
-from typing import Optional
-from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import datetime
+import time
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert
+from database import SessionLocal
 from database.models import ChatMessage
-from utils import logger
+from utils import logger, config
+from utils.metrics import CHAT_LOG_FLUSH_SECONDS, CHAT_LOG_ROWS
+
+
+_STOP = object()
 
 
 class ChatService:
-    """Service for handling chat message logging operations"""
-    
-    async def log_chat_message(
-        self, 
-        db: AsyncSession, 
+    """
+    Service for handling chat message logging operations.
+
+    Chat messages are not written by the request that produced them: they are put
+    on a bounded queue and a single writer task, with its own session, inserts them
+    in multi-row batches of up to `batch_size` rows, or whatever arrived within
+    `flush_interval_ms` of the first one. When the database falls behind and the
+    queue is full, new rows are dropped and counted instead of blocking requests.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        max_queue_size: int = config.CHAT_LOG_QUEUE_SIZE,
+        batch_size: int = config.CHAT_LOG_BATCH_SIZE,
+        flush_interval_ms: float = config.CHAT_LOG_FLUSH_MS,
+        shutdown_timeout: float = config.CHAT_LOG_SHUTDOWN_TIMEOUT,
+    ) -> None:
+        """
+        Initialize a ChatService object.
+
+        Args:
+            session_factory: Creates the AsyncSession the messages are written with.
+            max_queue_size (int): The number of messages that can wait to be written.
+            batch_size (int): The maximum number of messages written per insert.
+            flush_interval_ms (float): How long a batch waits for more messages.
+            shutdown_timeout (float): How long stop waits for the last flush.
+        """
+        self.session_factory = session_factory
+        self.max_queue_size = max_queue_size
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000
+        self.shutdown_timeout = shutdown_timeout
+        self.written = 0
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        return self._queue
+
+    async def start(self) -> None:
+        """
+        Start the writer task.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer(), name="chat-log-writer")
+
+    async def stop(self) -> None:
+        """
+        Flush the queued messages and stop the writer task.
+
+        Messages still queued after `shutdown_timeout` seconds are lost.
+        """
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.put(_STOP), self.shutdown_timeout)
+            await asyncio.wait_for(self._task, self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            logger.warning(f"Chat log writer stopped with {self.queue.qsize()} messages unwritten")
+        self._task = None
+        self._queue = None
+
+    def log_chat_message(
+        self,
         thread_id: str,
         question: str,
         answer: str,
-        latency_ms: Optional[float] = None
-    ) -> ChatMessage:
+        latency_ms: Optional[float] = None,
+    ) -> bool:
         """
-        Log a chat message to the database.
+        Queue a chat message to be written to the database, without waiting.
 
         Args:
-            db (AsyncSession): The database session to use.
             thread_id (str): The unique identifier for the chat thread.
             question (str): The user's question.
             answer (str): The AI's response.
             latency_ms (Optional[float]): The response latency in milliseconds.
 
         Returns:
-            ChatMessage: The saved chat message.
+            bool: True if the message was queued, False if it was dropped because
+                the queue is full.
+        """
+        row = dict(
+            thread_id=thread_id,
+            question=question,
+            answer=answer,
+            latency_ms=latency_ms,
+            timestamp=datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None),
+        )
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except asyncio.QueueFull:
+            self._drop(1, "queue_full")
+            return False
+
+    def _drop(self, count: int, reason: str) -> None:
+        if self.dropped == 0 or (self.dropped + count) // 1000 > self.dropped // 1000:
+            logger.warning(f"Dropping chat messages ({reason}), {self.dropped + count} dropped so far")
+        self.dropped += count
+        CHAT_LOG_ROWS.labels(result=f"dropped_{reason}").inc(count)
 
-        Raises:
-            Exception: If there is an error saving the chat message.
+    async def _writer(self) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self.queue
+        stopping = False
+        while not stopping:
+            entry = await queue.get()
+            if entry is _STOP:
+                break
+            batch: List[Dict[str, Any]] = [entry]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    entry = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        entry = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            await self.flush(batch)
+
+    async def flush(self, rows: List[Dict[str, Any]]) -> None:
         """
+        Write a batch of chat messages with a single multi-row insert.
+
+        A failed batch is dropped and counted; it is not retried, so a database
+        outage cannot pile messages up in memory.
+
+        Args:
+            rows (List[Dict[str, Any]]): The ChatMessage column values.
+        """
+        start_time = time.perf_counter()
         try:
-            chat_message = ChatMessage(
-                thread_id=thread_id,
-                question=question,
-                answer=answer,
-                latency_ms=latency_ms,
-            )
-            db.add(chat_message)
-            await db.commit()
-            await db.refresh(chat_message)
-            logger.info(f"Chat message logged for thread: {thread_id}")
-            return chat_message
+            async with self.session_factory() as session, session.begin():
+                await session.execute(insert(ChatMessage), rows)
         except Exception as e:
-            await db.rollback()
-            logger.error(f"Error logging chat message: {str(e)}")
-            raise
+            logger.error(f"Error logging {len(rows)} chat messages: {str(e)}")
+            self._drop(len(rows), "error")
+            return
+        finally:
+            CHAT_LOG_FLUSH_SECONDS.observe(time.perf_counter() - start_time)
+        self.written += len(rows)
+        CHAT_LOG_ROWS.labels(result="written").inc(len(rows))
+
+
+chat_service = ChatService()
 
 
 def get_chat_service() -> ChatService:
     """
-    Get an instance of the ChatService.
+    Get the shared instance of the ChatService.
 
     Returns:
         ChatService: The instance of the ChatService.
     """
-    return ChatService()
+    return chat_service
@@ -1,12 +1,48 @@
 import os
 import time
-from typing import List, Optional
+import base64
+import datetime
+import json
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from database.models import Document, QueryLog
+from sqlalchemy import and_, delete, func, or_, select
+from database.models import Document, IngestionJob, JobStatus
 from utils.loaders import Loader
 from utils.chroma_store import Chroma_VectorStore
-from utils import logger
+from utils import logger, config
+
+
+# (file_type, uploaded_after, uploaded_before) -> (expiry, count), shared by the
+# per-request DocumentService instances of this process
+_count_cache: Dict[tuple, Tuple[float, int]] = {}
+
+
+def encode_cursor(document: Document) -> str:
+    """
+    Encode the position after a document in the listing as an opaque cursor.
+    """
+    position = json.dumps([document.upload_date.isoformat(), document.id])
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    """
+    Decode a cursor made by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        upload_date, document_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.datetime.fromisoformat(upload_date), int(document_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def _as_utc(value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
 
 
 class DocumentService:    
@@ -16,7 +52,9 @@ class DocumentService:
         filename: str, 
         file_type: str, 
         file_path: str,
-        file_size: int
+        file_size: int,
+        content_hash: Optional[str] = None,
+        status: str = JobStatus.QUEUED.value,
     ) -> Document:
         """
         Save document metadata to database.
@@ -27,6 +65,8 @@ class DocumentService:
             file_type (str): The type of the document (e.g. PDF, TXT, etc.).
             file_path (str): The path to the document file.
             file_size (int): The size of the document file in bytes.
+            content_hash (Optional[str]): The sha256 of the file content.
+            status (str): The initial ingestion status of the document.
 
         Returns:
             Document: The saved document metadata.
@@ -40,38 +80,352 @@ class DocumentService:
                 file_type=file_type,
                 file_path=file_path,
                 file_size=file_size,
+                content_hash=content_hash,
+                status=status,
             )
             db.add(document)
             await db.commit()
             await db.refresh(document)
+            _count_cache.clear()
             logger.info(f"Document metadata saved: {filename}")
             return document
         except Exception as e:
             await db.rollback()
             logger.error(f"Error saving document metadata: {str(e)}")
             raise
+
+    async def save_documents_metadata(self, db: AsyncSession, entries: List[dict]) -> List[Document]:
+        """
+        Save the metadata of many documents in one transaction.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            entries (List[dict]): The columns of each document, as taken by
+                save_document_metadata.
+
+        Returns:
+            List[Document]: The saved documents, in the order of the entries.
+
+        Raises:
+            Exception: If there is an error saving the document metadata.
+        """
+        try:
+            documents = [Document(**entry) for entry in entries]
+            db.add_all(documents)
+            await db.commit()
+            _count_cache.clear()
+            logger.info(f"Document metadata saved: {len(documents)} documents")
+            return documents
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error saving document metadata: {str(e)}")
+            raise
+
+
+    async def find_by_hash(self, db: AsyncSession, content_hash: str) -> Optional[Document]:
+        """
+        Find the first document with the given content that did not fail ingestion
+        and is not being deleted.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            content_hash (str): The sha256 of the file content.
+
+        Returns:
+            Optional[Document]: The matching document, or None if the content is new.
+        """
+        result = await db.execute(
+            select(Document)
+            .where(
+                Document.content_hash == content_hash,
+                Document.status.notin_([JobStatus.FAILED.value, JobStatus.DELETING.value]),
+            )
+            .order_by(Document.id)
+            .limit(1)
+        )
+        return result.scalars().first()
+    
+    
+    async def get_document(self, db: AsyncSession, document_id: int) -> Optional[Document]:
+        """
+        Get a document by id.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            document_id (int): The id of the document.
+
+        Returns:
+            Optional[Document]: The document, or None if it does not exist.
+        """
+        return await db.get(Document, document_id)
+    
+    
+    async def update_document_file(
+        self,
+        db: AsyncSession,
+        document: Document,
+        filename: str,
+        file_type: str,
+        file_path: str,
+        file_size: int,
+        content_hash: str,
+        vector_store: Chroma_VectorStore,
+        duplicate_of: Optional[Document] = None,
+    ) -> Document:
+        """
+        Point a document at a new version of its file.
+
+        If other documents share the document's current content, its vectors are
+        handed over to the first of them, so they keep the vectors of that content
+        and the document is re-indexed on its own. The previous file is removed if
+        no other document uses it.
+
+        If the new version was uploaded before, as `duplicate_of`, the document
+        points at that document's file, vectors and status like a duplicate upload
+        does, and the vectors it no longer shares with anyone are deleted.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            document (Document): The document to update.
+            filename (str): The filename of the new version.
+            file_type (str): The type of the new version.
+            file_path (str): The path to the new version.
+            file_size (int): The size of the new version in bytes.
+            content_hash (str): The sha256 of the new version.
+            vector_store (Chroma_VectorStore): The vector store holding its chunks.
+            duplicate_of (Optional[Document]): The document already holding the new version.
+
+        Returns:
+            Document: The updated document.
+
+        Raises:
+            Exception: If there is an error updating the document.
+        """
+        duplicate = None
+        try:
+            old_file_path = document.file_path
+            if document.content_hash != content_hash:
+                duplicate = await self._find_duplicate(db, document)
+            if duplicate is not None:
+                await vector_store.reassign_document(document.id, duplicate.id)
+            document.filename = filename
+            document.file_type = file_type
+            document.file_path = file_path if duplicate_of is None else duplicate_of.file_path
+            document.file_size = file_size
+            document.content_hash = content_hash
+            if duplicate_of is not None:
+                document.status = duplicate_of.status
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            if duplicate is not None:
+                # the document still has the shared content: give its vectors back
+                await vector_store.reassign_document(duplicate.id, document.id)
+            logger.error(f"Error updating document {document.id}: {str(e)}")
+            raise
+        if duplicate_of is not None and duplicate is None:
+            # after the commit, so a failure here is cleaned up by re-indexing again
+            await vector_store.delete_document(document.id)
+        await self.remove_unused_files(db, [old_file_path, file_path])
+        return document
+    
+    
+    async def delete_document(self, db: AsyncSession, document: Document, vector_store: Chroma_VectorStore) -> int:
+        """
+        Delete a document, its ingestion jobs, its vectors and its file.
+
+        Vectors and files are shared by documents uploaded with identical content; if
+        such a duplicate remains, the vectors are handed over to it instead of deleted.
+
+        The document is marked as deleting before its vectors are touched, and only
+        removed once they are gone: if a step fails, the document is still there,
+        without being served as a duplicate, and deleting it again finishes the job.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            document (Document): The document to delete.
+            vector_store (Chroma_VectorStore): The vector store holding its chunks.
+
+        Returns:
+            int: The number of chunks deleted from the vector store.
+
+        Raises:
+            Exception: If there is an error deleting the document.
+        """
+        try:
+            document_id = document.id
+            document.status = JobStatus.DELETING.value
+            await db.commit()
+            
+            duplicate = await self._find_duplicate(db, document)
+            if duplicate is not None:
+                await vector_store.reassign_document(document.id, duplicate.id)
+                chunks_deleted = 0
+            else:
+                chunks_deleted = await vector_store.delete_document(document.id)
             
+            file_path = document.file_path
+            await db.execute(delete(IngestionJob).where(IngestionJob.document_id == document.id))
+            await db.delete(document)
+            await db.commit()
+            _count_cache.clear()
+            await self.remove_unused_files(db, [file_path])
+            
+            logger.info(f"Document {document_id} deleted ({chunks_deleted} chunks)")
+            return chunks_deleted
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error deleting document: {str(e)}")
+            raise
+    
+    
+    async def _find_duplicate(self, db: AsyncSession, document: Document) -> Optional[Document]:
+        if not document.content_hash:
+            return None
+        result = await db.execute(
+            select(Document)
+            .where(
+                Document.content_hash == document.content_hash,
+                Document.id != document.id,
+                Document.status != JobStatus.DELETING.value,
+            )
+            .order_by(Document.id)
+            .limit(1)
+        )
+        return result.scalars().first()
+    
     
-    async def list_all_documents(self, db: AsyncSession) -> List[Document]:
+    async def remove_unused_files(self, db: AsyncSession, file_paths: List[str]) -> None:
         """
-        List all uploaded documents with their metadata.
+        Remove the stored files that no document points at.
 
         Args:
             db (AsyncSession): The database session to use.
+            file_paths (List[str]): The paths of the files to check.
+        """
+        file_paths = set(file_paths)
+        if not file_paths:
+            return
+        result = await db.execute(select(Document.file_path).where(Document.file_path.in_(file_paths)))
+        for file_path in file_paths - set(result.scalars().all()):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+    
+    
+    def _filters(
+        self,
+        file_type: Optional[str],
+        uploaded_after: Optional[datetime.datetime],
+        uploaded_before: Optional[datetime.datetime],
+    ) -> list:
+        conditions = []
+        if file_type:
+            conditions.append(Document.file_type == file_type)
+        if uploaded_after is not None:
+            conditions.append(Document.upload_date >= uploaded_after)
+        if uploaded_before is not None:
+            conditions.append(Document.upload_date < uploaded_before)
+        return conditions
+    
+    
+    async def list_documents(
+        self,
+        db: AsyncSession,
+        limit: int,
+        cursor: Optional[str] = None,
+        file_type: Optional[str] = None,
+        uploaded_after: Optional[datetime.datetime] = None,
+        uploaded_before: Optional[datetime.datetime] = None,
+    ) -> Tuple[List[Document], Optional[str]]:
+        """
+        List a page of documents, newest first.
+
+        Pages are read with a keyset on (upload_date, id), served by the
+        ix_documents_upload_date_id index, so reading a page costs the same however
+        deep into the listing it is.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            limit (int): The maximum number of documents on the page.
+            cursor (Optional[str]): The next_cursor of the previous page, None for the first page.
+            file_type (Optional[str]): Only list documents of this type (e.g. ".pdf").
+            uploaded_after (Optional[datetime.datetime]): Only list documents uploaded at or after this time.
+            uploaded_before (Optional[datetime.datetime]): Only list documents uploaded before this time.
 
         Returns:
-            List[Document]: A list of documents with their metadata.
+            Tuple[List[Document], Optional[str]]: The documents, and the cursor of the
+                next page, or None if this is the last page.
 
         Raises:
+            ValueError: If the cursor is malformed.
             Exception: If there is an error listing the documents.
         """
+        conditions = self._filters(file_type, _as_utc(uploaded_after), _as_utc(uploaded_before))
+        if cursor:
+            upload_date, document_id = decode_cursor(cursor)
+            conditions.append(
+                or_(
+                    Document.upload_date < upload_date,
+                    and_(Document.upload_date == upload_date, Document.id < document_id),
+                )
+            )
         try:
-            result = await db.execute(select(Document).order_by(Document.upload_date.desc()))
+            result = await db.execute(
+                select(Document)
+                .where(*conditions)
+                .order_by(Document.upload_date.desc(), Document.id.desc())
+                .limit(limit + 1)
+            )
             documents = result.scalars().all()
-            return documents
         except Exception as e:
             logger.error(f"Error listing documents: {str(e)}")
             raise
+        
+        if len(documents) > limit:
+            documents = documents[:limit]
+            return documents, encode_cursor(documents[-1])
+        return documents, None
+    
+    
+    async def count_documents(
+        self,
+        db: AsyncSession,
+        file_type: Optional[str] = None,
+        uploaded_after: Optional[datetime.datetime] = None,
+        uploaded_before: Optional[datetime.datetime] = None,
+    ) -> int:
+        """
+        Count the documents matching the filters of list_documents.
+
+        Counts are cached per filter for LIST_DOCUMENTS_COUNT_TTL seconds, so paging
+        and polling do not scan the table on every request. Documents saved or deleted
+        through this process clear the cache; other workers' changes show up once
+        the count expires.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            file_type (Optional[str]): Only count documents of this type.
+            uploaded_after (Optional[datetime.datetime]): Only count documents uploaded at or after this time.
+            uploaded_before (Optional[datetime.datetime]): Only count documents uploaded before this time.
+
+        Returns:
+            int: The number of documents.
+        """
+        uploaded_after, uploaded_before = _as_utc(uploaded_after), _as_utc(uploaded_before)
+        key = (file_type, uploaded_after, uploaded_before)
+        now = time.monotonic()
+        cached = _count_cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        
+        result = await db.execute(
+            select(func.count()).select_from(Document).where(*self._filters(*key))
+        )
+        count = result.scalar_one()
+        if len(_count_cache) >= 1024:
+            _count_cache.clear()
+        _count_cache[key] = (now + config.LIST_DOCUMENTS_COUNT_TTL, count)
+        return count
     
 
 
@@ -0,0 +1,437 @@
+import asyncio
+from typing import List, Optional, Tuple, Union
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SessionLocal
+from database.models import Document, IngestionJob, JobStatus
+from utils import logger, config, Loader, get_chroma_vector_store
+from utils.chroma_store import DocumentIndexer
+from utils.parsing_pool import parser_pool
+from utils.tracing import current_link, start_span
+
+
+PENDING_STATUSES = (
+    JobStatus.QUEUED.value,
+    JobStatus.PARSING.value,
+    JobStatus.CHUNKING.value,
+    JobStatus.EMBEDDING.value,
+)
+
+
+class IngestionQueueFull(Exception):
+    """Raised when the ingestion queue cannot accept another job"""
+
+
+class IngestionService:
+    """
+    Service for ingesting uploaded documents in the background.
+
+    Jobs are queued in a bounded asyncio queue and drained by a fixed number of
+    workers, so uploads can be accepted faster than they are processed while the
+    amount of parsing and embedding running at once stays bounded. Every stage is
+    recorded on the job row so clients can poll its progress.
+    """
+
+    def __init__(
+        self,
+        workers: int = config.INGESTION_WORKERS,
+        max_queue_size: int = config.INGESTION_QUEUE_SIZE,
+    ) -> None:
+        """
+        Initialize an IngestionService object.
+
+        Args:
+            workers (int): The number of jobs processed concurrently.
+            max_queue_size (int): The number of jobs that can wait in the queue.
+        """
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        return self._queue
+
+    def is_full(self) -> bool:
+        return self.queue.full()
+
+    async def start(self) -> None:
+        """
+        Start the workers and re-queue jobs left unfinished by a previous run.
+
+        Jobs beyond the queue's capacity are fed to it by a background task as the
+        workers make room, so none is left behind.
+        """
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(i), name=f"ingestion-worker-{i}"))
+
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(IngestionJob.id)
+                .where(IngestionJob.status.in_(PENDING_STATUSES))
+                .order_by(IngestionJob.id)
+            )
+            pending = result.scalars().all()
+
+        for i, job_id in enumerate(pending):
+            try:
+                self.submit(job_id)
+            except IngestionQueueFull:
+                logger.info(f"Ingestion queue full, feeding the last {len(pending) - i} pending jobs as it drains")
+                self._tasks.append(asyncio.create_task(self._feed(pending[i:]), name="ingestion-feeder"))
+                break
+
+        logger.info(f"Ingestion service started with {self.workers} workers ({len(pending)} pending jobs)")
+
+    async def _feed(self, job_ids: List[int]) -> None:
+        for job_id in job_ids:
+            await self.queue.put((job_id, None))
+
+    async def stop(self) -> None:
+        """
+        Stop the workers and the feeding of pending jobs. Jobs still queued stay in
+        the queued state and are picked up again on the next start.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def create_job(self, db: AsyncSession, document: Document) -> IngestionJob:
+        """
+        Create a queued ingestion job for a document.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            document (Document): The document to ingest.
+
+        Returns:
+            IngestionJob: The saved job.
+
+        Raises:
+            Exception: If there is an error saving the job.
+        """
+        try:
+            job = IngestionJob(document_id=document.id, status=JobStatus.QUEUED.value)
+            db.add(job)
+            await db.commit()
+            await db.refresh(job)
+            return job
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error creating ingestion job: {str(e)}")
+            raise
+
+    def submit(self, job_id: int) -> None:
+        """
+        Put a job on the queue without waiting.
+
+        Args:
+            job_id (int): The id of the job to process.
+
+        Raises:
+            IngestionQueueFull: If the queue is at capacity.
+        """
+        try:
+            self.queue.put_nowait((job_id, current_link()))
+        except asyncio.QueueFull:
+            raise IngestionQueueFull("Ingestion queue is full, try again later.")
+
+    def submit_batch(self, job_ids: List[int]) -> None:
+        """
+        Put a batch of jobs on the queue, as a single entry, without waiting.
+
+        The jobs are processed together by one worker; see process_batch.
+
+        Args:
+            job_ids (List[int]): The ids of the jobs to process.
+
+        Raises:
+            IngestionQueueFull: If the queue is at capacity.
+        """
+        try:
+            self.queue.put_nowait((list(job_ids), current_link()))
+        except asyncio.QueueFull:
+            raise IngestionQueueFull("Ingestion queue is full, try again later.")
+
+    async def create_jobs(self, db: AsyncSession, documents: List[Document]) -> List[IngestionJob]:
+        """
+        Create queued ingestion jobs for many documents in one transaction.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            documents (List[Document]): The documents to ingest.
+
+        Returns:
+            List[IngestionJob]: The saved jobs, in the order of the documents.
+
+        Raises:
+            Exception: If there is an error saving the jobs.
+        """
+        try:
+            jobs = [IngestionJob(document_id=document.id, status=JobStatus.QUEUED.value) for document in documents]
+            db.add_all(jobs)
+            await db.commit()
+            return jobs
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error creating ingestion jobs: {str(e)}")
+            raise
+
+    async def get_job(self, db: AsyncSession, job_id: int) -> Optional[IngestionJob]:
+        """
+        Get an ingestion job by id.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            job_id (int): The id of the job.
+
+        Returns:
+            Optional[IngestionJob]: The job, or None if it does not exist.
+        """
+        return await db.get(IngestionJob, job_id)
+
+    async def get_document_job(self, db: AsyncSession, document_id: int) -> Optional[IngestionJob]:
+        """
+        Get the latest ingestion job of a document.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            document_id (int): The id of the document.
+
+        Returns:
+            Optional[IngestionJob]: The job, or None if the document was never queued.
+        """
+        result = await db.execute(
+            select(IngestionJob)
+            .where(IngestionJob.document_id == document_id)
+            .order_by(IngestionJob.id.desc())
+            .limit(1)
+        )
+        return result.scalars().first()
+
+    async def has_pending_job(self, db: AsyncSession, document_id: int) -> bool:
+        """
+        Tell whether the latest ingestion job of a document is queued or running.
+
+        Args:
+            db (AsyncSession): The database session to use.
+            document_id (int): The id of the document.
+
+        Returns:
+            bool: True if the job has not reached indexed or failed yet.
+        """
+        job = await self.get_document_job(db, document_id)
+        return job is not None and job.status in PENDING_STATUSES
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            entry: Union[int, List[int]]
+            entry, link = await self.queue.get()
+            # jobs run in their own trace, linked to the request that queued them
+            try:
+                if isinstance(entry, list):
+                    with start_span("ingestion.batch", links=[link] if link else None, **{"ingestion.jobs": len(entry)}):
+                        await self.process_batch(entry)
+                else:
+                    with start_span("ingestion.job", links=[link] if link else None, **{"ingestion.job_id": entry}):
+                        await self.process_job(entry)
+            except Exception as e:
+                logger.error(f"Ingestion worker {index} failed on job {entry}: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    async def _set_status(
+        self,
+        db: AsyncSession,
+        job: IngestionJob,
+        document: Document,
+        status: JobStatus,
+        **fields,
+    ) -> None:
+        job.status = status.value
+        document.status = status.value
+        if document.content_hash:
+            # duplicates of this content share its vectors, and so its status
+            await db.execute(
+                update(Document)
+                .where(
+                    Document.content_hash == document.content_hash,
+                    Document.id != document.id,
+                    Document.status != JobStatus.DELETING.value,
+                )
+                .values(status=status.value)
+            )
+        for name, value in fields.items():
+            setattr(job, name, value)
+        await db.commit()
+
+    async def _fail(self, db: AsyncSession, job: IngestionJob, document: Document, error: Exception) -> None:
+        await db.rollback()
+        await db.refresh(job)
+        await db.refresh(document)
+        logger.error(f"Processing error for {document.filename}: {str(error)}")
+        await self._set_status(db, job, document, JobStatus.FAILED, error=str(error))
+
+    async def _index_pages(
+        self,
+        db: AsyncSession,
+        job: IngestionJob,
+        document: Document,
+        indexer: DocumentIndexer,
+    ) -> int:
+        """
+        Stream the pages of a document through chunking into its indexer.
+
+        Args:
+            db (AsyncSession): The session the job and document belong to.
+            job (IngestionJob): The job, whose status follows the stages.
+            document (Document): The document to read.
+            indexer (DocumentIndexer): The indexer, already begun.
+
+        Returns:
+            int: The number of chunks produced.
+        """
+        vector_store = indexer.vector_store
+        await self._set_status(db, job, document, JobStatus.PARSING)
+        loader = Loader(file_paths=[document.file_path])
+        chunk_count = 0
+        pages = []
+
+        async def flush() -> None:
+            nonlocal chunk_count
+            if job.status == JobStatus.PARSING.value:
+                await self._set_status(db, job, document, JobStatus.CHUNKING)
+            chunks = await vector_store.chunk_documents(pages)
+            if job.status == JobStatus.CHUNKING.value:
+                await self._set_status(db, job, document, JobStatus.EMBEDDING)
+            await indexer.add(chunks)
+            chunk_count += len(chunks)
+            pages.clear()
+
+        async for page in loader.iter_documents():
+            pages.append(page)
+            if len(pages) >= config.INGESTION_BATCH_PAGES:
+                await flush()
+        if pages:
+            await flush()
+
+        return chunk_count
+
+    async def process_job(self, job_id: int) -> None:
+        """
+        Run a job through parsing, chunking and embedding.
+
+        Pages are streamed from the loader and chunked and embedded in batches of
+        INGESTION_BATCH_PAGES, so memory stays bounded for large files. Chunks are
+        diffed against the vectors already stored for the document, so re-indexing
+        only embeds the chunks that changed.
+
+        The job uses its own database session, as it outlives the request that
+        created it. Any error marks the job as failed with the error message.
+
+        Args:
+            job_id (int): The id of the job to process.
+        """
+        async with SessionLocal() as db:
+            job = await db.get(IngestionJob, job_id)
+            if job is None:
+                logger.warning(f"Ingestion job {job_id} not found")
+                return
+            document = await db.get(Document, job.document_id)
+
+            try:
+                indexer = get_chroma_vector_store().indexer(document.id, document.filename)
+                await indexer.begin()
+                chunk_count = await self._index_pages(db, job, document, indexer)
+                stats = await indexer.finish()
+                await self._set_status(db, job, document, JobStatus.INDEXED, chunk_count=chunk_count)
+                logger.info(f"Document {document.filename} indexed ({chunk_count} chunks: {stats})")
+            except Exception as e:
+                await self._fail(db, job, document, e)
+
+    async def process_batch(self, job_ids: List[int]) -> None:
+        """
+        Run many jobs together, pooling their chunks into bulk writes.
+
+        Up to one file per parser worker is parsed and chunked at once, each with its
+        own session. Once a file is fully chunked, its new chunks go to a shared
+        BulkWriter, which embeds and writes them in large batches instead of a few
+        chunks per file. Once every file is chunked the writer is flushed and the
+        files are marked indexed.
+
+        A file that fails to parse or chunk only fails its own job, and none of its
+        chunks reach the writer. A failed bulk write fails every job of the batch
+        that was not failed already, as the lost batch may hold chunks of any of
+        them, and their chunks written by earlier batches are deleted; files chunked
+        after it fail without being handed to the writer.
+
+        Args:
+            job_ids (List[int]): The ids of the jobs to process.
+        """
+        vector_store = get_chroma_vector_store()
+        writer = vector_store.bulk_writer()
+        slots = asyncio.Semaphore(parser_pool.workers)
+
+        async def prepare(job_id: int) -> Optional[Tuple[int, DocumentIndexer, int]]:
+            async with slots, SessionLocal() as db:
+                job = await db.get(IngestionJob, job_id)
+                if job is None:
+                    logger.warning(f"Ingestion job {job_id} not found")
+                    return None
+                document = await db.get(Document, job.document_id)
+
+                try:
+                    indexer = vector_store.indexer(document.id, document.filename, writer=writer)
+                    await indexer.begin()
+                    chunk_count = await self._index_pages(db, job, document, indexer)
+                    await indexer.commit()
+                    return job_id, indexer, chunk_count
+                except Exception as e:
+                    await self._fail(db, job, document, e)
+                    return None
+
+        prepared = [entry for entry in await asyncio.gather(*map(prepare, job_ids)) if entry]
+
+        async with SessionLocal() as db:
+            try:
+                written = await writer.flush()
+            except Exception as e:
+                written, write_error = writer.written, e
+            else:
+                write_error = None
+
+            for job_id, indexer, chunk_count in prepared:
+                job = await db.get(IngestionJob, job_id)
+                document = await db.get(Document, job.document_id)
+                try:
+                    if write_error is not None:
+                        # drop the chunks of the document written by earlier batches
+                        await vector_store.delete_document(document.id)
+                        raise write_error
+                    await indexer.finish()
+                    await self._set_status(db, job, document, JobStatus.INDEXED, chunk_count=chunk_count)
+                except Exception as e:
+                    await self._fail(db, job, document, e)
+
+        logger.info(
+            f"Batch of {len(job_ids)} jobs done: {len(prepared)} files chunked, "
+            f"{written} chunks written in batches of {writer.batch_size}"
+        )
+
+
+ingestion_service = IngestionService()
+
+
+def get_ingestion_service() -> IngestionService:
+    """
+    Get the shared instance of the IngestionService.
+
+    Returns:
+        IngestionService: The instance of the IngestionService.
+    """
+    return ingestion_service
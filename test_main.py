@@ -1,9 +1,114 @@
+import asyncio
+import time
+import httpx
+import pytest
 from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 from main import app 
+from database import get_db
+from database.database import build_engine
+from agent.graph import Assistant
+from agent.checkpointer import DatabaseCheckpointer
+from agent.history import HistoryPolicy
+from service.chat_service import ChatService
+from utils.context import ContextAssembler
+from utils.inference import InferenceExecutor, InferenceQueueFull
 
 client = TestClient(app)
 
 
+class SQLiteDatabase:
+    """A SQLite database file for one test, with its engine and session factory"""
+
+    def __init__(self, path) -> None:
+        self.engine = build_engine(f"sqlite+aiosqlite:///{path}")
+        self.session_factory = sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+
+    async def create_tables(self, *models) -> None:
+        async with self.engine.begin() as conn:
+            for model in models:
+                await conn.run_sync(model.__table__.create)
+
+    async def count(self, model, **filters) -> int:
+        query = select(func.count()).select_from(model)
+        for column, value in filters.items():
+            query = query.where(getattr(model, column) == value)
+        async with self.session_factory() as session:
+            return (await session.execute(query)).scalar_one()
+
+    def serve(self) -> None:
+        """Make the API's get_db dependency open its sessions on this database"""
+        async def override_get_db():
+            async with self.session_factory() as session:
+                yield session
+
+        app.dependency_overrides[get_db] = override_get_db
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    A fresh SQLite database, disposed of and no longer served by the API after the test.
+    """
+    db = SQLiteDatabase(tmp_path / "test.db")
+    yield db
+    app.dependency_overrides.pop(get_db, None)
+    asyncio.run(db.engine.dispose())
+
+
+@pytest.fixture
+def span_exporter():
+    """
+    Record spans in memory, with no trace sampled unless its parent is, and uninstall
+    the tracer provider after the test so it does not leak into the next ones.
+    """
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from utils.tracing import reset_tracing, setup_tracing
+
+    yield setup_tracing(InMemorySpanExporter(), sample_ratio=0.0)
+    reset_tracing()
+
+
+@pytest.fixture
+def vector_store(monkeypatch):
+    """
+    A Chroma_VectorStore on a collection of its own in an in-memory Chroma, with
+    length-based embeddings and a 40-character splitter so no model is loaded, and
+    served by the API as its get_chroma_vector_store dependency.
+    """
+    import uuid
+    import chromadb
+    from langchain_core.embeddings import Embeddings
+    import utils.chroma_store as chroma_store
+    from utils import get_chroma_vector_store
+    from utils.chunking import recursive_splitter
+    from utils.config import config
+
+    class LengthEmbeddings(Embeddings):
+        def embed_documents(self, texts):
+            return [self.embed_query(text) for text in texts]
+
+        def embed_query(self, text):
+            return [float(len(text)), 1.0]
+
+    monkeypatch.setattr(chroma_store, "embedding_model", LengthEmbeddings())
+    monkeypatch.setattr(config, "HYBRID_SEARCH_ENABLED", False)
+    monkeypatch.setattr(config, "VECTOR_STORE_COLLECTION", f"test-{uuid.uuid4().hex}")
+    store = chroma_store.Chroma_VectorStore(client=chromadb.EphemeralClient())
+    store._text_splitter = recursive_splitter(chunk_size=40, chunk_overlap=0, length_function=len)
+    app.dependency_overrides[get_chroma_vector_store] = lambda: store
+    yield store
+    app.dependency_overrides.pop(get_chroma_vector_store, None)
+
+
+def chunk_ids(vector_store, document_id: int) -> list:
+    return vector_store.chroma._collection.get(where={"document_id": document_id}, include=[])["ids"]
+
+
 def test_health_check():
     """
     Test the health check endpoint ("/") to ensure
@@ -12,3 +117,1426 @@ def test_health_check():
     response = client.get("/")
     assert response.status_code == 200
     assert response.json() == {"message": "API is running."}
+
+
+def slow_generation(state, generation_seconds: float = 1.0) -> AIMessage:
+    time.sleep(generation_seconds)
+    return AIMessage(content="done")
+
+
+def test_health_check_responsive_during_generation():
+    """
+    Test that "/" keeps answering quickly while several blocking generations
+    are running on the inference executor.
+    """
+    executor = InferenceExecutor(workers=2, max_queue=4, queue_timeout=10)
+    assistant = Assistant(RunnableLambda(slow_generation), executor=executor)
+
+    async def scenario():
+        generations = [
+            asyncio.create_task(assistant({"messages": [("user", "hi")]}, {}))
+            for _ in range(4)
+        ]
+        await asyncio.sleep(0.1)
+        assert executor.pending == 4
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            start_time = time.perf_counter()
+            response = await async_client.get("/")
+            elapsed = time.perf_counter() - start_time
+
+        results = await asyncio.gather(*generations)
+        return response, elapsed, results
+
+    response, elapsed, results = asyncio.run(scenario())
+    executor.shutdown()
+
+    assert response.status_code == 200
+    assert elapsed < 0.5
+    assert all(result["messages"].content == "done" for result in results)
+
+
+def test_inference_queue_full():
+    """
+    Test that generations beyond the queue-depth limit are rejected with a 429.
+    """
+    executor = InferenceExecutor(workers=1, max_queue=1, queue_timeout=10)
+
+    async def scenario():
+        running = [asyncio.create_task(executor.run(time.sleep, 0.5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(InferenceQueueFull) as exc_info:
+            await executor.run(time.sleep, 0.5)
+        await asyncio.gather(*running)
+        return exc_info.value
+
+    error = asyncio.run(scenario())
+    executor.shutdown()
+
+    assert error.status_code == 429
+
+
+
+def test_context_assembler_budget():
+    """
+    Test that the assembled context drops repeated sentences, puts the most relevant
+    chunk first, stops at a sentence boundary within the token budget and keeps the
+    line breaks between sentences.
+    """
+    from langchain_core.documents import Document
+
+    documents = [
+        Document(page_content="Uploads are scanned. Large files are split.", metadata={"score": 0.2}),
+        Document(page_content="Uploads are scanned. Scans take a minute. Reports follow.", metadata={"score": 0.9}),
+    ]
+
+    def count_words(text: str) -> int:
+        return len(text.split())
+
+    context = ContextAssembler(token_budget=16, count_tokens=count_words).assemble(documents, separator="\n")
+    assert context.text == "Uploads are scanned. Scans take a minute. Reports follow.\nLarge files are split."
+    assert (context.tokens, context.chunks, context.truncated) == (13, 2, False)
+
+    context = ContextAssembler(token_budget=12, count_tokens=count_words).assemble(documents, separator="\n")
+    assert context.text == "Uploads are scanned. Scans take a minute. Reports follow."
+    assert (context.tokens, context.chunks, context.truncated) == (9, 1, True)
+
+    steps = Document(page_content="Uploads are scanned.\nScans:\n- take a minute.\n- run twice.\n\nReports follow.")
+    context = ContextAssembler(token_budget=100, count_tokens=count_words).assemble([documents[0], steps])
+    assert context.text == "Uploads are scanned. Large files are split.\n\nScans:\n- take a minute.\n- run twice.\n\nReports follow."
+
+
+def test_history_prompt_size_flat():
+    """
+    Test that with the history policy the prompt sent to the assistant stops growing
+    after a few turns, over a 100-turn thread where every turn calls a tool.
+    """
+    from langchain_core.tools import tool
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.graph import StateGraph, START
+    from langgraph.prebuilt import ToolNode, tools_condition
+    from agent.state import State
+
+    @tool
+    def lookup(query: str) -> str:
+        """Look up a query."""
+        return "passage " * 500
+
+    prompt_sizes = []
+
+    def assistant(state) -> AIMessage:
+        if isinstance(state["messages"][-1], HumanMessage):
+            prompt_sizes.append(
+                sum(len(str(message.content)) for message in state["messages"]) + len(state["summary"])
+            )
+            return AIMessage(content="", tool_calls=[{"name": "lookup", "args": {"query": "q"}, "id": f"call-{len(prompt_sizes)}"}])
+        return AIMessage(content="answer " * 50)
+
+    def summarizer(messages) -> AIMessage:
+        return AIMessage(content="The user asked many questions. " * 100)
+
+    policy = HistoryPolicy(
+        RunnableLambda(summarizer), max_turns=4, tool_turns=1, fold_batch=2,
+        summary_max_tokens=100, count_tokens=lambda text: len(text.split()),
+    )
+    builder = StateGraph(State)
+    builder.add_node("history", policy)
+    builder.add_node("assistant", Assistant(RunnableLambda(assistant)))
+    builder.add_node("tools", ToolNode([lookup]))
+    builder.add_edge(START, "history")
+    builder.add_edge("history", "assistant")
+    builder.add_conditional_edges("assistant", tools_condition)
+    builder.add_edge("tools", "assistant")
+    graph = builder.compile(checkpointer=MemorySaver())
+
+    async def scenario():
+        config = {"configurable": {"thread_id": "long"}}
+        for turn in range(100):
+            await graph.ainvoke({"messages": [("user", f"question {turn}")]}, config)
+        return await graph.aget_state(config)
+
+    state = asyncio.run(scenario())
+
+    assert len(prompt_sizes) == 100
+    assert max(prompt_sizes[20:]) <= max(prompt_sizes[:20])
+    assert len(state.values["messages"]) <= (4 + 2) * 4
+    assert state.values["summary"]
+
+
+def test_checkpointer_memory_soak(database):
+    """
+    Test that the database checkpointer keeps a bounded number of checkpoints per
+    thread, that its memory stops growing once its cache is full, and that idle
+    threads are expired by its background sweep.
+    """
+    import tracemalloc
+    from typing_extensions import TypedDict
+    from langgraph.graph import StateGraph, START, END
+    from database.models import GraphCheckpoint, GraphCheckpointWrite
+
+    class Turn(TypedDict):
+        question: str
+        answer: str
+
+    def answer(state: Turn) -> dict:
+        return {"answer": f"{state['question']} " * 100}
+
+    builder = StateGraph(Turn)
+    builder.add_node("answer", answer)
+    builder.add_edge(START, "answer")
+    builder.add_edge("answer", END)
+
+    checkpointer = DatabaseCheckpointer(database.session_factory, keep=2, ttl=None, cache_size=16)
+    graph = builder.compile(checkpointer=checkpointer)
+    threads = 100
+
+    async def run_round(round_number: int) -> None:
+        for thread in range(threads):
+            config = {"configurable": {"thread_id": f"thread-{thread}"}}
+            await graph.ainvoke({"question": f"question {round_number}"}, config)
+
+    async def scenario():
+        await database.create_tables(GraphCheckpoint, GraphCheckpointWrite)
+
+        for round_number in range(2):
+            await run_round(round_number)
+        tracemalloc.start()
+        baseline = tracemalloc.take_snapshot()
+        for round_number in range(2, 10):
+            await run_round(round_number)
+        # SQLAlchemy's compiled statement cache fills at its own pace and is bounded
+        # by the engine, it is not part of the checkpointer's footprint
+        engine_caches = [tracemalloc.Filter(False, "*/sqlalchemy/*")]
+        growth = sum(
+            stat.size_diff
+            for stat in tracemalloc.take_snapshot().filter_traces(engine_caches).compare_to(
+                baseline.filter_traces(engine_caches), "filename"
+            )
+        )
+        tracemalloc.stop()
+
+        state = await graph.aget_state({"configurable": {"thread_id": "thread-0"}})
+        counts = (await database.count(GraphCheckpoint, thread_id="thread-0"), await database.count(GraphCheckpoint))
+        cached = len(checkpointer._cache)
+
+        checkpointer.ttl, checkpointer.sweep_interval = 0, 0.05
+        await checkpointer.start()
+        await asyncio.sleep(0.5)
+        await checkpointer.stop()
+        remaining = (await database.count(GraphCheckpoint), await database.count(GraphCheckpointWrite))
+        return growth, state, counts, cached, remaining
+
+    growth, state, counts, cached, remaining = asyncio.run(scenario())
+
+    assert state.values["answer"].startswith("question 9 ")
+    assert counts == (2, 2 * threads)
+    assert cached == 16
+    assert growth < 512 * 1024
+    assert remaining == (0, 0)
+    assert checkpointer._cache == {}
+    with pytest.raises(NotImplementedError, match="aget_tuple"):
+        graph.get_state({"configurable": {"thread_id": "thread-0"}})
+
+
+def test_chat_log_batches_and_drops(database):
+    """
+    Test that the chat log writer inserts messages in batches, flushes the rest on
+    stop, and drops messages without blocking when the database falls behind.
+    """
+    from database.models import ChatMessage
+
+    class SlowSession:
+        def __init__(self):
+            self.session = database.session_factory()
+
+        async def __aenter__(self):
+            await asyncio.sleep(0.5)
+            return await self.session.__aenter__()
+
+        async def __aexit__(self, *exc_info):
+            return await self.session.__aexit__(*exc_info)
+
+    def log(service: ChatService, count: int) -> float:
+        start_time = time.perf_counter()
+        for i in range(count):
+            service.log_chat_message(thread_id=f"thread-{i % 7}", question="q", answer="a", latency_ms=1.0)
+        return time.perf_counter() - start_time
+
+    async def scenario():
+        await database.create_tables(ChatMessage)
+
+        service = ChatService(database.session_factory, max_queue_size=1000, batch_size=100, flush_interval_ms=50)
+        await service.start()
+        log(service, 250)
+        await asyncio.sleep(0.2)
+        log(service, 30)
+        await service.stop()
+        batched = (service.written, service.dropped)
+
+        slow = ChatService(SlowSession, max_queue_size=50, batch_size=10, flush_interval_ms=10)
+        await slow.start()
+        elapsed = log(slow, 500)
+        await slow.stop()
+        degraded = (slow.written, slow.dropped, elapsed)
+
+        return batched, degraded, await database.count(ChatMessage)
+
+    batched, degraded, rows = asyncio.run(scenario())
+
+    assert batched == (280, 0)
+    written, dropped, elapsed = degraded
+    assert written + dropped == 500
+    assert dropped >= 500 - 50 - 10
+    assert elapsed < 0.5
+    assert rows == 280 + written
+
+
+def test_sqlite_engine_tuning(database):
+    """
+    Test that engines built for SQLite apply the configured pragmas on connect and
+    that the pool connections are exported as metrics.
+    """
+    from prometheus_client import REGISTRY
+    from sqlalchemy import text
+    from database import engine as app_engine
+    from database.database import observe_pool
+
+    observe_pool(database.engine)
+
+    def checked_out() -> float:
+        return REGISTRY.get_sample_value("db_pool_connections", {"state": "checked_out"})
+
+    async def scenario():
+        async with database.engine.connect() as conn:
+            pragmas = [
+                (await conn.execute(text(f"PRAGMA {name}"))).scalar()
+                for name in ("journal_mode", "synchronous", "busy_timeout")
+            ]
+            in_use = checked_out()
+        return pragmas, in_use
+
+    pragmas, in_use = asyncio.run(scenario())
+    observe_pool(app_engine)
+
+    assert pragmas == ["wal", 1, 5000]
+    assert in_use == 1
+
+
+def test_list_documents_pages(database):
+    """
+    Test that /list_documents pages through every document once with keyset
+    cursors, filters by file type, and answers a matching If-None-Match with 304.
+    """
+    import datetime
+    from sqlalchemy import insert
+    from database.models import Document
+
+    uploaded = datetime.datetime(2026, 1, 1)
+
+    async def setup():
+        await database.create_tables(Document)
+        async with database.engine.begin() as conn:
+            await conn.execute(
+                insert(Document),
+                [
+                    dict(
+                        filename=f"doc-{i}",
+                        file_type=".pdf" if i % 3 == 0 else ".txt",
+                        file_path=f"/tmp/doc-{i}",
+                        file_size=i,
+                        # pairs of documents share an upload date, so pages break on the id
+                        upload_date=uploaded + datetime.timedelta(minutes=i // 2),
+                    )
+                    for i in range(25)
+                ],
+            )
+
+    asyncio.run(setup())
+    database.serve()
+    ids, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/v1/list_documents", params=params).json()
+        ids += [document["id"] for document in page["documents"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    first = client.get("/api/v1/list_documents", params={"limit": 10})
+    not_modified = client.get(
+        "/api/v1/list_documents", params={"limit": 10}, headers={"If-None-Match": first.headers["ETag"]}
+    )
+    pdfs = client.get("/api/v1/list_documents", params={"file_type": ".pdf"}).json()
+    bad_cursor = client.get("/api/v1/list_documents", params={"cursor": "not-a-cursor"})
+
+    assert pages == 3
+    assert ids == list(range(25, 0, -1))
+    assert first.json()["total_count"] == 25
+    assert not_modified.status_code == 304
+    assert pdfs["total_count"] == 9
+    assert all(document["file_type"] == ".pdf" for document in pdfs["documents"])
+    assert bad_cursor.status_code == 400
+
+
+def test_assistant_stage_metrics():
+    """
+    Test that every LLM call of the assistant is timed, that empty answers count as
+    retries, that reported token usage is counted, and that timing a stage is cheap.
+    """
+    from prometheus_client import REGISTRY
+    from utils.metrics import LLM_CALL_SECONDS
+
+    answers = iter([
+        AIMessage(content=""),
+        AIMessage(content="done", usage_metadata={"input_tokens": 12, "output_tokens": 3, "total_tokens": 15}),
+    ])
+    assistant = Assistant(RunnableLambda(lambda state: next(answers)))
+
+    def sample(name: str, labels: dict = None) -> float:
+        return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+    names = [
+        ("rag_stage_seconds_count", {"stage": "llm_call"}),
+        ("assistant_empty_output_retries_total", None),
+        ("llm_tokens_total", {"direction": "input"}),
+        ("llm_tokens_total", {"direction": "output"}),
+    ]
+    before = [sample(name, labels) for name, labels in names]
+    result = asyncio.run(assistant({"messages": [("user", "hi")]}, {}))
+    deltas = [sample(name, labels) - value for (name, labels), value in zip(names, before)]
+
+    iterations = 10000
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        with LLM_CALL_SECONDS.time():
+            pass
+    overhead = (time.perf_counter() - start_time) / iterations
+
+    assert result["messages"].content == "done"
+    assert deltas == [2, 1, 12, 3]
+    assert overhead < 50e-6
+
+
+def test_request_trace(database, span_exporter):
+    """
+    Test that a request is traced as one trace: the route span continues the
+    client's traceparent and the SQL statements run for it are its children.
+    """
+    from database.models import Document
+    from utils.tracing import instrument_engine
+
+    exporter = span_exporter
+    instrument_engine(database.engine.sync_engine)
+
+    asyncio.run(database.create_tables(Document))
+    exporter.clear()
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    database.serve()
+    response = client.get(
+        "/api/v1/list_documents",
+        headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"},
+    )
+    unsampled = len(exporter.get_finished_spans())
+    client.get("/")
+
+    spans = exporter.get_finished_spans()
+    route = next(span for span in spans if span.name == "GET /api/v1/list_documents")
+    queries = [span for span in spans if span.attributes.get("db.system") == "sqlite"]
+
+    assert response.status_code == 200
+    assert format(route.context.trace_id, "032x") == trace_id
+    assert route.attributes["http.route"] == "/api/v1/list_documents"
+    assert route.attributes["http.response.status_code"] == 200
+    assert queries and all(span.context.trace_id == route.context.trace_id for span in queries)
+    # without a sampled parent, the 0 ratio drops the health check's trace
+    assert len(spans) == unsampled
+
+
+def test_answer_cache_first_turn_only(monkeypatch):
+    """
+    Test that the answer cache only serves the first question of a thread, records
+    a cached answer in the thread's history, and that a failed turn is neither
+    answered nor logged.
+    """
+    from langchain_core.embeddings import Embeddings
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.graph import StateGraph, START, END
+    import routes.routes as routes
+    from agent import get_agent_graph
+    from agent.state import State
+    from service.chat_service import get_chat_service
+    from utils import get_chroma_vector_store
+    from utils.answer_cache import AnswerCache
+
+    class WordEmbeddings(Embeddings):
+        vocabulary = ["what", "about", "the", "first", "second", "one"]
+
+        def embed_documents(self, texts):
+            return [self.embed_query(text) for text in texts]
+
+        def embed_query(self, text):
+            words = text.lower().rstrip("?").split()
+            return [float(words.count(word)) for word in self.vocabulary] + [1.0]
+
+    calls = []
+
+    def assistant(state) -> AIMessage:
+        calls.append(len(state["messages"]))
+        return AIMessage(content=f"answer {len(calls)}")
+
+    builder = StateGraph(State)
+    builder.add_node("assistant", Assistant(RunnableLambda(assistant)))
+    builder.add_edge(START, "assistant")
+    builder.add_edge("assistant", END)
+    graph = builder.compile(checkpointer=MemorySaver())
+
+    class ChatLog:
+        def __init__(self):
+            self.answers = []
+
+        def log_chat_message(self, thread_id, question, answer, latency_ms=None):
+            self.answers.append((thread_id, answer))
+            return True
+
+    chat_log = ChatLog()
+    monkeypatch.setattr(routes, "answer_cache", AnswerCache(WordEmbeddings(), threshold=0.99))
+    app.dependency_overrides[get_agent_graph] = lambda: graph
+    app.dependency_overrides[get_chroma_vector_store] = lambda: None
+    app.dependency_overrides[get_chat_service] = lambda: chat_log
+
+    def ask(thread_id: str, question: str) -> dict:
+        return client.post("/api/v1/query", json={"thread_id": thread_id, "question": question}).json()
+
+    try:
+        first = ask("a", "What about the first one?")
+        reused = ask("b", "What about the first one?")
+        follow_up = ask("b", "What about the first one?")
+        other_thread = ask("a", "What about the first one?")
+
+        async def failed_turn(**kwargs):
+            return None, {}
+
+        monkeypatch.setattr(routes, "get_chat_response", failed_turn)
+        failed = client.post("/api/v1/query", json={"thread_id": "c", "question": "What about the second one?"})
+    finally:
+        for dependency in (get_agent_graph, get_chroma_vector_store, get_chat_service):
+            app.dependency_overrides.pop(dependency, None)
+
+    history = asyncio.run(graph.aget_state({"configurable": {"thread_id": "b"}})).values["messages"]
+
+    assert (first["response"], first["cached"]) == ("answer 1", False)
+    assert (reused["response"], reused["cached"]) == ("answer 1", True)
+    # the follow-up in b sees the cached exchange in its history, and is not served from the cache
+    assert (follow_up["response"], follow_up["cached"]) == ("answer 2", False)
+    assert (other_thread["response"], other_thread["cached"]) == ("answer 3", False)
+    assert calls == [1, 3, 3]
+    assert [message.content for message in history] == [
+        "What about the first one?", "answer 1", "What about the first one?", "answer 2",
+    ]
+    assert failed.status_code == 500
+    assert chat_log.answers == [("a", "answer 1"), ("b", "answer 1"), ("b", "answer 2"), ("a", "answer 3")]
+
+
+def test_query_stream_events(database):
+    """
+    Test that /query/stream sends the answer token by token while the model runs on
+    the inference executor, with tool_start and tool_end events around the tool
+    call and a final done event, and that the exchange is logged after it.
+    """
+    import json
+    from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+    from langchain_core.messages import AIMessageChunk, ToolMessage
+    from langchain_core.outputs import ChatGenerationChunk
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.tools import tool
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.graph import StateGraph, START
+    from langgraph.prebuilt import tools_condition
+    from agent import get_agent_graph
+    from agent.graph import create_tool_node_with_fallback
+    from agent.state import State
+    from database.models import ChatMessage
+    from service.chat_service import get_chat_service
+    from utils import get_chroma_vector_store
+
+    class StreamingChatModel(BaseChatModel):
+        """Calls the lookup tool, then answers with the tool's result, a word at a time"""
+
+        @property
+        def _llm_type(self) -> str:
+            return "streaming-fake"
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            if isinstance(messages[-1], ToolMessage):
+                words, tool_call_chunks = ["Scans ", "take ", "a ", "minute."], []
+            else:
+                words = ["Checking."]
+                tool_call_chunks = [{"name": "lookup", "args": json.dumps({"query": "scans"}), "id": "call-1", "index": 0}]
+            for i, word in enumerate(words):
+                chunk = ChatGenerationChunk(
+                    message=AIMessageChunk(content=word, tool_call_chunks=tool_call_chunks if i == len(words) - 1 else [])
+                )
+                if run_manager:
+                    run_manager.on_llm_new_token(word, chunk=chunk)
+                yield chunk
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            return generate_from_stream(self._stream(messages, stop, **kwargs))
+
+    @tool
+    def lookup(query: str) -> str:
+        """Look up a query."""
+        return "Scans take a minute."
+
+    prompt = ChatPromptTemplate.from_messages([("system", "Answer.{summary}"), ("placeholder", "{messages}")])
+    executor = InferenceExecutor(workers=1, max_queue=4, queue_timeout=10)
+    builder = StateGraph(State)
+    builder.add_node("assistant", Assistant(prompt | StreamingChatModel(), executor=executor))
+    builder.add_node("tools", create_tool_node_with_fallback([lookup]))
+    builder.add_edge(START, "assistant")
+    builder.add_conditional_edges("assistant", tools_condition)
+    builder.add_edge("tools", "assistant")
+    graph = builder.compile(checkpointer=MemorySaver())
+    chat = ChatService(database.session_factory, flush_interval_ms=1)
+
+    app.dependency_overrides[get_agent_graph] = lambda: graph
+    app.dependency_overrides[get_chroma_vector_store] = lambda: None
+    app.dependency_overrides[get_chat_service] = lambda: chat
+
+    async def scenario():
+        await database.create_tables(ChatMessage)
+        await chat.start()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            response = await async_client.post("/api/v1/query/stream", json={"thread_id": "s", "question": "How long do scans take?"})
+        await chat.stop()
+        async with database.session_factory() as session:
+            rows = (await session.execute(select(ChatMessage))).scalars().all()
+        return response, rows
+
+    try:
+        response, rows = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+        for dependency in (get_agent_graph, get_chroma_vector_store, get_chat_service):
+            app.dependency_overrides.pop(dependency, None)
+
+    events = []
+    for message in response.text.strip().split("\n\n"):
+        event, data = message.split("\n", 1)
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    names = [name for name, _ in events]
+    done = events[-1][1]
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert names == ["token", "tool_start", "tool_end", "token", "token", "token", "token", "done"]
+    assert [data["content"] for name, data in events if name == "token"] == ["Checking.", "Scans ", "take ", "a ", "minute."]
+    assert (events[1][1]["name"], events[1][1]["args"], events[2][1]["content"]) == ("lookup", {"query": "scans"}, "Scans take a minute.")
+    assert done["response"] == "Scans take a minute."
+    assert done["tokens"] == 5
+    assert done["ttft_ms"] is not None and done["ttft_ms"] <= done["latency_ms"]
+    assert [(row.thread_id, row.question, row.answer) for row in rows] == [("s", "How long do scans take?", "Scans take a minute.")]
+    assert rows[0].latency_ms == pytest.approx(done["latency_ms"])
+
+
+def test_add_missing_columns(database):
+    """
+    Test that the startup migration adds the columns added to the documents table
+    since it was created, filling them in for the existing rows.
+    """
+    from sqlalchemy import text
+    from database.database import add_missing_columns
+    from database.models import Document
+
+    async def scenario():
+        async with database.engine.begin() as conn:
+            await conn.execute(text(
+                "CREATE TABLE documents (id INTEGER PRIMARY KEY, filename VARCHAR(255) NOT NULL, "
+                "file_type VARCHAR(50) NOT NULL, file_path VARCHAR(500) NOT NULL, upload_date DATETIME, "
+                "file_size INTEGER)"
+            ))
+            await conn.execute(text(
+                "INSERT INTO documents (filename, file_type, file_path, file_size) "
+                "VALUES ('old.txt', '.txt', '/tmp/old.txt', 3)"
+            ))
+            await conn.run_sync(add_missing_columns)
+            # a second run finds nothing to add
+            await conn.run_sync(add_missing_columns)
+
+        async with database.session_factory() as session:
+            session.add(Document(filename="new.txt", file_type=".txt", file_path="/tmp/new.txt", file_size=3))
+            await session.commit()
+            documents = (await session.execute(select(Document).order_by(Document.id))).scalars().all()
+            return [(document.filename, document.status, document.content_hash) for document in documents]
+
+    assert asyncio.run(scenario()) == [("old.txt", "indexed", None), ("new.txt", "queued", None)]
+
+
+def test_upload_dedup_by_content(database, tmp_path, monkeypatch):
+    """
+    Test that uploads with the same content, under any extension and in or across
+    batches, share one document's file and ingestion job instead of being ingested
+    again, and that no extra copy of the file is left in storage.
+    """
+    import routes.routes as routes
+    from database.models import Document, IngestionJob
+    from service.ingestion_service import IngestionService, get_ingestion_service
+
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    monkeypatch.setattr(routes, "UPLOAD_DIR", upload_dir)
+    ingestion = IngestionService(workers=0, max_queue_size=10)
+    app.dependency_overrides[get_ingestion_service] = lambda: ingestion
+    asyncio.run(database.create_tables(Document, IngestionJob))
+    database.serve()
+
+    try:
+        first = client.post("/api/v1/upload", files={"file": ("notes.txt", b"same content")}).json()
+        renamed = client.post("/api/v1/upload", files={"file": ("notes.md", b"same content")}).json()
+        batch = client.post(
+            "/api/v1/upload/batch",
+            files=[
+                ("files", ("report.md", b"other content")),
+                ("files", ("report.txt", b"other content")),
+                ("files", ("copy.json", b"same content")),
+            ],
+        ).json()
+    finally:
+        app.dependency_overrides.pop(get_ingestion_service, None)
+
+    async def stored():
+        async with database.session_factory() as session:
+            documents = (await session.execute(select(Document).order_by(Document.id))).scalars().all()
+            return [(document.filename, document.file_path) for document in documents]
+
+    documents = dict(asyncio.run(stored()))
+    files = sorted(str(path) for path in upload_dir.rglob("*") if path.is_file())
+
+    assert renamed["job_id"] == first["job_id"]
+    assert renamed["document_id"] != first["document_id"]
+    assert (batch["accepted"], batch["duplicates"], batch["rejected"]) == (1, 2, 0)
+    assert batch["files"][2]["job_id"] == first["job_id"]
+    assert documents["notes.md"] == documents["copy.json"] == documents["notes.txt"]
+    assert documents["report.txt"] == documents["report.md"]
+    assert files == sorted([documents["notes.txt"], documents["report.md"]])
+    assert ingestion.queue.qsize() == 2
+
+
+def test_bulk_ingestion_failures(database, vector_store, tmp_path, monkeypatch):
+    """
+    Test that a file failing after it was chunked leaves no vectors behind in a bulk
+    ingestion, and that after a failed write the bulk writer rejects every further
+    chunk and only counts the chunks actually written.
+    """
+    import importlib
+    # the service package re-exports the ingestion_service instance under the module name
+    ingestion_module = importlib.import_module("service.ingestion_service")
+    from database.models import Document, IngestionJob
+    from service.ingestion_service import IngestionService
+    from utils.chroma_store import Chunk
+
+    class FlakyCollection:
+        def __init__(self, collection, fail_on: int):
+            self.collection = collection
+            self.fail_on = fail_on
+            self.upserts = 0
+
+        def upsert(self, **kwargs):
+            self.upserts += 1
+            if self.upserts == self.fail_on:
+                raise RuntimeError("disk full")
+            return self.collection.upsert(**kwargs)
+
+        def __getattr__(self, name):
+            return getattr(self.collection, name)
+
+    monkeypatch.setattr(ingestion_module, "SessionLocal", database.session_factory)
+    monkeypatch.setattr(ingestion_module, "get_chroma_vector_store", lambda: vector_store)
+
+    index_pages = IngestionService._index_pages
+
+    async def index_then_break(self, db, job, document, indexer):
+        chunk_count = await index_pages(self, db, job, document, indexer)
+        if document.filename == "broken.txt":
+            raise ValueError("broken after chunking")
+        return chunk_count
+
+    monkeypatch.setattr(IngestionService, "_index_pages", index_then_break)
+
+    async def scenario():
+        await database.create_tables(Document, IngestionJob)
+        async with database.session_factory() as session:
+            documents = []
+            for name in ("good.txt", "broken.txt"):
+                path = tmp_path / name
+                path.write_text(" ".join(f"{name} sentence {i}." for i in range(20)))
+                documents.append(Document(filename=name, file_type=".txt", file_path=str(path), file_size=path.stat().st_size))
+            session.add_all(documents)
+            await session.flush()
+            jobs = [IngestionJob(document_id=document.id) for document in documents]
+            session.add_all(jobs)
+            await session.commit()
+
+        await IngestionService().process_batch([job.id for job in jobs])
+        async with database.session_factory() as session:
+            statuses = [(await session.get(Document, document.id)).status for document in documents]
+        indexed = [len(chunk_ids(vector_store, document.id)) for document in documents]
+
+        monkeypatch.setattr(
+            vector_store.chroma, "_chroma_collection", FlakyCollection(vector_store.chroma._collection, fail_on=2)
+        )
+        writer = vector_store.bulk_writer()
+        writer.batch_size = 2
+        indexer = vector_store.indexer(100, "flaky.txt", writer=writer)
+        await indexer.begin()
+        await indexer.add([Chunk(text=f"chunk {i}", page=0, offset=i) for i in range(5)])
+        with pytest.raises(RuntimeError):
+            await indexer.commit()
+        with pytest.raises(RuntimeError):
+            await writer.add(["late"], ["late chunk"], [{"document_id": 101}])
+        with pytest.raises(RuntimeError):
+            await writer.flush()
+        return statuses, indexed, writer.written, indexer.stats["added"], len(chunk_ids(vector_store, 100)) + len(chunk_ids(vector_store, 101))
+
+    statuses, indexed, written, added, flaky_chunks = asyncio.run(scenario())
+
+    assert statuses == ["indexed", "failed"]
+    assert indexed[0] > 0 and indexed[1] == 0
+    assert (written, added, flaky_chunks) == (2, 0, 2)
+
+
+def test_delete_and_reindex_shared_vectors(database, vector_store, tmp_path, monkeypatch):
+    """
+    Test that deleting or re-indexing with a new file a document whose vectors are
+    shared by a duplicate leaves the duplicate its vectors, that a failed delete
+    can be retried, and that a document with a job in flight is neither deleted nor
+    re-indexed.
+    """
+    import routes.routes as routes
+    from database.models import Document, IngestionJob, JobStatus
+    from service.ingestion_service import IngestionService, get_ingestion_service
+    from utils.chroma_store import Chunk
+
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    monkeypatch.setattr(routes, "UPLOAD_DIR", upload_dir)
+    app.dependency_overrides[get_ingestion_service] = lambda: IngestionService(workers=0, max_queue_size=10)
+    shared_file = upload_dir / "shared.txt"
+    shared_file.write_text("shared content")
+    chunks = [Chunk(text=f"shared chunk {i}", page=0, offset=i) for i in range(3)]
+
+    async def setup():
+        await database.create_tables(Document, IngestionJob)
+        async with database.session_factory() as session:
+            documents = [
+                Document(
+                    filename=name, file_type=".txt", file_path=str(shared_file), file_size=14,
+                    content_hash="shared", status=status,
+                )
+                for name, status in (
+                    ("a.txt", "indexed"), ("b.txt", "indexed"), ("c.txt", "indexed"), ("busy.txt", "parsing"),
+                )
+            ]
+            documents[3].content_hash, documents[3].file_path = "busy", str(upload_dir / "busy.txt")
+            session.add_all(documents)
+            await session.flush()
+            session.add(IngestionJob(document_id=documents[3].id, status=JobStatus.PARSING.value))
+            await session.commit()
+        await vector_store.index_chunks(documents[0].id, "a.txt", chunks)
+        return [document.id for document in documents]
+
+    a, b, c, busy = asyncio.run(setup())
+    database.serve()
+
+    try:
+        reindexed = client.post(f"/api/v1/documents/{a}/reindex", files={"file": ("a.txt", b"new content")})
+        moved_to_b = (len(chunk_ids(vector_store, a)), len(chunk_ids(vector_store, b)))
+
+        delete_document = vector_store.delete_document
+
+        async def failing_delete(document_id):
+            raise RuntimeError("chroma unavailable")
+
+        monkeypatch.setattr(vector_store, "delete_document", failing_delete)
+        deleted_b = client.delete(f"/api/v1/documents/{b}")
+        moved_to_c = (len(chunk_ids(vector_store, b)), len(chunk_ids(vector_store, c)))
+        failed_c = client.delete(f"/api/v1/documents/{c}")
+        c_after_failure = asyncio.run(database.count(Document, id=c, status="deleting"))
+        monkeypatch.setattr(vector_store, "delete_document", delete_document)
+        retried_c = client.delete(f"/api/v1/documents/{c}")
+
+        busy_delete = client.delete(f"/api/v1/documents/{busy}")
+        busy_reindex = client.post(f"/api/v1/documents/{busy}/reindex")
+    finally:
+        app.dependency_overrides.pop(get_ingestion_service, None)
+
+    assert reindexed.status_code == 202
+    assert moved_to_b == (0, 3)
+    assert (deleted_b.status_code, deleted_b.json()["chunks_deleted"]) == (200, 0)
+    assert moved_to_c == (0, 3)
+    assert (failed_c.status_code, c_after_failure) == (500, 1)
+    assert (retried_c.status_code, retried_c.json()["chunks_deleted"]) == (200, 3)
+    assert len(chunk_ids(vector_store, c)) == 0
+    assert not shared_file.exists()
+    assert (busy_delete.status_code, busy_reindex.status_code) == (409, 409)
+    assert asyncio.run(database.count(Document)) == 2
+
+
+def test_reindex_with_content_of_another_document(database, vector_store, tmp_path, monkeypatch):
+    """
+    Test that re-indexing a document with a file whose content another document
+    already holds reuses that document's file and vectors without a job, so the
+    other document is not ingested again.
+    """
+    import hashlib
+    import routes.routes as routes
+    from database.models import Document, IngestionJob
+    from service.ingestion_service import IngestionService, get_ingestion_service
+    from utils.chroma_store import Chunk
+
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    monkeypatch.setattr(routes, "UPLOAD_DIR", upload_dir)
+    ingestion = IngestionService(workers=0, max_queue_size=10)
+    app.dependency_overrides[get_ingestion_service] = lambda: ingestion
+    files = {name: upload_dir / f"{name}.txt" for name in ("x", "y")}
+    for name, path in files.items():
+        path.write_text(f"{name} content")
+
+    async def setup():
+        await database.create_tables(Document, IngestionJob)
+        async with database.session_factory() as session:
+            documents = [
+                Document(
+                    filename=path.name, file_type=".txt", file_path=str(path), file_size=9,
+                    content_hash=hashlib.sha256(path.read_bytes()).hexdigest(), status="indexed",
+                )
+                for path in files.values()
+            ]
+            session.add_all(documents)
+            await session.commit()
+        for document in documents:
+            await vector_store.index_chunks(
+                document.id, document.filename, [Chunk(text=f"{document.filename} chunk {i}", page=0, offset=i) for i in range(2)]
+            )
+        return [document.id for document in documents]
+
+    x, y = asyncio.run(setup())
+    database.serve()
+
+    try:
+        response = client.post(f"/api/v1/documents/{y}/reindex", files={"file": ("y.txt", b"x content")})
+    finally:
+        app.dependency_overrides.pop(get_ingestion_service, None)
+
+    async def stored():
+        async with database.session_factory() as session:
+            return [await session.get(Document, document_id) for document_id in (x, y)]
+
+    document_x, document_y = asyncio.run(stored())
+
+    assert response.status_code == 202
+    assert (response.json()["job_id"], response.json()["status"]) == (None, "indexed")
+    assert (document_y.content_hash, document_y.file_path) == (document_x.content_hash, document_x.file_path)
+    assert document_x.status == "indexed"
+    assert (len(chunk_ids(vector_store, x)), len(chunk_ids(vector_store, y))) == (2, 0)
+    assert sorted(path.name for path in upload_dir.rglob("*") if path.is_file()) == ["x.txt"]
+    assert asyncio.run(database.count(IngestionJob)) == 0
+    assert ingestion.queue.qsize() == 0
+
+
+def test_ingestion_start_requeues_beyond_capacity(database, monkeypatch):
+    """
+    Test that on start every unfinished job is queued again, the ones beyond the
+    queue's capacity as it drains.
+    """
+    import importlib
+    # the service package re-exports the ingestion_service instance under the module name
+    ingestion_module = importlib.import_module("service.ingestion_service")
+    from database.models import Document, IngestionJob
+    from service.ingestion_service import IngestionService
+
+    monkeypatch.setattr(ingestion_module, "SessionLocal", database.session_factory)
+
+    async def scenario():
+        await database.create_tables(Document, IngestionJob)
+        async with database.session_factory() as session:
+            document = Document(filename="a.txt", file_type=".txt", file_path="/tmp/a.txt", file_size=1)
+            session.add(document)
+            await session.flush()
+            session.add_all(
+                IngestionJob(document_id=document.id, status=status)
+                for status in ("queued", "parsing", "indexed", "embedding", "queued", "failed", "chunking")
+            )
+            await session.commit()
+
+        ingestion = IngestionService(workers=0, max_queue_size=2)
+        await ingestion.start()
+        queued_at_start = ingestion.queue.qsize()
+        job_ids = [(await asyncio.wait_for(ingestion.queue.get(), 1))[0] for _ in range(5)]
+        await ingestion.stop()
+        return queued_at_start, job_ids
+
+    queued_at_start, job_ids = asyncio.run(scenario())
+
+    assert queued_at_start == 2
+    assert job_ids == [1, 2, 4, 5, 7]
+
+
+def test_hybrid_retriever_rrf_fusion():
+    """
+    Test that dense and lexical rankings are fused by weighted reciprocal rank, that
+    chunks found by both searches come first, and that a weight of 0 turns a search off.
+    """
+    from types import SimpleNamespace
+    from langchain_core.documents import Document
+    from utils.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], [1.0, 1.0], rrf_k=60)
+    assert list(fused) == ["c", "a", "b", "d"]
+    assert fused["c"] == pytest.approx(1 / 63 + 1 / 61)
+    assert list(reciprocal_rank_fusion([["a", "b"], ["b", "a"]], [1.0, 3.0])) == ["b", "a"]
+
+    texts = {chunk_id: f"text {chunk_id}" for chunk_id in "abcd"}
+    collection = SimpleNamespace(
+        get=lambda ids, include: {
+            "ids": ids, "documents": [texts[i] for i in ids], "metadatas": [{"chunk_id": i} for i in ids],
+        }
+    )
+    vector_store = SimpleNamespace(
+        chroma=SimpleNamespace(
+            _collection=collection,
+            similarity_search=lambda query, k: [Document(id=i, page_content=texts[i]) for i in "abc"][:k],
+        ),
+        lexical_index=SimpleNamespace(search=lambda query, k: [("c", 7.5), ("d", 2.0)][:k]),
+    )
+
+    retriever = HybridRetriever(vector_store=vector_store, k=2, fetch_k=3, search_type="similarity", score_threshold=None)
+    documents = asyncio.run(retriever.ainvoke("query"))
+    assert [document.id for document in documents] == ["c", "a"]
+    assert documents[0].page_content == "text c"
+    assert documents[0].metadata["score"] == pytest.approx(1 / 63 + 1 / 61)
+
+    dense_only = HybridRetriever(
+        vector_store=vector_store, k=3, fetch_k=3, lexical_weight=0.0, search_type="similarity", score_threshold=None
+    )
+    assert [document.id for document in dense_only.invoke("query")] == ["a", "b", "c"]
+
+
+def test_batched_pipeline_shares_batches():
+    """
+    Test that concurrent generations share one pipeline call and each get their own
+    text back, with the prompt skipped, stop sequences applied and max_new_tokens
+    capped, and that a call with its own pipeline_kwargs runs on its own.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.batching import BatchedHuggingFacePipeline, MicroBatcher, truncate_at_stop
+
+    assert truncate_at_stop("a STOP b END c", ["END", "STOP"]) == "a "
+    assert truncate_at_stop("no stop here", ["END"]) == "no stop here"
+
+    batch_sizes = []
+
+    def double(items):
+        batch_sizes.append(len(items))
+        if "fail" in items:
+            raise ValueError("bad item")
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=200)
+    with ThreadPoolExecutor(4) as threads:
+        results = list(threads.map(lambda item: batcher.submit(item).result(), ["a", "b", "c", "d"]))
+    failed = batcher.submit("fail")
+    with pytest.raises(ValueError):
+        failed.result(timeout=5)
+    batcher.shutdown()
+    assert results == ["aa", "bb", "cc", "dd"]
+    assert batch_sizes == [4, 1]
+
+    class StubPipeline:
+        task = "text-generation"
+
+        def __init__(self):
+            self.calls = []
+
+        def __call__(self, prompts, **kwargs):
+            self.calls.append((len(prompts), kwargs.get("max_new_tokens")))
+            return [[{"generated_text": f"{prompt} -> {prompt.upper()} STOP extra"}] for prompt in prompts]
+
+    pipeline = StubPipeline()
+    llm = BatchedHuggingFacePipeline(
+        pipeline=pipeline, model_id="stub", batch_size=4, max_wait_ms=200,
+        max_new_tokens_cap=16, pipeline_kwargs={"max_new_tokens": 64},
+    )
+
+    def generate(prompt):
+        return llm._generate([prompt], stop=["STOP"], skip_prompt=True).generations[0][0].text
+
+    try:
+        with ThreadPoolExecutor(4) as threads:
+            texts = list(threads.map(generate, ["a", "b", "c", "d"]))
+        own = llm._generate(["e"], pipeline_kwargs={"max_new_tokens": 5}).generations[0][0].text
+        llm.pipeline_kwargs = {"max_new_tokens": 8}
+        llm._generate(["f"])
+    finally:
+        llm.shutdown_batcher()
+
+    assert texts == [" -> A ", " -> B ", " -> C ", " -> D "]
+    assert own == "e -> E STOP extra"
+    assert pipeline.calls == [(4, 16), (1, 5), (1, 8)]
+
+
+def test_embedding_cache_tiers(tmp_path):
+    """
+    Test that the embedding cache serves repeats from memory, vectors of an earlier
+    instance from its SQLite file, embeds duplicates within a batch once and keeps
+    query vectors apart from document vectors.
+    """
+    from langchain_core.embeddings import Embeddings
+    from utils.embedding_cache import CachedEmbeddings
+
+    class CountingEmbeddings(Embeddings):
+        def __init__(self):
+            self.embedded = []
+
+        def embed_documents(self, texts):
+            self.embedded += texts
+            return [[float(len(text)), 1.0] for text in texts]
+
+        def embed_query(self, text):
+            self.embedded.append(text)
+            return [float(len(text)), 2.0]
+
+    path = str(tmp_path / "embeddings.db")
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings(model, model_name="counting", normalize=True, path=path)
+
+    first = cache.embed_documents(["alpha", "beta", "alpha"])
+    again = cache.embed_documents(["beta", "alpha"])
+    assert first == [[5.0, 1.0], [4.0, 1.0], [5.0, 1.0]]
+    assert again == [[4.0, 1.0], [5.0, 1.0]]
+    assert model.embedded == ["alpha", "beta"]
+    assert cache.stats() == {"memory_hits": 2, "disk_hits": 0, "misses": 2, "memory_items": 2}
+
+    assert cache.embed_query("alpha") == [5.0, 2.0]
+    assert model.embedded == ["alpha", "beta", "alpha"]
+    cache.close()
+
+    reopened = CachedEmbeddings(model, model_name="counting", normalize=True, path=path)
+    assert reopened.embed_documents(["alpha", "beta"]) == [[5.0, 1.0], [4.0, 1.0]]
+    assert reopened.embed_query("alpha") == [5.0, 2.0]
+    assert reopened.embed_query("alpha") == [5.0, 2.0]
+    assert reopened.stats() == {"memory_hits": 1, "disk_hits": 3, "misses": 0, "memory_items": 3}
+
+    other_model = CachedEmbeddings(model, model_name="other", normalize=True, path=path)
+    other_model.embed_documents(["alpha"])
+    assert other_model.stats()["misses"] == 1
+    for instance in (reopened, other_model):
+        instance.close()
+
+
+def test_parser_pool_recovers():
+    """
+    Test that a parse running past the timeout raises ParseTimeout and has its
+    workers killed, that a worker dying is retried once then reported, and that
+    the pool serves the next calls, recycling its workers, after both.
+    """
+    import os
+    from concurrent.futures.process import BrokenProcessPool
+    from utils.parsing_pool import ParserPool, ParseTimeout, worker_processes
+
+    pool = ParserPool(workers=1, max_tasks_per_child=2, timeout=3)
+
+    async def scenario():
+        assert await pool.run(pow, 2, 10) == 1024
+
+        killed = worker_processes(pool._executor)
+        started = time.perf_counter()
+        with pytest.raises(ParseTimeout):
+            await pool.run(time.sleep, 30)
+        elapsed = time.perf_counter() - started
+        for process in killed:
+            process.join(5)
+
+        after_timeout = [await pool.run(pow, 3, i) for i in range(3)]
+        with pytest.raises(BrokenProcessPool):
+            await pool.run(os._exit, 1)
+        after_crash = await pool.run(pow, 2, 3)
+        return elapsed, killed, after_timeout, after_crash
+
+    try:
+        elapsed, killed, after_timeout, after_crash = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+    assert elapsed < 10
+    assert killed and not any(process.is_alive() for process in killed)
+    assert after_timeout == [1, 3, 9]
+    assert after_crash == 8
+
+
+def write_pdf(path, texts) -> None:
+    """Write a PDF with one line of Helvetica text per page"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>".encode()
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(texts)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+
+def test_iter_documents_page_ranges(tmp_path, monkeypatch):
+    """
+    Test that iter_documents hands out the pages of a PDF in order, read a range of
+    pages per parser task, with their metadata, stops parsing when the consumer
+    stops, and parses other pool formats in a single task.
+    """
+    import utils.loaders as loaders
+    from utils.config import config
+
+    class InlinePool:
+        def __init__(self):
+            self.calls = []
+
+        async def run(self, fn, *args):
+            self.calls.append((fn.__name__, args[1:]))
+            return fn(*args)
+
+    pool = InlinePool()
+    monkeypatch.setattr(loaders, "parser_pool", pool)
+    monkeypatch.setattr(config, "PARSER_PROCESS_FORMATS", {".pdf", ".txt"})
+    pdf = tmp_path / "manual.pdf"
+    write_pdf(pdf, [f"Page {i}" for i in range(5)])
+    notes = tmp_path / "notes.txt"
+    notes.write_text("Some notes.")
+
+    async def read_all():
+        return [document async for document in loaders.Loader([str(pdf), str(notes)], page_range=2).iter_documents()]
+
+    async def read_first():
+        async for document in loaders.Loader([str(pdf)], page_range=2).iter_documents():
+            return document
+
+    documents = asyncio.run(read_all())
+    all_calls, pool.calls = pool.calls, []
+    first = asyncio.run(read_first())
+
+    assert [document.page_content.strip() for document in documents] == [f"Page {i}" for i in range(5)] + ["Some notes."]
+    assert [document.metadata.get("page") for document in documents] == [0, 1, 2, 3, 4, None]
+    assert documents[0].metadata == {"source": str(pdf), "page": 0, "total_pages": 5, "file_type": ".pdf"}
+    assert documents[-1].metadata == {"source": str(notes), "file_type": ".txt"}
+    assert all_calls == [("load_pages", (0, 2)), ("load_pages", (2, 2)), ("load_pages", (4, 2)), ("load_file", ())]
+    assert first.page_content.strip() == "Page 0"
+    assert pool.calls == [("load_pages", (0, 2))]
+    with pytest.raises(ValueError):
+        loaders.load_pages(str(notes), 0, 2)
+
+
+def test_chat_request_retrieval_options(vector_store, monkeypatch):
+    """
+    Test that the retrieval settings of a chat request reach the dense and hybrid
+    retrievers, and that settings which would be ignored or return fewer than
+    top_k chunks are rejected.
+    """
+    from pydantic import ValidationError
+    from schema import ChatRequest
+    from utils.config import config
+
+    async def retriever(**fields):
+        return await vector_store.query_vector_store(**ChatRequest(question="q", **fields).retrieval_options())
+
+    mmr = asyncio.run(retriever(top_k=3, search_type="mmr", fetch_k=10))
+    assert (mmr.search_type, mmr.search_kwargs) == ("mmr", {"k": 3, "fetch_k": 10, "lambda_mult": config.RETRIEVAL_MMR_LAMBDA})
+    threshold = asyncio.run(retriever(top_k=2, score_threshold=0.4))
+    assert (threshold.search_type, threshold.search_kwargs) == ("similarity_score_threshold", {"k": 2, "score_threshold": 0.4})
+
+    with pytest.raises(ValidationError):
+        ChatRequest(question="q", top_k=5, fetch_k=2)
+    with pytest.raises(ValidationError):
+        ChatRequest(question="q", dense_weight=2.0)
+    with pytest.raises(ValueError):
+        asyncio.run(vector_store.query_vector_store(lexical_weight=1.0))
+
+    monkeypatch.setattr(config, "HYBRID_SEARCH_ENABLED", True)
+    monkeypatch.setattr(vector_store, "lexical_index", object())
+    hybrid = asyncio.run(retriever(
+        top_k=5, search_type="mmr", fetch_k=12, score_threshold=0.3, dense_weight=2.0, lexical_weight=0.5,
+    ))
+    assert (hybrid.k, hybrid.fetch_k, hybrid.search_type, hybrid.score_threshold) == (5, 12, "mmr", 0.3)
+    assert (hybrid.dense_weight, hybrid.lexical_weight) == (2.0, 0.5)
+    assert asyncio.run(vector_store.query_vector_store(k=30)).fetch_k == 30
+    with pytest.raises(ValidationError):
+        ChatRequest(question="q", dense_weight=0.0, lexical_weight=0.0)
+
+
+def test_reranker_orders_and_caches():
+    """
+    Test that the reranker keeps the best k documents, best first with their
+    rerank_score, scores in batches, and serves a repeated query from its cache.
+    """
+    from types import SimpleNamespace
+    import numpy as np
+    from langchain_core.documents import Document
+    from utils.reranker import CrossEncoderReranker
+
+    class StubTokenizer:
+        def encode_batch(self, pairs):
+            return [
+                SimpleNamespace(ids=[text.count(query)], attention_mask=[1], type_ids=[0])
+                for query, text in pairs
+            ]
+
+    class StubSession:
+        def __init__(self):
+            self.batches = []
+
+        def run(self, outputs, inputs):
+            self.batches.append(len(inputs["input_ids"]))
+            return [inputs["input_ids"].astype(np.float32)]
+
+    session = StubSession()
+    reranker = CrossEncoderReranker(batch_size=2, cache_size=100)
+    reranker._session, reranker._tokenizer = session, StubTokenizer()
+    reranker._input_names = ["input_ids", "attention_mask"]
+
+    texts = ["scan", "scan scan scan", "nothing", "scan scan", "scan scan"]
+
+    def rerank(query):
+        return reranker.rerank(query, [Document(page_content=text) for text in texts], 3)
+
+    best = rerank("scan")
+    assert [document.page_content for document in best] == ["scan scan scan", "scan scan", "scan scan"]
+    assert [document.metadata["rerank_score"] for document in best] == [3.0, 2.0, 2.0]
+    # the repeated text is scored once
+    assert session.batches == [2, 2]
+
+    again = rerank("scan")
+    assert [document.page_content for document in again] == ["scan scan scan", "scan scan", "scan scan"]
+    assert session.batches == [2, 2]
+
+    rerank("nothing")
+    assert session.batches == [2, 2, 2, 2]
+    assert reranker.rerank("scan", [], 3) == []
+
+
+def test_chunking_strategies(monkeypatch):
+    """
+    Test that each chunking strategy builds its splitter and splits deterministically
+    without a model: semantic breaks where the topic changes, recursive fits the chunk
+    size, and markdown never spans two sections and keeps every chunk's headings in
+    its metadata.
+    """
+    from langchain_core.embeddings import Embeddings
+    from langchain_experimental.text_splitter import SemanticChunker
+    import utils.chunking as chunking
+
+    class TopicEmbeddings(Embeddings):
+        """One axis per topic, so the only semantic breakpoint is where the topic changes."""
+
+        def embed_documents(self, texts):
+            return [[text.count("Cats"), text.count("Stocks")] for text in texts]
+
+        def embed_query(self, text):
+            return self.embed_documents([text])[0]
+
+    splitter = chunking.recursive_splitter
+    monkeypatch.setattr(chunking, "recursive_splitter", lambda: splitter(60, 0, len))
+
+    with pytest.raises(ValueError):
+        chunking.create_text_splitter(TopicEmbeddings(), "fixed")
+
+    semantic = chunking.create_text_splitter(TopicEmbeddings(), "semantic")
+    assert isinstance(semantic, SemanticChunker)
+    assert semantic.split_text("Cats purr. Cats nap. Cats play. Stocks fell. Stocks rose. Stocks held.") == [
+        "Cats purr. Cats nap. Cats play.",
+        "Stocks fell. Stocks rose. Stocks held.",
+    ]
+
+    recursive = chunking.create_text_splitter(TopicEmbeddings(), "recursive")
+    paragraphs = ["Uploads are scanned before indexing.", "Scans take about a minute.", "Reports follow by email."]
+    recursive_chunks = recursive.split_text("\n\n".join(paragraphs * 2))
+    assert all(len(chunk) <= 60 for chunk in recursive_chunks)
+    assert " ".join(recursive_chunks).split() == " ".join(paragraphs * 2).split()
+
+    markdown = chunking.create_text_splitter(TopicEmbeddings(), "markdown")
+    text = (
+        "# Guide\nIntro line.\n\n"
+        "## Uploads\n" + "Uploads are scanned before indexing. " * 4 + "\n\n"
+        "## Reports\nReports follow by email.\n"
+    )
+    documents = markdown.split_documents(text)
+    assert [document.metadata for document in documents][0] == {"h1": "Guide"}
+    uploads = [document for document in documents if document.metadata.get("h2") == "Uploads"]
+    assert len(uploads) > 1
+    assert all(document.metadata == {"h1": "Guide", "h2": "Uploads"} for document in uploads)
+    assert all("Reports" not in document.page_content for document in uploads)
+    assert documents[-1].page_content == "## Reports\nReports follow by email."
+    assert documents[-1].metadata == {"h1": "Guide", "h2": "Reports"}
+    assert markdown.split_text(text) == [document.page_content for document in documents]
+
+
+def test_graph_registry_reuses_and_reloads(tmp_path, monkeypatch):
+    """
+    Test that the registry hands out one compiled graph per prompt and tool set, and
+    rebuilds it once the prompt file changes and the throttled check runs again.
+    """
+    import os
+    from types import SimpleNamespace
+    import agent.registry as registry_module
+    from agent.registry import GraphRegistry
+
+    builds = []
+
+    async def fake_build_graph(agent_prompt, tools):
+        builds.append((agent_prompt, [tool.name for tool in tools]))
+        return SimpleNamespace(prompt=agent_prompt)
+
+    monkeypatch.setattr(registry_module, "build_graph", fake_build_graph)
+
+    prompt_path = tmp_path / "agent_prompt.md"
+    prompt_path.write_text("Answer from the documents.", encoding="utf-8")
+    search, calculator = SimpleNamespace(name="search"), SimpleNamespace(name="calculator")
+    registry = GraphRegistry(prompt_path=prompt_path, reload_interval=3600)
+
+    async def scenario():
+        first = await registry.get_graph([search])
+        assert await registry.get_graph([search]) is first
+        assert await registry.get_graph([search, calculator]) is not first
+        assert len(builds) == 2
+
+        prompt_path.write_text("Answer in one sentence.", encoding="utf-8")
+        mtime = os.stat(prompt_path).st_mtime + 10
+        os.utime(prompt_path, (mtime, mtime))
+        # within the check interval the edit is not seen yet
+        assert await registry.get_graph([search]) is first
+
+        monkeypatch.setattr(registry, "reload_interval", 0.0)
+        reloaded = await registry.get_graph([search])
+        assert reloaded is not first
+        assert reloaded.prompt == "Answer in one sentence."
+        assert await registry.get_graph([search]) is reloaded
+        return first
+
+    first = asyncio.run(scenario())
+    assert first.prompt == "Answer from the documents."
+    assert builds[-1] == ("Answer in one sentence.", ["search"])
+    assert len(builds) == 3
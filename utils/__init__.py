@@ -1,13 +1,34 @@
-from .chroma_store import Chroma_VectorStore, get_chroma_vector_store
-from .huggingface_wrapper import llm, embedding_model
+import importlib
 from .config import config
 from .logging_config import logger
-from .loaders import Loader
+
+
+# The heavier exports are resolved on first access, so importing a light submodule
+# (e.g. from a parser worker process) does not load the LLM and embedding models.
+_EXPORTS = {
+    "Chroma_VectorStore": ".chroma_store",
+    "get_chroma_vector_store": ".chroma_store",
+    "init_chroma_vector_store": ".chroma_store",
+    "close_chroma_vector_store": ".chroma_store",
+    "llm": ".huggingface_wrapper",
+    "embedding_model": ".huggingface_wrapper",
+    "Loader": ".loaders",
+}
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
 
 
 __all__ = [
-    "Chroma_VectorStore",  
-    "get_chroma_vector_store", 
+    "Chroma_VectorStore",
+    "get_chroma_vector_store",
+    "init_chroma_vector_store",
+    "close_chroma_vector_store",
     "llm",
     "embedding_model",
     "config",
@@ -0,0 +1,211 @@
+import json
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from utils.config import config
+from utils.huggingface_wrapper import embedding_model
+from utils.logging_config import logger
+from utils.metrics import ANSWER_CACHE_LOOKUPS
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    vector: List[float]
+    created_at: float
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class InMemoryAnswerIndex:
+    """
+    In-process index of cached answers, searched by cosine similarity.
+
+    Holds at most `max_entries` answers; the oldest one is evicted first.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.entries: List[CachedAnswer] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def add(self, entry: CachedAnswer) -> None:
+        self.entries.append(entry)
+        if len(self.entries) > self.max_entries:
+            self.entries = self.entries[-self.max_entries:]
+        self._matrix = None
+
+    def search(self, vector: np.ndarray, threshold: float, ttl: float) -> Optional[CachedAnswer]:
+        now = time.time()
+        self.entries = [entry for entry in self.entries if now - entry.created_at < ttl]
+        if not self.entries:
+            self._matrix = None
+            return None
+
+        if self._matrix is None or len(self._matrix) != len(self.entries):
+            self._matrix = np.vstack([_normalize(entry.vector) for entry in self.entries])
+
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        return self.entries[best] if scores[best] >= threshold else None
+
+    def clear(self) -> None:
+        self.entries = []
+        self._matrix = None
+
+
+class AnswerCache:
+    """
+    Semantic cache of agent answers.
+
+    A question is embedded and compared with the questions answered before; if one
+    is at least `threshold` similar (cosine) and younger than `ttl` seconds, its
+    answer is reused instead of running the agent. Entries live in an in-process
+    index; with a Redis URL they are also shared with other workers through Redis.
+    Indexing new documents calls invalidate(), which drops every cached answer.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = config.ANSWER_CACHE_THRESHOLD,
+        ttl: float = config.ANSWER_CACHE_TTL,
+        max_entries: int = config.ANSWER_CACHE_MAX_ENTRIES,
+        redis_url: Optional[str] = None,
+    ) -> None:
+        """
+        Initialize an AnswerCache object.
+
+        Args:
+            embeddings (Embeddings): The model used to embed questions.
+            threshold (float): The minimum cosine similarity for a cache hit.
+            ttl (float): The number of seconds an answer stays valid.
+            max_entries (int): The number of answers kept in the in-process index.
+            redis_url (Optional[str]): The Redis instance backing the shared tier, if any.
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.local = InMemoryAnswerIndex(max_entries)
+        self.redis_url = redis_url
+        self._redis = None
+        self._generation = 0
+        self._prefix = f"answer_cache:{config.VECTOR_STORE_COLLECTION}"
+
+    def _get_redis(self):
+        if self._redis is None:
+            from redis import asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url)
+        return self._redis
+
+    async def _sync_generation(self) -> None:
+        """
+        Drop the local entries if another worker invalidated the shared tier.
+        """
+        generation = int(await self._get_redis().get(f"{self._prefix}:generation") or 0)
+        if generation != self._generation:
+            self.local.clear()
+            self._generation = generation
+
+    async def lookup(self, question: str) -> Optional[str]:
+        """
+        Find the answer of a near-duplicate question.
+
+        Args:
+            question (str): The question to look up.
+
+        Returns:
+            Optional[str]: The cached answer, or None on a miss.
+        """
+        try:
+            vector = _normalize(await self.embeddings.aembed_query(question))
+
+            if self.redis_url:
+                await self._sync_generation()
+
+            entry = self.local.search(vector, self.threshold, self.ttl)
+            if entry is not None:
+                ANSWER_CACHE_LOOKUPS.labels(result="local_hit").inc()
+                return entry.answer
+
+            if self.redis_url:
+                raw = await self._get_redis().hgetall(f"{self._prefix}:{self._generation}")
+                shared = InMemoryAnswerIndex(max_entries=len(raw))
+                for value in raw.values():
+                    shared.entries.append(CachedAnswer(**json.loads(value)))
+                entry = shared.search(vector, self.threshold, self.ttl)
+                if entry is not None:
+                    self.local.add(entry)
+                    ANSWER_CACHE_LOOKUPS.labels(result="shared_hit").inc()
+                    return entry.answer
+
+            ANSWER_CACHE_LOOKUPS.labels(result="miss").inc()
+        except Exception as e:
+            logger.error(f"Answer cache lookup failed: {str(e)}")
+        return None
+
+    async def store(self, question: str, answer: str) -> None:
+        """
+        Cache the answer to a question.
+
+        Args:
+            question (str): The question.
+            answer (str): The answer produced by the agent.
+        """
+        if not answer:
+            return
+        try:
+            vector = await self.embeddings.aembed_query(question)
+            entry = CachedAnswer(
+                question=question,
+                answer=answer,
+                vector=[float(x) for x in vector],
+                created_at=time.time(),
+            )
+            self.local.add(entry)
+
+            if self.redis_url:
+                key = f"{self._prefix}:{self._generation}"
+                redis = self._get_redis()
+                await redis.hset(key, uuid.uuid4().hex, json.dumps(asdict(entry)))
+                await redis.expire(key, int(self.ttl))
+        except Exception as e:
+            logger.error(f"Answer cache store failed: {str(e)}")
+
+    async def invalidate(self) -> None:
+        """
+        Drop every cached answer, locally and in the shared tier.
+        """
+        self.local.clear()
+        if self.redis_url:
+            try:
+                self._generation = int(await self._get_redis().incr(f"{self._prefix}:generation"))
+            except Exception as e:
+                logger.error(f"Answer cache invalidation failed: {str(e)}")
+
+
+def create_answer_cache(embeddings: Embeddings) -> Optional[AnswerCache]:
+    """
+    Create the answer cache configured in Settings.
+
+    Args:
+        embeddings (Embeddings): The model used to embed questions.
+
+    Returns:
+        Optional[AnswerCache]: The cache, or None when ANSWER_CACHE_ENABLED is off.
+    """
+    if not config.ANSWER_CACHE_ENABLED:
+        return None
+    redis_url = config.REDIS_URL if config.ANSWER_CACHE_BACKEND == "redis" else None
+    return AnswerCache(embeddings=embeddings, redis_url=redis_url)
+
+
+answer_cache = create_answer_cache(embedding_model)
@@ -0,0 +1,197 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+from langchain_core.outputs import Generation, LLMResult
+from langchain_huggingface import HuggingFacePipeline
+from pydantic import PrivateAttr
+from utils.logging_config import logger
+
+
+class MicroBatcher:
+    """
+    Collects work items submitted from many threads and runs them as one batch.
+
+    A background thread waits for the first item, then keeps collecting for up to
+    `max_wait_ms` milliseconds or until `max_batch_size` items are pending, calls
+    `batch_fn` once with all of them and hands each result back to its caller.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int,
+        max_wait_ms: float,
+        name: str = "micro-batcher",
+    ) -> None:
+        """
+        Initialize a MicroBatcher object.
+
+        Args:
+            batch_fn (Callable[[List[Any]], List[Any]]): Maps a list of items to a list
+                of results in the same order.
+            max_batch_size (int): The maximum number of items in one batch.
+            max_wait_ms (float): How long to wait for more items after the first one.
+            name (str): The name of the background thread.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        self._queue: "queue.Queue[Optional[Tuple[Any, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, item: Any) -> Future:
+        """
+        Queue an item for the next batch.
+
+        Args:
+            item (Any): The work item.
+
+        Returns:
+            Future: Resolves to the result for this item.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self) -> Tuple[List[Tuple[Any, Future]], bool]:
+        first = self._queue.get()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _loop(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                logger.error(f"Batch of {len(items)} failed: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def shutdown(self) -> None:
+        """
+        Stop the background thread once the items already queued have run.
+
+        Items submitted while it stops are failed with a RuntimeError rather than
+        left waiting.
+        """
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+            while True:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is not None:
+                    entry[1].set_exception(RuntimeError(f"{self.name} stopped before the item ran"))
+
+
+def truncate_at_stop(text: str, stop: List[str]) -> str:
+    """
+    Cut a generated text at the first occurrence of any stop sequence.
+    """
+    for sequence in stop:
+        index = text.find(sequence)
+        if index != -1:
+            text = text[:index]
+    return text
+
+
+class BatchedHuggingFacePipeline(HuggingFacePipeline):
+    """
+    HuggingFacePipeline that merges concurrent generations into padded batches.
+
+    Each caller thread submits its prompt to a shared MicroBatcher and blocks until
+    its own generation comes back, so concurrent requests share one forward pass
+    per decoding step instead of generating one sequence at a time. Stop sequences
+    are applied to each text once its batch is done.
+
+    A call with its own `pipeline_kwargs` cannot share a batch generated with the
+    configured settings, so it runs on its own, as do streamed generations (_stream
+    is inherited): they generate next to the batches.
+    """
+
+    max_wait_ms: float = 10.0
+    """How long to wait for more prompts before running a batch."""
+    max_new_tokens_cap: Optional[int] = None
+    """Upper bound on max_new_tokens for a batch, as a batch runs until its longest member."""
+
+    _batcher: Optional[MicroBatcher] = PrivateAttr(default=None)
+
+    def _get_batcher(self) -> MicroBatcher:
+        if self._batcher is None:
+            self._batcher = MicroBatcher(
+                batch_fn=self._generate_batch,
+                max_batch_size=self.batch_size,
+                max_wait_ms=self.max_wait_ms,
+                name="llm-batcher",
+            )
+        return self._batcher
+
+    def _generate_batch(self, prompts: List[str]) -> List[str]:
+        pipeline_kwargs = {}
+        if self.max_new_tokens_cap is not None:
+            max_new_tokens = (self.pipeline_kwargs or {}).get("max_new_tokens")
+            pipeline_kwargs["max_new_tokens"] = (
+                self.max_new_tokens_cap if max_new_tokens is None else min(max_new_tokens, self.max_new_tokens_cap)
+            )
+        result = super()._generate(prompts, pipeline_kwargs=pipeline_kwargs)
+        return [generations[0].text for generations in result.generations]
+
+    def _generate(self, prompts: List[str], stop=None, run_manager=None, **kwargs) -> LLMResult:
+        if kwargs.get("pipeline_kwargs"):
+            return super()._generate(prompts, stop=stop, run_manager=run_manager, **kwargs)
+
+        futures = [self._get_batcher().submit(prompt) for prompt in prompts]
+        generations = []
+        for prompt, future in zip(prompts, futures):
+            text = future.result()
+            if kwargs.get("skip_prompt"):
+                text = text[len(prompt):]
+            if stop:
+                text = truncate_at_stop(text, stop)
+            generations.append([Generation(text=text)])
+        return LLMResult(generations=generations)
+
+    def shutdown_batcher(self) -> None:
+        """
+        Stop the batching thread. A new one is started on the next generation.
+        """
+        if self._batcher is not None:
+            self._batcher.shutdown()
+            self._batcher = None
@@ -1,53 +1,652 @@
-from .huggingface_wrapper import embedding_model
-from langchain_experimental.text_splitter import SemanticChunker
+import asyncio
+import contextvars
+import functools
+import hashlib
+import chromadb
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from langchain_core.documents import Document
+from .huggingface_wrapper import embedding_model, embedding_batch_size
+from .answer_cache import answer_cache
+from .chunking import create_text_splitter
+from .hybrid_retriever import HybridRetriever
+from .lexical_index import LexicalIndex
 from langchain_chroma import Chroma
+from chromadb.api.shared_system_client import SharedSystemClient
 from utils.config import config
+from utils.logging_config import logger
+from utils.metrics import CHUNKING_SECONDS, VECTOR_WRITE_SECONDS
+from utils.tracing import set_attributes, start_span
 
 
+SEARCH_TYPES = ("similarity", "mmr", "similarity_score_threshold")
+
+
+@dataclass
+class Chunk:
+    text: str
+    page: int
+    offset: int
+    chunk_hash: str = field(init=False)
+    
+    def __post_init__(self) -> None:
+        self.chunk_hash = hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
 
 class Chroma_VectorStore:
-    def __init__(self) -> None:
+    def __init__(self, client: Optional[chromadb.ClientAPI] = None) -> None:
         """
         Initialize a Chroma VectorStore object.
 
         Args:
-            collection_name (str): The name of the collection to store vectors in.
-            persistance_path (str): The path to the directory where the vector store will be persisted.
+            client (Optional[chromadb.ClientAPI]): The Chroma client to use. A persistent
+                client on VECTOR_STORE_PATH is created when not provided, and released
+                by close(); a client passed in stays open and belongs to the caller.
+
+        When HYBRID_SEARCH_ENABLED is on, a BM25 index of the chunks is kept at
+        LEXICAL_INDEX_PATH and updated with every write to the collection.
 
         Returns:
             None
         """
+        self._owns_client = client is None
+        if client is None:
+            client = chromadb.PersistentClient(path=config.VECTOR_STORE_PATH)
+            
+        self.client = client
         self.chroma = Chroma(
+            client=client,
             collection_name=config.VECTOR_STORE_COLLECTION,
             embedding_function=embedding_model,
-            persist_directory=config.VECTOR_STORE_PATH,
         )
+        self.lexical_index = LexicalIndex(config.LEXICAL_INDEX_PATH) if config.HYBRID_SEARCH_ENABLED else None
+        self._text_splitter = None
+        
+    def _get_text_splitter(self):
+        if self._text_splitter is None:
+            self._text_splitter = create_text_splitter(embedding_model)
+        return self._text_splitter
         
+    async def chunk_text(self, text: str) -> List[str]:
+        """
+        Split text into chunks with the configured CHUNKING_STRATEGY.
+
+        The semantic strategy embeds every sentence to find breakpoints, so the split
+        runs in the default executor to keep the event loop free.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            List[str]: The chunks.
+        """
+        chunker = self._get_text_splitter()
+
+        loop = asyncio.get_running_loop()
+        with CHUNKING_SECONDS.time():
+            return await loop.run_in_executor(None, chunker.split_text, text)
+    
+    async def add_chunks(self, chunks: List[str]) -> List[str]:
+        """
+        Embed chunks and add them to the collection.
+
+        Cached answers are invalidated, as they may be outdated by the new chunks.
+
+        Args:
+            chunks (List[str]): The chunks to add.
+
+        Returns:
+            List[str]: The ids of the added chunks.
+        """
+        if not chunks:
+            return []
+        with VECTOR_WRITE_SECONDS.time(), start_span("chroma.write", **{"rag.chunks": len(chunks)}):
+            ids = await self.chroma.aadd_texts(
+                texts=chunks
+            )
+        await self._index_lexical(ids, chunks, [{}] * len(ids))
+        
+        if answer_cache is not None:
+            await answer_cache.invalidate()
+        return ids
+        
+    async def _run(self, fn, *args, **kwargs):
+        # the context is copied so the work done on the thread joins the current trace
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(None, functools.partial(context.run, fn, *args, **kwargs))
+    
+    async def _index_lexical(self, ids: List[str], texts: List[str], metadatas: List[dict]) -> None:
+        if self.lexical_index is not None and ids:
+            document_ids = [metadata.get("document_id") for metadata in metadatas]
+            await self._run(self.lexical_index.add, ids, texts, document_ids)
+    
+    async def _unindex_lexical(self, ids: List[str]) -> None:
+        if self.lexical_index is not None and ids:
+            await self._run(self.lexical_index.delete, ids)
+    
+    async def chunk_documents(self, documents: List[Document]) -> List[Chunk]:
+        """
+        Split loaded pages into chunks, keeping where each chunk came from.
+
+        Args:
+            documents (List[Document]): The pages or sections returned by the Loader.
+
+        Returns:
+            List[Chunk]: The chunks in document order, with their page and character offset.
+        """
+        chunker = self._get_text_splitter()
+        
+        def split() -> List[Chunk]:
+            chunks = []
+            for document in documents:
+                text = document.page_content
+                page = int(document.metadata.get("page", 0) or 0)
+                cursor = 0
+                for chunk_text in chunker.split_text(text):
+                    offset = text.find(chunk_text[:32], cursor)
+                    if offset < 0:
+                        offset = cursor
+                    chunks.append(Chunk(text=chunk_text, page=page, offset=offset))
+                    # Overlapping strategies start the next chunk inside this one.
+                    cursor = offset + 1
+            return chunks
+        
+        with CHUNKING_SECONDS.time(), start_span("chunking", **{"rag.pages": len(documents)}) as span:
+            chunks = await self._run(split)
+            set_attributes(span, **{"rag.chunks": len(chunks)})
+            return chunks
+    
+    def indexer(
+        self, document_id: int, filename: str, writer: Optional["BulkWriter"] = None
+    ) -> "DocumentIndexer":
+        """
+        Create a DocumentIndexer that writes the chunks of a document incrementally.
+
+        Args:
+            document_id (int): The id of the document the chunks belong to.
+            filename (str): The filename of the document.
+            writer (Optional[BulkWriter]): Pools the new chunks with other documents'
+                instead of writing them batch by batch.
+
+        Returns:
+            DocumentIndexer: The indexer; call begin(), add() per batch, then finish().
+        """
+        return DocumentIndexer(self, document_id, filename, writer)
+    
+    def bulk_writer(self) -> "BulkWriter":
+        """
+        Create a BulkWriter for indexing many documents at once.
+
+        Returns:
+            BulkWriter: The writer; pass it to indexer(), and flush() it before finishing them.
+        """
+        return BulkWriter(self)
+    
+    async def index_chunks(self, document_id: int, filename: str, chunks: List[Chunk]) -> Dict[str, int]:
+        """
+        Bring the vectors of a document in line with its current chunks.
+
+        See DocumentIndexer for how chunks are diffed against the stored vectors.
+
+        Args:
+            document_id (int): The id of the document the chunks belong to.
+            filename (str): The filename of the document.
+            chunks (List[Chunk]): The chunks of the document, in order.
+
+        Returns:
+            Dict[str, int]: The number of chunks added, updated, removed and unchanged.
+        """
+        indexer = self.indexer(document_id, filename)
+        await indexer.begin()
+        await indexer.add(chunks)
+        return await indexer.finish()
+    
+    async def delete_document(self, document_id: int) -> int:
+        """
+        Delete every chunk of a document.
+
+        Args:
+            document_id (int): The id of the document.
+
+        Returns:
+            int: The number of chunks deleted.
+        """
+        collection = self.chroma._collection
+        existing = await self._run(collection.get, where={"document_id": document_id}, include=[])
+        if existing["ids"]:
+            await self._run(collection.delete, ids=existing["ids"])
+            await self._unindex_lexical(existing["ids"])
+            if answer_cache is not None:
+                await answer_cache.invalidate()
+        return len(existing["ids"])
+    
+    async def reassign_document(self, document_id: int, new_document_id: int) -> int:
+        """
+        Move the chunks of a document to another document with the same content.
+
+        Used when a document whose vectors are shared by duplicate uploads is deleted.
+
+        Args:
+            document_id (int): The id of the current owner.
+            new_document_id (int): The id of the new owner.
+
+        Returns:
+            int: The number of chunks moved.
+        """
+        collection = self.chroma._collection
+        existing = await self._run(collection.get, where={"document_id": document_id}, include=["metadatas"])
+        if existing["ids"]:
+            metadatas = [{**metadata, "document_id": new_document_id} for metadata in existing["metadatas"]]
+            await self._run(collection.update, ids=existing["ids"], metadatas=metadatas)
+            if self.lexical_index is not None:
+                await self._run(self.lexical_index.reassign_document, document_id, new_document_id)
+        return len(existing["ids"])
+    
     async def build_vector_store(self, text: str) -> None:
-        chunker=SemanticChunker(
-            embeddings=embedding_model,
-        )
+        chunked_texts = await self.chunk_text(text)
+        
+        await self.add_chunks(chunked_texts)
+        
+        return self.chroma
+    
 
-        chunked_texts = chunker.split_text(
-            text=text
-        )
+    async def query_vector_store(self, **options):
+        """
+        Get a retriever over the collection.
+
+        With HYBRID_SEARCH_ENABLED, a HybridRetriever fusing dense and BM25 results;
+        otherwise the dense retriever of the collection. Settings not overridden
+        come from the RETRIEVAL_* settings. fetch_k is raised to k when lower, so
+        MMR and fusion always have k candidates to pick from.
+
+        Args:
+            **options: Overrides of the retriever settings:
+                k (int): The number of chunks returned.
+                search_type (str): "similarity", "mmr" or "similarity_score_threshold".
+                fetch_k (int): The number of candidates for MMR and fusion.
+                score_threshold (float): The minimum relevance score of a dense result.
+                dense_weight, lexical_weight (float): The fusion weights, hybrid only.
+
+        Returns:
+            BaseRetriever: The retriever.
+
+        Raises:
+            ValueError: If the search type is unknown, or if fusion weights are given
+                without hybrid search.
+        """
+        search_type = options.get("search_type", config.RETRIEVAL_SEARCH_TYPE)
+        if search_type not in SEARCH_TYPES:
+            raise ValueError(f"Unknown search type: {search_type}. Expected one of {SEARCH_TYPES}")
+        
+        k = options.get("k", config.RETRIEVAL_K)
+        fetch_k = max(options.get("fetch_k", config.RETRIEVAL_FETCH_K), k)
         
-        await self.chroma.aadd_texts(
-            texts=chunked_texts
+        if self.lexical_index is not None:
+            return HybridRetriever(vector_store=self, **{**options, "fetch_k": fetch_k})
+        
+        if "dense_weight" in options or "lexical_weight" in options:
+            raise ValueError("dense_weight and lexical_weight only apply with hybrid search enabled")
+        
+        score_threshold = options.get("score_threshold", config.RETRIEVAL_SCORE_THRESHOLD)
+        
+        if search_type == "mmr":
+            search_kwargs = {"k": k, "fetch_k": fetch_k, "lambda_mult": config.RETRIEVAL_MMR_LAMBDA}
+        elif score_threshold is not None or search_type == "similarity_score_threshold":
+            search_type = "similarity_score_threshold"
+            search_kwargs = {"k": k, "score_threshold": score_threshold or 0.0}
+        else:
+            search_kwargs = {"k": k}
+        return self.chroma.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
+    
+    def sync_lexical_index(self) -> int:
+        """
+        Rebuild the lexical index from the collection if they hold different counts.
+
+        Brings an existing collection into the index the first time hybrid search is
+        turned on, or after the index file was lost. Blocking.
+
+        Returns:
+            int: The number of chunks indexed, 0 if the index was already in sync.
+        """
+        if self.lexical_index is None:
+            return 0
+        collection = self.chroma._collection
+        total = collection.count()
+        if self.lexical_index.count() == total:
+            return 0
+        
+        logger.info(f"Rebuilding the lexical index from {total} vectors")
+        self.lexical_index.clear()
+        for offset in range(0, total, 1000):
+            page = collection.get(include=["documents", "metadatas"], limit=1000, offset=offset)
+            self.lexical_index.add(
+                page["ids"],
+                page["documents"],
+                [(metadata or {}).get("document_id") for metadata in page["metadatas"]],
+            )
+        return total
+    
+    
+    async def warm_up(self) -> None:
+        """
+        Touch the collection and the embedding model once.
+
+        Opening the collection segments and loading the embedding weights happen lazily
+        on first use, so doing it at startup keeps that cost off the first request.
+        The lexical index is only rebuilt if it is out of sync with the collection.
+        """
+        loop = asyncio.get_running_loop()
+        count = await loop.run_in_executor(None, self.chroma._collection.count)
+        await loop.run_in_executor(None, embedding_model.embed_query, "warm up")
+        await loop.run_in_executor(None, self.sync_lexical_index)
+        logger.info(f"Vector store ready: {config.VECTOR_STORE_COLLECTION} ({count} vectors)")
+        
+    def close(self) -> None:
+        """
+        Close the lexical index and, if this store created its client, stop the client.
+
+        Chroma keeps one System per persistent path, shared by every client opened on
+        that path in the process. Only that System is stopped and dropped from Chroma's
+        cache, so clients on other paths keep working, while other clients on the
+        same path stop with it. clear_system_cache() is not used because it drops
+        the System of every client in the process.
+        """
+        try:
+            if self.lexical_index is not None:
+                self.lexical_index.close()
+            if self._owns_client:
+                # Chroma has no public way to release the System of a single path
+                system = SharedSystemClient._identifier_to_system.pop(self.client._identifier, None)
+                if system is not None:
+                    system.stop()
+        except Exception as e:
+            logger.error(f"Error closing vector store: {str(e)}")
+    
+    
+class DocumentIndexer:
+    """
+    Writes the chunks of one document to the vector store in batches.
+
+    Existing chunks are matched by content hash: unchanged chunks keep their id and
+    vector and only get their position metadata updated, new chunks are embedded and
+    added as each batch arrives, and chunks not seen by finish() are deleted.
+    Re-indexing a document with one edited page therefore only embeds that page's
+    chunks, and a large document never has to be chunked all at once.
+
+    Chunk ids are `<document_id>:<ordinal>:<hash prefix>` as of when the chunk was
+    added; the metadata holds document_id, filename, page, offset, ordinal and chunk_hash.
+
+    With a BulkWriter, new chunks are not embedded per batch but kept until
+    commit(), called once the whole document was read, hands them to the writer; so
+    a document that fails halfway leaves nothing behind in the store. The writer
+    must be flushed before finish() is called.
+    """
+    
+    def __init__(
+        self,
+        vector_store: "Chroma_VectorStore",
+        document_id: int,
+        filename: str,
+        writer: Optional["BulkWriter"] = None,
+    ) -> None:
+        self.vector_store = vector_store
+        self.document_id = document_id
+        self.filename = filename
+        self.writer = writer
+        self.stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        self._ids_by_hash: Dict[str, List[str]] = {}
+        self._metadata_by_id: Dict[str, dict] = {}
+        self._taken: set = set()
+        self._ordinal = 0
+        self._pending_ids: List[str] = []
+        self._pending_texts: List[str] = []
+        self._pending_metadatas: List[dict] = []
+        self._committed = 0
+    
+    async def begin(self) -> None:
+        """
+        Load the ids and metadata of the chunks already stored for the document.
+        """
+        collection = self.vector_store.chroma._collection
+        existing = await self.vector_store._run(
+            collection.get, where={"document_id": self.document_id}, include=["metadatas"]
         )
+        for chunk_id, metadata in zip(existing["ids"], existing["metadatas"]):
+            self._ids_by_hash.setdefault(metadata.get("chunk_hash"), []).append(chunk_id)
+            self._metadata_by_id[chunk_id] = metadata
+        self._taken = set(existing["ids"])
+    
+    async def add(self, chunks: List[Chunk]) -> None:
+        """
+        Write the next batch of chunks, in document order.
+
+        Args:
+            chunks (List[Chunk]): The chunks following the ones already added.
+        """
+        collection = self.vector_store.chroma._collection
+        add_ids, add_texts, add_metadatas = [], [], []
+        update_ids, update_metadatas = [], []
         
-        return self.chroma
+        for chunk in chunks:
+            ordinal = self._ordinal
+            self._ordinal += 1
+            metadata = {
+                "document_id": self.document_id,
+                "filename": self.filename,
+                "page": chunk.page,
+                "offset": chunk.offset,
+                "ordinal": ordinal,
+                "chunk_hash": chunk.chunk_hash,
+            }
+            
+            if self._ids_by_hash.get(chunk.chunk_hash):
+                chunk_id = self._ids_by_hash[chunk.chunk_hash].pop(0)
+                if self._metadata_by_id[chunk_id] != metadata:
+                    update_ids.append(chunk_id)
+                    update_metadatas.append(metadata)
+                else:
+                    self.stats["unchanged"] += 1
+                continue
+            
+            base_id = chunk_id = f"{self.document_id}:{ordinal}:{chunk.chunk_hash[:16]}"
+            suffix = 1
+            while chunk_id in self._taken:
+                chunk_id = f"{base_id}-{suffix}"
+                suffix += 1
+            self._taken.add(chunk_id)
+            add_ids.append(chunk_id)
+            add_texts.append(chunk.text)
+            add_metadatas.append(metadata)
+        
+        if update_ids:
+            await self.vector_store._run(collection.update, ids=update_ids, metadatas=update_metadatas)
+        if add_ids and self.writer is not None:
+            self._pending_ids.extend(add_ids)
+            self._pending_texts.extend(add_texts)
+            self._pending_metadatas.extend(add_metadatas)
+        elif add_ids:
+            with VECTOR_WRITE_SECONDS.time(), start_span("chroma.write", **{"rag.chunks": len(add_ids)}):
+                await self.vector_store.chroma.aadd_texts(texts=add_texts, metadatas=add_metadatas, ids=add_ids)
+            await self.vector_store._index_lexical(add_ids, add_texts, add_metadatas)
+            self.stats["added"] += len(add_ids)
+        
+        self.stats["updated"] += len(update_ids)
     
+    async def commit(self) -> None:
+        """
+        Hand the new chunks kept for the BulkWriter over to it.
 
-    async def query_vector_store(self):
-        return self.chroma.as_retriever()
+        Raises:
+            Exception: The error of a failed write of the writer.
+        """
+        if self.writer is None or not self._pending_ids:
+            return
+        await self.writer.add(self._pending_ids, self._pending_texts, self._pending_metadatas)
+        self._committed += len(self._pending_ids)
+        self._pending_ids, self._pending_texts, self._pending_metadatas = [], [], []
     
+    async def finish(self) -> Dict[str, int]:
+        """
+        Delete the stored chunks that were not seen again.
+
+        Returns:
+            Dict[str, int]: The number of chunks added, updated, removed and unchanged.
+        """
+        remove_ids = [chunk_id for ids in self._ids_by_hash.values() for chunk_id in ids]
+        if remove_ids:
+            collection = self.vector_store.chroma._collection
+            await self.vector_store._run(collection.delete, ids=remove_ids)
+            await self.vector_store._unindex_lexical(remove_ids)
+        self.stats["removed"] = len(remove_ids)
+        # the chunks committed to a writer were written by its flush
+        self.stats["added"] += self._committed
+        self._committed = 0
+        
+        if (self.stats["added"] or self.stats["removed"]) and answer_cache is not None:
+            await answer_cache.invalidate()
+        
+        return self.stats
+    
+    
+class BulkWriter:
+    """
+    Pools the new chunks of many documents into large embedding and write batches.
+
+    Indexing thousands of small files one by one makes thousands of small embedding
+    calls and Chroma writes. Chunks handed to the writer are buffered until
+    `batch_size` of them are pending, then embedded in one call and written in one
+    upsert. The batch size is INGESTION_WRITE_BATCH_SIZE rounded down to a whole
+    number of embedding batches for EMBEDDING_DEVICE, and capped by what the Chroma
+    client accepts in one call.
+
+    A failed write is raised, and raised again by every later add() and flush(),
+    as the failed batch may hold chunks of any of the documents being indexed; no
+    further chunk is written.
+    """
+    
+    def __init__(self, vector_store: "Chroma_VectorStore", batch_size: int = config.INGESTION_WRITE_BATCH_SIZE) -> None:
+        """
+        Initialize a BulkWriter object.
+
+        Args:
+            vector_store (Chroma_VectorStore): The vector store to write to.
+            batch_size (int): The target number of chunks per write.
+        """
+        device_batch = embedding_batch_size()
+        batch_size = max(batch_size // device_batch, 1) * device_batch
+        self.vector_store = vector_store
+        self.batch_size = min(batch_size, vector_store.client.get_max_batch_size())
+        self.written = 0
+        self.error: Optional[Exception] = None
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._lock = asyncio.Lock()
+    
+    async def add(self, ids: List[str], texts: List[str], metadatas: List[dict]) -> None:
+        """
+        Queue chunks for writing, and write a batch once enough are pending.
+
+        Args:
+            ids (List[str]): The ids of the chunks.
+            texts (List[str]): The texts of the chunks.
+            metadatas (List[dict]): The metadata of the chunks.
+
+        Raises:
+            Exception: The error of a failed write, this one or an earlier one.
+        """
+        if self.error is not None:
+            raise self.error
+        self._ids.extend(ids)
+        self._texts.extend(texts)
+        self._metadatas.extend(metadatas)
+        if len(self._ids) >= self.batch_size:
+            await self._write(final=False)
+    
+    async def _write(self, final: bool) -> None:
+        async with self._lock:
+            if self.error is not None:
+                raise self.error
+            count = len(self._ids) if final else len(self._ids) // self.batch_size * self.batch_size
+            ids, texts, metadatas = self._ids[:count], self._texts[:count], self._metadatas[:count]
+            del self._ids[:count], self._texts[:count], self._metadatas[:count]
+            
+            collection = self.vector_store.chroma._collection
+            try:
+                for i in range(0, len(ids), self.batch_size):
+                    batch = slice(i, i + self.batch_size)
+                    embeddings = await self.vector_store._run(embedding_model.embed_documents, texts[batch])
+                    with VECTOR_WRITE_SECONDS.time(), start_span("chroma.write", **{"rag.chunks": len(ids[batch])}):
+                        await self.vector_store._run(
+                            collection.upsert,
+                            ids=ids[batch],
+                            embeddings=embeddings,
+                            documents=texts[batch],
+                            metadatas=metadatas[batch],
+                        )
+                    await self.vector_store._index_lexical(ids[batch], texts[batch], metadatas[batch])
+                    self.written += len(ids[batch])
+            except Exception as e:
+                logger.error(f"Bulk write of {len(ids)} chunks failed: {str(e)}")
+                self.error = e
+                self._ids, self._texts, self._metadatas = [], [], []
+                raise
     
+    async def flush(self) -> int:
+        """
+        Write every pending chunk.
+
+        Returns:
+            int: The number of chunks written by this writer.
+
+        Raises:
+            Exception: The error of any write that failed.
+        """
+        await self._write(final=True)
+        return self.written
+
+
+_vector_store: Optional[Chroma_VectorStore] = None
+
+
+async def init_chroma_vector_store(warm_up: bool = True) -> Chroma_VectorStore:
+    """
+    Create the process-wide Chroma_VectorStore. Meant to be called from the app lifespan.
+
+    Args:
+        warm_up (bool): Whether to open the collection and load the embedding model now.
+
+    Returns:
+        Chroma_VectorStore: The shared instance of the Chroma_VectorStore.
+    """
+    vector_store = get_chroma_vector_store()
+    if warm_up:
+        await vector_store.warm_up()
+    return vector_store
+
+
+def close_chroma_vector_store() -> None:
+    """
+    Close the process-wide Chroma_VectorStore, if it has been created.
+    """
+    global _vector_store
+    if _vector_store is not None:
+        _vector_store.close()
+        _vector_store = None
+
+
 def get_chroma_vector_store() -> Chroma_VectorStore:
     """
-    Get an instance of the Chroma_VectorStore.
+    Get the shared instance of the Chroma_VectorStore.
+
+    The Chroma client is thread-safe, so one client and collection handle is reused
+    by every request instead of reopening the persistent collection each time.
 
     Returns:
         Chroma_VectorStore: The instance of the Chroma_VectorStore.
     """
-    return Chroma_VectorStore()
\ No newline at end of file
+    global _vector_store
+    if _vector_store is None:
+        _vector_store = Chroma_VectorStore()
+    return _vector_store
@@ -0,0 +1,126 @@
+from typing import Callable, List, Optional
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_experimental.text_splitter import SemanticChunker
+from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter, TextSplitter
+from utils.config import config
+
+
+CHUNKING_STRATEGIES = ("semantic", "recursive", "markdown")
+
+MARKDOWN_HEADERS = [("#", "h1"), ("##", "h2"), ("###", "h3"), ("####", "h4")]
+
+
+def token_counter(model_name: str = config.EMBEDDING_MODEL) -> Callable[[str], int]:
+    """
+    Create a function counting tokens with the tokenizer of the embedding model.
+
+    Args:
+        model_name (str): The Hugging Face model whose tokenizer is used.
+
+    Returns:
+        Callable[[str], int]: Maps a text to its number of tokens.
+    """
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_pretrained(model_name)
+
+    def count(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+    return count
+
+
+def recursive_splitter(
+    chunk_size: int = config.CHUNK_SIZE,
+    chunk_overlap: int = config.CHUNK_OVERLAP,
+    length_function: Optional[Callable[[str], int]] = None,
+) -> TextSplitter:
+    """
+    Create a splitter cutting on paragraphs, then lines, then words, until chunks fit.
+
+    Args:
+        chunk_size (int): The maximum number of tokens in a chunk.
+        chunk_overlap (int): The number of tokens shared by consecutive chunks.
+        length_function (Optional[Callable[[str], int]]): Measures a text. Defaults to
+            the token count of the embedding model.
+
+    Returns:
+        TextSplitter: The splitter.
+    """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=length_function or token_counter(),
+    )
+
+
+class MarkdownSplitter:
+    """
+    Structure-aware splitter for markdown.
+
+    The text is first cut at headings, so a chunk never spans two sections, then
+    sections longer than the chunk size are split further with the recursive
+    splitter. Text without headings is split by the recursive splitter alone.
+    """
+
+    def __init__(self, splitter: TextSplitter) -> None:
+        """
+        Initialize a MarkdownSplitter object.
+
+        Args:
+            splitter (TextSplitter): The splitter used inside long sections.
+        """
+        self.splitter = splitter
+        self.header_splitter = MarkdownHeaderTextSplitter(
+            headers_to_split_on=MARKDOWN_HEADERS,
+            strip_headers=False,
+        )
+
+    def split_documents(self, text: str) -> List[Document]:
+        """
+        Split markdown into chunks, each with the headings of its section in its
+        metadata, as h1 to h4, including the chunks cut out of a long section.
+
+        Args:
+            text (str): The markdown to split.
+
+        Returns:
+            List[Document]: The chunks, in order.
+        """
+        return [
+            Document(page_content=chunk, metadata=dict(section.metadata))
+            for section in self.header_splitter.split_text(text)
+            for chunk in self.splitter.split_text(section.page_content)
+        ]
+
+    def split_text(self, text: str) -> List[str]:
+        return [document.page_content for document in self.split_documents(text)]
+
+
+def create_text_splitter(embeddings: Embeddings, strategy: str = config.CHUNKING_STRATEGY):
+    """
+    Create the text splitter for a chunking strategy.
+
+    - semantic: SemanticChunker, which embeds every sentence to find breakpoints.
+    - recursive: token-aware recursive splitting with overlap, no embedding calls.
+    - markdown: split at headings first, then like recursive.
+
+    Args:
+        embeddings (Embeddings): The model used by the semantic strategy.
+        strategy (str): One of CHUNKING_STRATEGIES.
+
+    Returns:
+        An object with a split_text(text) -> List[str] method.
+
+    Raises:
+        ValueError: If the strategy is unknown.
+    """
+    if strategy == "semantic":
+        return SemanticChunker(embeddings=embeddings)
+    elif strategy == "recursive":
+        return recursive_splitter()
+    elif strategy == "markdown":
+        return MarkdownSplitter(recursive_splitter())
+    else:
+        raise ValueError(f"Unknown chunking strategy: {strategy}. Expected one of {CHUNKING_STRATEGIES}")
@@ -17,7 +17,18 @@ class Settings(BaseSettings):
     
     # Database Settings
     DATABASE_URL: str
-    DATABASE_ECHO: bool = True
+    DATABASE_ECHO: bool = False
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: float = 30.0
+    DATABASE_POOL_RECYCLE: int = 1800
+    DATABASE_POOL_PRE_PING: bool = True
+    DATABASE_QUERY_CACHE_SIZE: int = 500
+    DATABASE_STATEMENT_CACHE_SIZE: int = 100
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
     
     # Redis Settings
     REDIS_URL: str
@@ -27,20 +38,112 @@ class Settings(BaseSettings):
     LLM_TEMPERATURE: float
     LLM_MAX_NEW_TOKENS: int
     LLM_REPETITION_PENALTY: float
+    LLM_BATCH_SIZE: int = 1
+    LLM_BATCH_WAIT_MS: float = 10.0
+    LLM_BATCH_MAX_NEW_TOKENS: Optional[int] = None
+    
+    # Inference Settings
+    INFERENCE_WORKERS: int = 1
+    INFERENCE_MAX_QUEUE: int = 16
+    INFERENCE_QUEUE_TIMEOUT: float = 30.0
+    
+    # Agent Settings
+    PROMPT_RELOAD_INTERVAL: float = 5.0
     
     # Embedding Model Settings
     EMBEDDING_MODEL: str
     EMBEDDING_DEVICE: str
     EMBEDDING_NORMALIZE: bool
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "./embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MEMORY_ITEMS: int = 10000
+    EMBEDDING_BATCH_SIZE: Optional[int] = None
     
     # Vector Store Settings
     VECTOR_STORE_PATH: str
     VECTOR_STORE_COLLECTION: str
     
+    # Retrieval Settings
+    RETRIEVAL_K: int = 4
+    RETRIEVAL_FETCH_K: int = 20
+    RETRIEVAL_SEARCH_TYPE: str = "similarity"
+    RETRIEVAL_SCORE_THRESHOLD: Optional[float] = None
+    RETRIEVAL_MMR_LAMBDA: float = 0.5
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_DENSE_WEIGHT: float = 1.0
+    HYBRID_LEXICAL_WEIGHT: float = 1.0
+    HYBRID_RRF_K: int = 60
+    LEXICAL_INDEX_PATH: str = "./lexical_index.sqlite3"
+    
+    # Rerank Settings
+    RERANK_ENABLED: bool = False
+    RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_ONNX_FILE: str = "onnx/model.onnx"
+    RERANK_CANDIDATES: int = 20
+    RERANK_BATCH_SIZE: int = 16
+    RERANK_MAX_LENGTH: int = 512
+    RERANK_CACHE_SIZE: int = 10000
+    
+    # Context Settings
+    CONTEXT_TOKEN_BUDGET: int = 1000
+    CONTEXT_TOKENIZER: Optional[str] = None
+    
+    # History Settings
+    HISTORY_MAX_TURNS: int = 6
+    HISTORY_TOOL_TURNS: int = 1
+    HISTORY_SUMMARIZE: bool = True
+    HISTORY_FOLD_BATCH: int = 4
+    HISTORY_SUMMARY_MAX_TOKENS: int = 300
+    
+    # Checkpoint Settings
+    CHECKPOINTER: str = "database"
+    CHECKPOINT_KEEP: int = 3
+    CHECKPOINT_TTL: Optional[float] = 7 * 24 * 3600
+    CHECKPOINT_SWEEP_INTERVAL: float = 300.0
+    CHECKPOINT_CACHE_SIZE: int = 1000
+    CHECKPOINT_COMPRESS_MIN_BYTES: int = 512
+    
+    # Chat Log Settings
+    CHAT_LOG_QUEUE_SIZE: int = 10000
+    CHAT_LOG_BATCH_SIZE: int = 200
+    CHAT_LOG_FLUSH_MS: float = 250.0
+    CHAT_LOG_SHUTDOWN_TIMEOUT: float = 10.0
+    
+    # Chunking Settings
+    CHUNKING_STRATEGY: str = "semantic"
+    CHUNK_SIZE: int = 256
+    CHUNK_OVERLAP: int = 32
+    
+    # Answer Cache Settings
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_BACKEND: str = "memory"
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+    ANSWER_CACHE_TTL: float = 3600.0
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    
     # File Upload Settings
     UPLOAD_DIR: str
     MAX_UPLOAD_SIZE: int
     ALLOWED_EXTENSIONS: set = {".pdf", ".txt", ".json", ".md", ".docx", ".pptx"}
+    MAX_BATCH_FILES: int = 5000
+    
+    # Document Listing Settings
+    LIST_DOCUMENTS_PAGE_SIZE: int = 50
+    LIST_DOCUMENTS_MAX_PAGE_SIZE: int = 500
+    LIST_DOCUMENTS_COUNT_TTL: float = 5.0
+    
+    # Ingestion Settings
+    INGESTION_WORKERS: int = 2
+    INGESTION_QUEUE_SIZE: int = 100
+    INGESTION_BATCH_PAGES: int = 8
+    INGESTION_WRITE_BATCH_SIZE: int = 1024
+    
+    # Parser Settings
+    PARSER_WORKERS: Optional[int] = None
+    PARSER_MAX_TASKS_PER_CHILD: int = 20
+    PARSER_TIMEOUT: float = 300.0
+    PARSER_PROCESS_FORMATS: set = {".pdf", ".pptx", ".docx"}
+    PARSER_PAGE_RANGE: int = 16
     
     # CORS Settings
     CORS_ORIGINS: list = ["*"]
@@ -48,6 +151,13 @@ class Settings(BaseSettings):
     CORS_ALLOW_METHODS: list = ["*"]
     CORS_ALLOW_HEADERS: list = ["*"]
     
+    # Tracing Settings
+    TRACING_ENABLED: bool = False
+    TRACING_SAMPLE_RATIO: float = 1.0
+    TRACING_EXPORTER: str = "otlp"
+    TRACING_OTLP_ENDPOINT: Optional[str] = None
+    TRACING_SERVICE_NAME: Optional[str] = None
+    
     # Logging Settings
     LOG_LEVEL: str
     LOG_FORMAT: str
@@ -0,0 +1,193 @@
+import functools
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+from langchain_core.documents import Document
+from utils.config import config
+from utils.logging_config import logger
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])(\s+)")
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split text at sentence boundaries.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        List[str]: The non-empty sentences, stripped.
+    """
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def split_sentences_with_breaks(text: str) -> List[Tuple[str, str]]:
+    """
+    Split text at sentence boundaries, keeping the whitespace between sentences, so
+    paragraph and list breaks can be put back.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        List[Tuple[str, str]]: The whitespace before each sentence ("" for the
+            first one) and the sentence.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    pieces = _SENTENCE_BREAK.split(text)
+    return [("", pieces[0])] + list(zip(pieces[1::2], pieces[2::2]))
+
+
+@functools.lru_cache(maxsize=None)
+def load_token_counter(model_name: str) -> Callable[[str], int]:
+    """
+    Get a token counter for a model, falling back to an estimate if its tokenizer
+    cannot be loaded (e.g. for a remote model).
+
+    Args:
+        model_name (str): The Hugging Face model whose tokenizer is used.
+
+    Returns:
+        Callable[[str], int]: Maps a text to its number of tokens.
+    """
+    from utils.chunking import token_counter
+
+    try:
+        return token_counter(model_name)
+    except Exception as e:
+        logger.warning(f"No tokenizer for {model_name}, estimating 4 characters per token: {str(e)}")
+        return lambda text: max(1, len(text) // 4)
+
+
+@dataclass
+class AssembledContext:
+    text: str
+    tokens: int
+    chunks: int
+    truncated: bool
+    sources: List[str] = field(default_factory=list)
+
+    def usage(self) -> dict:
+        return {
+            "context_tokens": self.tokens,
+            "context_chunks": self.chunks,
+            "context_truncated": self.truncated,
+            "sources": self.sources,
+        }
+
+
+class ContextAssembler:
+    """
+    Builds the retrieved context handed to the LLM within a token budget.
+
+    Chunks are taken in order of relevance (their rerank or fusion score when they
+    have one, retrieval order otherwise). Sentences already taken from an earlier
+    chunk are dropped, which removes duplicate chunks and the overlap between
+    neighbouring ones. Chunks are added while they fit in `token_budget`; the first
+    one that does not fit is cut at the last sentence that does, and nothing is
+    added after it. The prompt, and so the prefill time of the model, therefore
+    stays bounded whatever the size of the chunks.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = config.CONTEXT_TOKEN_BUDGET,
+        count_tokens: Optional[Callable[[str], int]] = None,
+    ) -> None:
+        """
+        Initialize a ContextAssembler object.
+
+        Args:
+            token_budget (int): The maximum number of tokens of the assembled context.
+            count_tokens (Optional[Callable[[str], int]]): Counts the tokens of a text.
+                Defaults to the tokenizer of CONTEXT_TOKENIZER, or of CHAT_MODEL.
+        """
+        self.token_budget = token_budget
+        self._count_tokens = count_tokens
+
+    def count_tokens(self, text: str) -> int:
+        if self._count_tokens is None:
+            self._count_tokens = load_token_counter(config.CONTEXT_TOKENIZER or config.CHAT_MODEL)
+        return self._count_tokens(text)
+
+    @staticmethod
+    def _relevance(document: Document) -> Optional[float]:
+        for key in ("rerank_score", "score"):
+            if document.metadata.get(key) is not None:
+                return document.metadata[key]
+        return None
+
+    def assemble(self, documents: List[Document], separator: str = "\n\n") -> AssembledContext:
+        """
+        Assemble retrieved documents into a context within the token budget.
+
+        Args:
+            documents (List[Document]): The retrieved documents, in retrieval order.
+            separator (str): The text placed between chunks.
+
+        Returns:
+            AssembledContext: The context, its token count, the number of chunks it
+                holds, whether a chunk was cut or left out, and the chunks' sources.
+        """
+        if all(self._relevance(document) is not None for document in documents):
+            documents = sorted(documents, key=self._relevance, reverse=True)
+
+        separator_tokens = self.count_tokens(separator)
+        seen = set()
+        parts: List[str] = []
+        sources: List[str] = []
+        tokens = 0
+        truncated = False
+
+        for document in documents:
+            sentences = []
+            carried = ""
+            for before, sentence in split_sentences_with_breaks(document.page_content):
+                # a dropped sentence hands its paragraph or line break to the next one
+                if carried.count("\n") > before.count("\n"):
+                    before = carried
+                key = " ".join(sentence.lower().split())
+                if key in seen:
+                    carried = before
+                    continue
+                seen.add(key)
+                sentences.append((before, sentence))
+                carried = ""
+            if not sentences:
+                continue
+
+            cost = separator_tokens if parts else 0
+            kept = []
+            for before, sentence in sentences:
+                sentence_tokens = self.count_tokens(sentence) + (1 if kept else 0)
+                if tokens + cost + sentence_tokens > self.token_budget:
+                    truncated = True
+                    break
+                cost += sentence_tokens
+                kept.append(before + sentence if kept else sentence)
+
+            if kept:
+                parts.append("".join(kept))
+                tokens += cost
+                source = document.metadata.get("filename") or document.metadata.get("source")
+                if source and source not in sources:
+                    sources.append(source)
+            if truncated:
+                break
+
+        text = separator.join(parts)
+        return AssembledContext(
+            text=text,
+            tokens=self.count_tokens(text) if text else 0,
+            chunks=len(parts),
+            truncated=truncated,
+            sources=sources,
+        )
+
+
+context_assembler = ContextAssembler()
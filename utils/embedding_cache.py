@@ -0,0 +1,182 @@
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from utils.metrics import EMBEDDING_CACHE_LOOKUPS
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches vectors by content hash.
+
+    Keys are sha256 hashes of (model name, normalize flag, kind, text), so a vector is
+    only reused for the exact same model settings. Lookups go to an in-memory LRU
+    first, then to a SQLite file on disk; only texts missing from both are sent to
+    the wrapped model, in a single batch.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        normalize: bool,
+        path: str,
+        max_memory_items: int = 10000,
+    ) -> None:
+        """
+        Initialize a CachedEmbeddings object.
+
+        Args:
+            embeddings (Embeddings): The embedding model to wrap.
+            model_name (str): The name of the wrapped model, part of the cache key.
+            normalize (bool): Whether the wrapped model normalizes, part of the cache key.
+            path (str): The path of the SQLite cache file.
+            max_memory_items (int): The number of vectors kept in the in-memory LRU.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.normalize = normalize
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def _key(self, text: str, kind: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return hashlib.sha256(
+            f"{self.model_name}\0{self.normalize}\0{kind}\0{digest}".encode("utf-8")
+        ).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self.hits["memory"] += len(found)
+            EMBEDDING_CACHE_LOOKUPS.labels(result="memory_hit").inc(len(found))
+
+            missing = [key for key in keys if key not in found]
+            connection = self._get_connection()
+            for i in range(0, len(missing), 500):
+                batch = missing[i:i + 500]
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f", blob).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self.hits["disk"] += 1
+                EMBEDDING_CACHE_LOOKUPS.labels(result="disk_hit").inc(len(rows))
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]) -> None:
+        with self._lock:
+            connection = self._get_connection()
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in vectors.items()],
+            )
+            connection.commit()
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents, computing only the ones not cached yet.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: One vector per text, in order.
+        """
+        keys = [self._key(text, "document") for text in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            self.misses += len(missing)
+            EMBEDDING_CACHE_LOOKUPS.labels(result="miss").inc(len(missing))
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query, from the cache when possible.
+
+        Queries are cached apart from documents, as some models encode them differently.
+
+        Args:
+            text (str): The query to embed.
+
+        Returns:
+            List[float]: The query vector.
+        """
+        key = self._key(text, "query")
+        found = self._lookup([key])
+        if key in found:
+            return found[key]
+
+        self.misses += 1
+        EMBEDDING_CACHE_LOOKUPS.labels(result="miss").inc()
+        vector = self.embeddings.embed_query(text)
+        self._store({key: vector})
+        return vector
+
+    def stats(self) -> dict:
+        """
+        Get the hit and miss counters.
+
+        Returns:
+            dict: Memory hits, disk hits, misses and the number of vectors in memory.
+        """
+        return {
+            "memory_hits": self.hits["memory"],
+            "disk_hits": self.hits["disk"],
+            "misses": self.misses,
+            "memory_items": len(self._memory),
+        }
+
+    def close(self) -> None:
+        """
+        Close the SQLite connection.
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
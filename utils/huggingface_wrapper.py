@@ -1,41 +1,134 @@
 from langchain_huggingface import ChatHuggingFace, HuggingFacePipeline, HuggingFaceEmbeddings
 from utils.config import config
+from utils.batching import BatchedHuggingFacePipeline
+from utils.embedding_cache import CachedEmbeddings
+from utils.metrics import EMBEDDING_SECONDS, QUERY_EMBEDDING_SECONDS
+from utils.tracing import start_span
 
 
-def load_llm_model(model_name: str = None) -> ChatHuggingFace:
-    """Load the LLM model from HuggingFace"""
+def load_llm_model(model_name: str = None, batch_size: int = None) -> ChatHuggingFace:
+    """
+    Load the LLM model from HuggingFace.
+
+    With a batch size above 1, concurrent generations are merged into padded
+    batches by a BatchedHuggingFacePipeline.
+    """
     if model_name is None:
         model_name = config.CHAT_MODEL
-    
-    llm = HuggingFacePipeline.from_model_id(
-        model_id=model_name,
-        task="text-generation",
-        pipeline_kwargs=dict(
-            max_new_tokens=config.LLM_MAX_NEW_TOKENS,
-            do_sample=False,
-            repetition_penalty=config.LLM_REPETITION_PENALTY,
-        ),
+    if batch_size is None:
+        batch_size = config.LLM_BATCH_SIZE
+        
+    pipeline_kwargs = dict(
+        max_new_tokens=config.LLM_MAX_NEW_TOKENS,
+        do_sample=False,
+        repetition_penalty=config.LLM_REPETITION_PENALTY,
     )
+    
+    if batch_size > 1:
+        llm = BatchedHuggingFacePipeline.from_model_id(
+            model_id=model_name,
+            task="text-generation",
+            batch_size=batch_size,
+            pipeline_kwargs=pipeline_kwargs,
+        )
+        llm.max_wait_ms = config.LLM_BATCH_WAIT_MS
+        llm.max_new_tokens_cap = config.LLM_BATCH_MAX_NEW_TOKENS
+        
+        # decoder-only models must be left-padded to generate a batch
+        tokenizer = llm.pipeline.tokenizer
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+    else:
+        llm = HuggingFacePipeline.from_model_id(
+            model_id=model_name,
+            task="text-generation",
+            pipeline_kwargs=pipeline_kwargs,
+        )
 
     chat_model = ChatHuggingFace(llm=llm)
     
     return chat_model
 
 
+def is_local_model(chat_model) -> bool:
+    """Whether the chat model runs in-process on a local HuggingFace pipeline"""
+    return isinstance(getattr(chat_model, "llm", None), HuggingFacePipeline)
+
+
+def shutdown_llm(chat_model) -> None:
+    """Stop the batching thread of the chat model, if it batches its generations"""
+    pipeline = getattr(chat_model, "llm", None)
+    if isinstance(pipeline, BatchedHuggingFacePipeline):
+        pipeline.shutdown_batcher()
+
+
+def embedding_batch_size(device: str = None) -> int:
+    """
+    Get the number of texts the embedding model encodes per forward pass.
+
+    EMBEDDING_BATCH_SIZE wins when set; otherwise the size follows EMBEDDING_DEVICE,
+    as a GPU only pays off with large batches while a CPU gains little past a few dozen.
+
+    Args:
+        device (str): The device the model runs on. Defaults to EMBEDDING_DEVICE.
+
+    Returns:
+        int: The batch size.
+    """
+    if config.EMBEDDING_BATCH_SIZE:
+        return config.EMBEDDING_BATCH_SIZE
+    device = (device or config.EMBEDDING_DEVICE).lower()
+    if device.startswith("cuda"):
+        return 256
+    if device.startswith("mps"):
+        return 128
+    return 32
+
+
+class TimedHuggingFaceEmbeddings(HuggingFaceEmbeddings):
+    """HuggingFaceEmbeddings recording every encoding call in rag_stage_seconds and as a span"""
+
+    def embed_documents(self, texts):
+        with EMBEDDING_SECONDS.time(), start_span("embedding.documents", **{"embedding.texts": len(texts)}):
+            return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        with QUERY_EMBEDDING_SECONDS.time(), start_span("embedding.query"):
+            return super().embed_query(text)
+
+
 def load_embedding_model(model_name: str = None):
-    """Load the embedding model from HuggingFace"""
+    """
+    Load the embedding model from HuggingFace.
+
+    Unless EMBEDDING_CACHE_ENABLED is off, the model is wrapped in CachedEmbeddings
+    so re-embedding the same text is served from the cache.
+    """
     if model_name is None:
         model_name = config.EMBEDDING_MODEL
         
     model_kwargs = {"device": config.EMBEDDING_DEVICE}
-    encode_kwargs = {"normalize_embeddings": config.EMBEDDING_NORMALIZE}
+    encode_kwargs = {
+        "normalize_embeddings": config.EMBEDDING_NORMALIZE,
+        "batch_size": embedding_batch_size(),
+    }
     
-    embedding_model = HuggingFaceEmbeddings(
+    embedding_model = TimedHuggingFaceEmbeddings(
         model_name=model_name,
         model_kwargs=model_kwargs,
         encode_kwargs=encode_kwargs,
     )
     
+    if config.EMBEDDING_CACHE_ENABLED:
+        embedding_model = CachedEmbeddings(
+            embeddings=embedding_model,
+            model_name=model_name,
+            normalize=config.EMBEDDING_NORMALIZE,
+            path=config.EMBEDDING_CACHE_PATH,
+            max_memory_items=config.EMBEDDING_CACHE_MEMORY_ITEMS,
+        )
+    
     return embedding_model
 
 
@@ -0,0 +1,105 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.config import config
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], weights: List[float], rrf_k: int = 60) -> Dict[str, float]:
+    """
+    Fuse ranked lists of ids with weighted reciprocal rank fusion.
+
+    Each id scores sum(weight / (rrf_k + rank)) over the lists it appears in, ranks
+    starting at 1. Only ranks are used, so lists with incomparable scores, such as
+    cosine distances and BM25, can be fused.
+
+    Args:
+        rankings (List[List[str]]): The ranked ids of each retriever, best first.
+        weights (List[float]): The weight of each retriever.
+        rrf_k (int): Damps the advantage of the top ranks.
+
+    Returns:
+        Dict[str, float]: The fused score of every id, best first.
+    """
+    scores: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + weight / (rrf_k + rank)
+    return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever fusing dense vector search with the BM25 lexical index.
+
+    Both searches return their `fetch_k` best chunks, which are fused with weighted
+    reciprocal rank fusion; the `k` best are returned, with their fused score in the
+    `score` metadata. A weight of 0 turns a search off.
+
+    `search_type` and `score_threshold` apply to the dense side: "mmr" picks `k`
+    diverse chunks out of its `fetch_k` nearest, and a threshold drops dense results
+    whose relevance score is lower. Lexical matches are kept regardless, as an exact
+    token match is what the lexical side is for.
+    """
+
+    vector_store: Any
+    """The Chroma_VectorStore holding the collection and the lexical index."""
+    k: int = config.RETRIEVAL_K
+    fetch_k: int = config.RETRIEVAL_FETCH_K
+    dense_weight: float = config.HYBRID_DENSE_WEIGHT
+    lexical_weight: float = config.HYBRID_LEXICAL_WEIGHT
+    rrf_k: int = config.HYBRID_RRF_K
+    search_type: str = config.RETRIEVAL_SEARCH_TYPE
+    score_threshold: Optional[float] = config.RETRIEVAL_SCORE_THRESHOLD
+    lambda_mult: float = config.RETRIEVAL_MMR_LAMBDA
+
+    def _dense_ids(self, query: str) -> List[str]:
+        if not self.dense_weight:
+            return []
+        chroma = self.vector_store.chroma
+
+        if self.search_type == "mmr":
+            documents = chroma.max_marginal_relevance_search(
+                query, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult
+            )
+        elif self.score_threshold is not None or self.search_type == "similarity_score_threshold":
+            scored = chroma.similarity_search_with_relevance_scores(query, k=self.fetch_k)
+            threshold = self.score_threshold or 0.0
+            documents = [document for document, score in scored if score >= threshold]
+        else:
+            documents = chroma.similarity_search(query, k=self.fetch_k)
+        return [document.id for document in documents]
+
+    def _lexical_ids(self, query: str) -> List[str]:
+        if not self.lexical_weight:
+            return []
+        return [chunk_id for chunk_id, _ in self.vector_store.lexical_index.search(query, self.fetch_k)]
+
+    def _fuse(self, dense_ids: List[str], lexical_ids: List[str]) -> List[Document]:
+        fused = reciprocal_rank_fusion(
+            [dense_ids, lexical_ids], [self.dense_weight, self.lexical_weight], self.rrf_k
+        )
+        top_ids = list(fused)[:self.k]
+        if not top_ids:
+            return []
+
+        found = self.vector_store.chroma._collection.get(ids=top_ids, include=["documents", "metadatas"])
+        by_id = {
+            chunk_id: Document(id=chunk_id, page_content=text, metadata={**(metadata or {}), "score": fused[chunk_id]})
+            for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+        return [by_id[chunk_id] for chunk_id in top_ids if chunk_id in by_id]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._fuse(self._dense_ids(query), self._lexical_ids(query))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        loop = asyncio.get_running_loop()
+        dense_ids, lexical_ids = await asyncio.gather(
+            loop.run_in_executor(None, self._dense_ids, query),
+            loop.run_in_executor(None, self._lexical_ids, query),
+        )
+        return await loop.run_in_executor(None, self._fuse, dense_ids, lexical_ids)
@@ -0,0 +1,124 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from utils.config import config
+from utils.logging_config import logger
+
+
+class InferenceOverloaded(Exception):
+    """Base class for inference backpressure errors"""
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class InferenceQueueFull(InferenceOverloaded):
+    """Raised when too many generations are already waiting"""
+    status_code = 429
+
+
+class InferenceTimeout(InferenceOverloaded):
+    """Raised when a generation waited too long for a free inference worker"""
+    status_code = 503
+
+
+class InferenceExecutor:
+    """
+    A dedicated, bounded executor for local model inference.
+
+    Generations run on their own thread pool, so a long generation never blocks the
+    event loop or starves the default executor used for file and vector store I/O.
+    At most `workers` generations run at once and at most `max_queue` more may wait
+    for a worker; beyond that calls fail fast with InferenceQueueFull, and a call
+    that waits longer than `queue_timeout` seconds fails with InferenceTimeout.
+    """
+
+    def __init__(
+        self,
+        workers: int = config.INFERENCE_WORKERS,
+        max_queue: int = config.INFERENCE_MAX_QUEUE,
+        queue_timeout: float = config.INFERENCE_QUEUE_TIMEOUT,
+    ) -> None:
+        """
+        Initialize an InferenceExecutor object.
+
+        Args:
+            workers (int): The number of generations that can run at once.
+            max_queue (int): The number of generations that can wait for a worker.
+            queue_timeout (float): The number of seconds a generation may wait for a worker.
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """The number of generations running or waiting."""
+        return self._pending
+
+    def is_full(self) -> bool:
+        return self._pending >= self.workers + self.max_queue
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        return self._executor
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """
+        Run a blocking function on the inference threads and await its result.
+
+        Args:
+            fn (Callable): The blocking function to run.
+            *args: Positional arguments for fn.
+            **kwargs: Keyword arguments for fn.
+
+        Returns:
+            The return value of fn.
+
+        Raises:
+            InferenceQueueFull: If the queue-depth limit has been reached.
+            InferenceTimeout: If no worker became free within queue_timeout.
+        """
+        if self.is_full():
+            raise InferenceQueueFull("Too many generations in flight, try again later.")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        self._pending += 1
+        try:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise InferenceTimeout("Timed out waiting for an inference worker.")
+
+            try:
+                loop = asyncio.get_running_loop()
+                context = contextvars.copy_context()
+                call = functools.partial(fn, *args, **kwargs)
+                return await loop.run_in_executor(self._get_executor(), context.run, call)
+            finally:
+                self._slots.release()
+        finally:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        """
+        Stop the inference threads. Queued generations are cancelled.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Inference executor stopped")
+
+
+# a batch can only fill up if as many generations are waiting on it
+inference_executor = InferenceExecutor(workers=max(config.INFERENCE_WORKERS, config.LLM_BATCH_SIZE))
@@ -0,0 +1,173 @@
+import re
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+
+# Word characters joined by - _ . / so part numbers, error codes and ids stay whole;
+# FTS5 then matches each of them as a phrase.
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-_./]\w+)*")
+
+
+def query_terms(text: str) -> List[str]:
+    """
+    Split a query into the terms looked up in the lexical index.
+
+    Args:
+        text (str): The query.
+
+    Returns:
+        List[str]: The distinct terms, in order of appearance.
+    """
+    return list(dict.fromkeys(match.group(0).lower() for match in _TOKEN_PATTERN.finditer(text)))
+
+
+class LexicalIndex:
+    """
+    On-disk BM25 index of the chunks in the vector store.
+
+    Chunks are stored in a SQLite FTS5 table next to the Chroma collection, under
+    the same ids, and ranked with FTS5's built-in bm25(). Exact tokens such as part
+    numbers, error codes and ids, which dense embeddings tend to blur, are matched
+    as written. The connection is opened on first use, and FTS5 reads its postings
+    from disk, so nothing is loaded into memory at startup.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialize a LexicalIndex object.
+
+        Args:
+            path (str): The path of the SQLite index file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+                "chunk_id UNINDEXED, document_id UNINDEXED, text, "
+                "tokenize = \"unicode61 tokenchars '-_'\")"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def count(self) -> int:
+        """
+        Get the number of chunks in the index.
+
+        Returns:
+            int: The number of chunks.
+        """
+        with self._lock:
+            return self._get_connection().execute("SELECT count(*) FROM chunks").fetchone()[0]
+
+    def add(self, ids: List[str], texts: List[str], document_ids: List[Optional[int]]) -> None:
+        """
+        Add or replace chunks.
+
+        Args:
+            ids (List[str]): The ids of the chunks, as in the vector store.
+            texts (List[str]): The texts of the chunks.
+            document_ids (List[Optional[int]]): The document of each chunk, if any.
+        """
+        with self._lock:
+            connection = self._get_connection()
+            self._delete(connection, ids)
+            connection.executemany(
+                "INSERT INTO chunks (chunk_id, document_id, text) VALUES (?, ?, ?)",
+                list(zip(ids, document_ids, texts)),
+            )
+            connection.commit()
+
+    def _delete(self, connection: sqlite3.Connection, ids: List[str]) -> None:
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            connection.execute(f"DELETE FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch)
+
+    def delete(self, ids: List[str]) -> None:
+        """
+        Delete chunks by id.
+
+        Args:
+            ids (List[str]): The ids of the chunks.
+        """
+        with self._lock:
+            connection = self._get_connection()
+            self._delete(connection, ids)
+            connection.commit()
+
+    def delete_document(self, document_id: int) -> None:
+        """
+        Delete every chunk of a document.
+
+        Args:
+            document_id (int): The id of the document.
+        """
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+            connection.commit()
+
+    def reassign_document(self, document_id: int, new_document_id: int) -> None:
+        """
+        Move the chunks of a document to another document.
+
+        Args:
+            document_id (int): The id of the current owner.
+            new_document_id (int): The id of the new owner.
+        """
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute(
+                "UPDATE chunks SET document_id = ? WHERE document_id = ?", (new_document_id, document_id)
+            )
+            connection.commit()
+
+    def clear(self) -> None:
+        """
+        Delete every chunk.
+        """
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute("DELETE FROM chunks")
+            connection.commit()
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        Find the chunks that best match the terms of a query, by BM25.
+
+        Any term may match; chunks matching more and rarer terms rank higher.
+
+        Args:
+            query (str): The query.
+            k (int): The maximum number of chunks returned.
+
+        Returns:
+            List[Tuple[str, float]]: The chunk ids and their BM25 scores, best first.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+        with self._lock:
+            rows = self._get_connection().execute(
+                "SELECT chunk_id, bm25(chunks) AS score FROM chunks WHERE chunks MATCH ? ORDER BY score LIMIT ?",
+                (match, k),
+            ).fetchall()
+        # bm25() is lower for better matches
+        return [(chunk_id, -score) for chunk_id, score in rows]
+
+    def close(self) -> None:
+        """
+        Close the SQLite connection.
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
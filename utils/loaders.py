@@ -1,4 +1,6 @@
 import asyncio
+import time
+from pathlib import Path
 from langchain_community.document_loaders import (
     PyPDFLoader,
     TextLoader,
@@ -8,156 +10,230 @@ from langchain_community.document_loaders import (
     UnstructuredPowerPointLoader,
     Docx2txtLoader
 )
-from typing import List
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+from typing import AsyncIterator, List
+from utils.config import config
+from utils.parsing_pool import parser_pool
+from utils.metrics import PARSE_SECONDS
+
+
+_DONE = object()
+
+
+def create_loader(file_path: str) -> BaseLoader:
+    """
+    Create the LangChain loader for a file, based on its extension.
+
+    Args:
+        file_path (str): The path to the file to load.
+
+    Returns:
+        BaseLoader: The loader for the file.
+
+    Raises:
+        ValueError: If the file type is not supported.
+    """
+    file_path_lower = file_path.lower()
+    if file_path_lower.endswith(".pdf"):
+        return PyPDFLoader(file_path)
+    elif file_path_lower.endswith(".pptx"):
+        return UnstructuredPowerPointLoader(file_path)
+    elif file_path_lower.endswith(".txt"):
+        return TextLoader(file_path, encoding='utf-8')
+    elif file_path_lower.endswith(".csv"):
+        return CSVLoader(file_path, encoding='utf-8')
+    elif file_path_lower.endswith(".json"):
+        return JSONLoader(file_path)
+    elif file_path_lower.endswith(".md"):
+        if config.CHUNKING_STRATEGY == "markdown":
+            # Keep the raw markdown, so the structure-aware splitter sees the headings.
+            return TextLoader(file_path, encoding='utf-8')
+        return UnstructuredMarkdownLoader(file_path, mode="single", encoding='utf-8')
+    elif file_path_lower.endswith(".docx"):
+        return Docx2txtLoader(file_path)
+    else:
+        raise ValueError(f"Unsupported file type: {file_path}")
+
+
+def load_file(file_path: str) -> List[Document]:
+    """
+    Parse a whole file. Module level, so it can run in a parser worker process.
+
+    Args:
+        file_path (str): The path to the file to load.
+
+    Returns:
+        List[Document]: The pages or sections of the file.
+    """
+    return create_loader(file_path).load()
+
+
+def load_pages(file_path: str, start: int, count: int) -> List[Document]:
+    """
+    Parse a range of pages of a PDF. Module level, so it can run in a parser worker process.
+
+    The PDF is opened with pypdf and only the requested pages have their text
+    extracted. Other formats cannot be read a range at a time without parsing what
+    comes before it, and are parsed whole with load_file.
+
+    Args:
+        file_path (str): The path to the PDF.
+        start (int): The index of the first page.
+        count (int): The maximum number of pages.
+
+    Returns:
+        List[Document]: The pages, fewer than `count` once the end of the file is reached.
+
+    Raises:
+        ValueError: If the file is not a PDF.
+    """
+    if not file_path.lower().endswith(".pdf"):
+        raise ValueError(f"Only PDFs are loaded by page range: {file_path}")
+
+    import pypdf
+
+    reader = pypdf.PdfReader(file_path)
+    total_pages = len(reader.pages)
+    return [
+        Document(
+            page_content=reader.pages[page].extract_text(),
+            metadata={"source": file_path, "page": page, "total_pages": total_pages},
+        )
+        for page in range(start, min(start + count, total_pages))
+    ]
+
+
+def uses_parser_pool(file_path: str) -> bool:
+    """
+    Tell whether a file is parsed in the parser process pool rather than on a thread.
+
+    Args:
+        file_path (str): The path to the file to load.
+
+    Returns:
+        bool: True if the file's extension is in PARSER_PROCESS_FORMATS.
+    """
+    return Path(file_path).suffix.lower() in config.PARSER_PROCESS_FORMATS
 
 
 class Loader(object):
-    def __init__(self, file_paths: List[str]):
+    def __init__(self, file_paths: List[str], page_range: int = config.PARSER_PAGE_RANGE):
         """
         Initialize a Loader object.
 
         Args:
             file_paths (List[str]): List of files to load. Defaults to None.
+            page_range (int): The number of pages parsed per task in the parser pool.
         """
         self.file_paths = file_paths
+        self.page_range = max(1, page_range)
 
-    async def __pdf_loader(self, file_path: str) -> list:
+    async def __load(self, file_path: str) -> List[Document]:
         """
-        Load a PDF file.
+        Load a whole file, in the parser pool or in the default executor.
 
         Args:
-            file_path (str): The path to the PDF file to load.
+            file_path (str): The path to the file to load.
 
         Returns:
-            list: A list of text chunks from the PDF file.
+            List[Document]: The pages or sections of the file.
         """
-        loop = asyncio.get_event_loop()
-        loader = PyPDFLoader(file_path)
-        return await loop.run_in_executor(None, loader.load)
-
-    async def __pptx_loader(self, file_path: str) -> list:
-        """
-        Load a PowerPoint file.
-
-        Args:
-            file_path (str): The path to the PowerPoint file to load.
-
-        Returns:
-            list: A list of text chunks from the PowerPoint file.
-        """
-        loop = asyncio.get_event_loop()
-        loader = UnstructuredPowerPointLoader(file_path)
-        return await loop.run_in_executor(None, loader.load)
-
-    async def __text_loader(self, file_path: str) -> list:
-        
-        """
-        Load a text file.
-
-        Args:
-            file_path (str): The path to the text file to load.
-
-        Returns:
-            list: A list of text chunks from the text file.
-        """
-        loop = asyncio.get_event_loop()
-        loader = TextLoader(file_path, encoding='utf-8')
-        return await loop.run_in_executor(None, loader.load)
+        with PARSE_SECONDS.labels(format=Path(file_path).suffix.lower()).time():
+            if uses_parser_pool(file_path):
+                return await parser_pool.run(load_file, file_path)
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, load_file, file_path)
 
-    async def __csv_loader(self, file_path: str) -> list:
+    async def __load_file(self) -> List[List[Document]]:
         """
-        Load a CSV file asynchronously.
-
-        Args:
-            file_path (str): The path to the CSV file to load.
+        Load content from files asynchronously.
 
-        Returns:
-            list: A list of text chunks from the CSV file.
-        """
-        loop=asyncio.get_event_loop()
-        loader = CSVLoader(file_path, encoding='utf-8')
-        return await loop.run_in_executor(None, loader.load)
-    
-    async def __json_loader(self, file_path: str) -> list:
-        """
-        Load a JSON file asynchronously.
+        This method will load content from each file in self.file_paths asynchronously
+        using the appropriate loader. It will return a list of lists, where each inner list
+        contains the content from a single file.
 
         Args:
-            file_path (str): The path to the JSON file to load.
+            None
 
         Returns:
-            list: A list of text chunks from the JSON file.
-        """
-        loop = asyncio.get_event_loop()
-        loader = JSONLoader(file_path)
-        return await loop.run_in_executor(None, loader.load)
-
-    async def __markdown_loader(self, file_path: str) -> list:
+            List[List[Document]]: A list of lists, where each inner list contains the content from a single file.
         """
-        Load a Markdown file asynchronously.
-
-        Args:
-            file_path (str): The path to the Markdown file to load.
+        tasks = [self.__load(file_path) for file_path in self.file_paths]
+        return await asyncio.gather(*tasks)
 
-        Returns:
-            list: A list of text chunks from the Markdown file.
-        """
-        loop = asyncio.get_event_loop()
-        loader = UnstructuredMarkdownLoader(file_path, mode="single", encoding='utf-8')
-        return await loop.run_in_executor(None, loader.load)
-    
-    async def __docx_loader(self, file_path: str) -> list:
+    async def iter_documents(self) -> AsyncIterator[Document]:
         """
-        Load a DOCX file asynchronously.
-
-        Args:
-            file_path (str): The path to the DOCX file to load.
-
-        Returns:
-            list: A list of text chunks from the DOCX file.
+        Yield the pages or sections of every file as they are parsed.
+
+        Files are read one after the other. Formats parsed on a thread go through their
+        loader's lazy_load, one page at a time in the default executor, so only the
+        page being handed out is held in memory. Formats in PARSER_PROCESS_FORMATS are
+        parsed in the parser pool: PDFs PARSER_PAGE_RANGE pages at a time, so only that
+        many pages of extracted text are held and sent back from the worker at once,
+        other formats in a single task.
+
+        Yields:
+            Document: A page or section, with `source`, `file_type` and, for paged
+                formats, `page` in its metadata.
         """
         loop = asyncio.get_event_loop()
-        loader = Docx2txtLoader(file_path)
-        return await loop.run_in_executor(None, loader.load)
-    
 
-    async def __load_file(self) -> List[list]:
+        for file_path in self.file_paths or []:
+            file_type = Path(file_path).suffix.lower()
+            parse_seconds = PARSE_SECONDS.labels(format=file_type)
+
+            if uses_parser_pool(file_path):
+                start, elapsed = 0, 0.0
+                paged = file_type == ".pdf"
+                while True:
+                    start_time = time.perf_counter()
+                    if paged:
+                        documents = await parser_pool.run(load_pages, file_path, start, self.page_range)
+                    else:
+                        documents = await parser_pool.run(load_file, file_path)
+                    elapsed += time.perf_counter() - start_time
+                    for document in documents:
+                        document.metadata.setdefault("source", file_path)
+                        document.metadata["file_type"] = file_type
+                        yield document
+                    if not paged or len(documents) < self.page_range:
+                        break
+                    start += self.page_range
+                parse_seconds.observe(elapsed)
+                continue
+
+            # only the parsing is timed, not the time the consumer spends on each page
+            start_time = time.perf_counter()
+            iterator = iter(create_loader(file_path).lazy_load())
+            elapsed = 0.0
+            while True:
+                document = await loop.run_in_executor(None, next, iterator, _DONE)
+                elapsed += time.perf_counter() - start_time
+                if document is _DONE:
+                    parse_seconds.observe(elapsed)
+                    break
+                document.metadata.setdefault("source", file_path)
+                document.metadata["file_type"] = file_type
+                yield document
+                start_time = time.perf_counter()
+
+    async def load_documents(self) -> List[Document]:
         """
-        Load content from files asynchronously.
-
-        This method will load content from each file in self.file_paths asynchronously
-        using the appropriate loader. It will return a list of lists, where each inner list
-        contains the content from a single file.
-
-        Args:
-            None
+        Load the pages or sections of every file, keeping their metadata.
 
         Returns:
-            List[list]: A list of lists, where each inner list contains the content from a single file.
+            List[Document]: The loaded documents, in file order, each with its source
+                and, for paged formats, its page number in the metadata.
         """
-        tasks = []
-        for file_path in self.file_paths:
-            file_path_lower = file_path.lower()
-            if file_path_lower.endswith(".pdf"):
-                tasks.append(self.__pdf_loader(file_path))
-            elif file_path_lower.endswith(".pptx"):
-                tasks.append(self.__pptx_loader(file_path))
-            elif file_path_lower.endswith(".txt"):
-                tasks.append(self.__text_loader(file_path))
-            elif file_path_lower.endswith(".csv"):
-                tasks.append(self.__csv_loader(file_path))
-            elif file_path_lower.endswith(".json"):
-                tasks.append(self.__json_loader(file_path))
-            elif file_path_lower.endswith(".md"):
-                tasks.append(self.__markdown_loader(file_path))
-            elif file_path_lower.endswith(".docx"):
-                tasks.append(self.__docx_loader(file_path))
-            else:
-                raise ValueError(f"Unsupported file type: {file_path}")
-
-        return await asyncio.gather(*tasks)
+        documents = []
 
+        if self.file_paths:
+            loaded_documents = await self.__load_file()
+            for doc_group in loaded_documents:
+                documents.extend(doc_group)
 
+        return documents
 
     async def load(self) -> str:
         """
@@ -165,18 +241,16 @@ class Loader(object):
 
         This method will load content from files.
         It will return the concatenated text content from all loaded files and/or web pages.
+        Prefer iter_documents for large files, as this holds every page in memory.
 
         Returns:
             str: The concatenated text content from the loaded files, or an empty string if no files are provided.
         """
-        text_content = ""
+        if not self.file_paths:
+            return ""
 
-        if self.file_paths:
-            loaded_documents = await self.__load_file()
-            for doc_group in loaded_documents:
-                for doc in doc_group:
-                    text_content += doc.page_content
-                    
+        loaded_documents = await self.__load_file()
+        text_content = "".join(
+            doc.page_content for doc_group in loaded_documents for doc in doc_group
+        )
         return text_content.replace("\n", "")
-    
-    
@@ -0,0 +1,100 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+
+# Agent graph
+GRAPH_BUILD_SECONDS = Histogram(
+    "agent_graph_build_seconds",
+    "Time spent building and compiling an agent graph",
+)
+GRAPH_BUILDS = Counter(
+    "agent_graph_builds_total",
+    "Number of agent graph builds",
+    ["reason"],
+)
+GRAPH_CACHED = Gauge(
+    "agent_graph_cached",
+    "Number of compiled agent graphs held by the registry",
+)
+
+# Chat
+CHAT_TTFT_SECONDS = Histogram(
+    "chat_time_to_first_token_seconds",
+    "Time from receiving a streamed query to its first generated token",
+)
+
+# Embeddings
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "embedding_cache_lookups_total",
+    "Embedding cache lookups by result",
+    ["result"],
+)
+ANSWER_CACHE_LOOKUPS = Counter(
+    "answer_cache_lookups_total",
+    "Semantic answer cache lookups by result",
+    ["result"],
+)
+
+# Chat log
+CHAT_LOG_ROWS = Counter(
+    "chat_log_rows_total",
+    "Chat messages handled by the log writer, by result",
+    ["result"],
+)
+
+# Database
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections of the database pool, by state",
+    ["state"],
+)
+
+
+# RAG pipeline stages. The children are bound once here, so timing a stage is a
+# single observe() on the hot path.
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Time spent in each stage of the RAG pipeline",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+CHUNKING_SECONDS = STAGE_SECONDS.labels(stage="chunking")
+EMBEDDING_SECONDS = STAGE_SECONDS.labels(stage="embedding")
+QUERY_EMBEDDING_SECONDS = STAGE_SECONDS.labels(stage="query_embedding")
+VECTOR_WRITE_SECONDS = STAGE_SECONDS.labels(stage="vector_write")
+RETRIEVAL_SECONDS = STAGE_SECONDS.labels(stage="retrieval")
+RERANK_SECONDS = STAGE_SECONDS.labels(stage="rerank")
+LLM_CALL_SECONDS = STAGE_SECONDS.labels(stage="llm_call")
+TOOL_SECONDS = STAGE_SECONDS.labels(stage="tool")
+CHECKPOINT_READ_SECONDS = STAGE_SECONDS.labels(stage="checkpoint_read")
+CHECKPOINT_WRITE_SECONDS = STAGE_SECONDS.labels(stage="checkpoint_write")
+CHAT_LOG_FLUSH_SECONDS = STAGE_SECONDS.labels(stage="chat_log_flush")
+PARSE_SECONDS = Histogram(
+    "loader_parse_seconds",
+    "Time spent parsing a file, by format",
+    ["format"],
+    buckets=STAGE_BUCKETS,
+)
+
+# LLM
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens sent to and generated by the LLM, for models that report their usage",
+    ["direction"],
+)
+ASSISTANT_RETRIES = Counter(
+    "assistant_empty_output_retries_total",
+    "Times the assistant asked the LLM again after an empty answer",
+)
+
+# Other caches
+RERANK_CACHE_LOOKUPS = Counter(
+    "rerank_cache_lookups_total",
+    "Cross-encoder score cache lookups by result",
+    ["result"],
+)
+CHECKPOINT_CACHE_LOOKUPS = Counter(
+    "checkpoint_cache_lookups_total",
+    "Latest-checkpoint cache lookups by result",
+    ["result"],
+)
@@ -0,0 +1,126 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+from utils.config import config
+from utils.logging_config import logger
+
+
+class ParseTimeout(Exception):
+    """Raised when parsing a file takes longer than the parser timeout"""
+
+
+def worker_processes(executor: ProcessPoolExecutor) -> list:
+    """
+    Get the worker processes of a ProcessPoolExecutor.
+    """
+    # ProcessPoolExecutor cannot cancel a running task nor hand out its workers, so
+    # this reads its private process table; the only place relying on it.
+    return list((executor._processes or {}).values())
+
+
+class ParserPool:
+    """
+    A shared process pool for CPU-heavy document parsing.
+
+    Parsing PDF, PPTX or DOCX files is pure Python work that holds the GIL, so on
+    threads concurrent uploads parse one at a time and slow down the event loop.
+    The pool runs them on `workers` processes instead. Each worker is replaced after
+    `max_tasks_per_child` tasks, so memory leaked by a parser does not pile up, and
+    a task, a file or a range of its pages, that takes longer than `timeout` seconds
+    has its pool killed and rebuilt; the other tasks that were running in that pool
+    are retried once on the new pool. At most `workers` tasks are handed to the pool
+    at once, the others wait here.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = config.PARSER_WORKERS,
+        max_tasks_per_child: int = config.PARSER_MAX_TASKS_PER_CHILD,
+        timeout: float = config.PARSER_TIMEOUT,
+    ) -> None:
+        """
+        Initialize a ParserPool object.
+
+        Args:
+            workers (Optional[int]): The number of parser processes. Defaults to the
+                number of CPUs.
+            max_tasks_per_child (int): The number of files a process parses before it
+                is replaced.
+            timeout (float): The number of seconds a file may take to parse.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_tasks_per_child = max_tasks_per_child
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # max_tasks_per_child is not supported with fork, and spawned workers do
+            # not inherit the models and threads of the server process.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=self.max_tasks_per_child,
+            )
+        return self._executor
+
+    def _kill(self, executor: ProcessPoolExecutor) -> None:
+        if self._executor is executor:
+            self._executor = None
+        for process in worker_processes(executor):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn: Callable, *args):
+        """
+        Run a parsing function in a worker process and await its result.
+
+        Args:
+            fn (Callable): A module-level function, so it can be pickled.
+            *args: Picklable positional arguments for fn.
+
+        Returns:
+            The return value of fn.
+
+        Raises:
+            ParseTimeout: If fn did not return within the timeout.
+            BrokenProcessPool: If the worker died twice while running fn.
+        """
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        # Files are only handed to the pool when a worker is free, so the timeout
+        # measures parsing time rather than time spent queued behind other files.
+        async with self._slots:
+            for attempt in range(2):
+                executor = self._get_executor()
+                try:
+                    return await asyncio.wait_for(
+                        loop.run_in_executor(executor, fn, *args), timeout=self.timeout
+                    )
+                except asyncio.TimeoutError:
+                    logger.error(f"Parsing {args} timed out after {self.timeout}s, restarting the parser pool")
+                    self._kill(executor)
+                    raise ParseTimeout(f"Parsing took longer than {self.timeout} seconds")
+                except BrokenProcessPool:
+                    if self._executor is executor:
+                        self._executor = None
+                    if attempt:
+                        raise
+                    logger.warning(f"Parser pool broke while parsing {args}, retrying")
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes. A new pool is started on the next parse.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+parser_pool = ParserPool()
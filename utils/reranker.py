@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from utils.config import config
+from utils.logging_config import logger
+from utils.metrics import RERANK_CACHE_LOOKUPS
+
+
+class CrossEncoderReranker:
+    """
+    Reranks retrieved chunks with a cross-encoder exported to ONNX.
+
+    A cross-encoder reads the query and a chunk together, so it scores relevance far
+    better than the distance between two independently computed embeddings, at the
+    cost of one forward pass per pair. Retrieval therefore over-fetches candidates
+    cheaply and the cross-encoder keeps the best k of them.
+
+    The model runs on CPU with onnxruntime, in batches of `batch_size` pairs. Scores
+    are cached by (query, chunk) in an LRU of `cache_size` entries, so follow-up
+    tool calls with the same query do not score the same chunks again. The model is
+    downloaded and loaded on first use.
+    """
+
+    def __init__(
+        self,
+        model_name: str = config.RERANK_MODEL,
+        onnx_file: str = config.RERANK_ONNX_FILE,
+        batch_size: int = config.RERANK_BATCH_SIZE,
+        max_length: int = config.RERANK_MAX_LENGTH,
+        cache_size: int = config.RERANK_CACHE_SIZE,
+    ) -> None:
+        """
+        Initialize a CrossEncoderReranker object.
+
+        Args:
+            model_name (str): The Hugging Face repository of the cross-encoder.
+            onnx_file (str): The path of the ONNX export inside the repository.
+            batch_size (int): The number of pairs scored per forward pass.
+            max_length (int): The maximum number of tokens of a query and chunk pair.
+            cache_size (int): The number of scores kept in the cache.
+        """
+        self.model_name = model_name
+        self.onnx_file = onnx_file
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._session = None
+        self._tokenizer = None
+        self._input_names: List[str] = []
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                return
+            import onnxruntime
+            from huggingface_hub import hf_hub_download
+            from tokenizers import Tokenizer
+
+            path = hf_hub_download(self.model_name, self.onnx_file)
+            session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+            tokenizer = Tokenizer.from_pretrained(self.model_name)
+            tokenizer.enable_truncation(max_length=self.max_length)
+            tokenizer.enable_padding()
+
+            self._input_names = [model_input.name for model_input in session.get_inputs()]
+            self._tokenizer = tokenizer
+            self._session = session
+            logger.info(f"Reranker loaded: {self.model_name} ({self.onnx_file})")
+
+    def _key(self, query: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{query}\0{text}".encode("utf-8")).hexdigest()
+
+    def _run_batch(self, query: str, texts: List[str]) -> List[float]:
+        encodings = self._tokenizer.encode_batch([(query, text) for text in texts])
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        logits = self._session.run(None, {name: inputs[name] for name in self._input_names})[0]
+        # single-logit models score relevance directly, two-logit ones in the last column
+        return logits.reshape(len(texts), -1)[:, -1].astype(float).tolist()
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """
+        Score the relevance of texts to a query. Blocking.
+
+        Args:
+            query (str): The query.
+            texts (List[str]): The texts to score.
+
+        Returns:
+            List[float]: One score per text, higher is more relevant.
+        """
+        keys = [self._key(query, text) for text in texts]
+        scores: dict = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+
+        missing = list({key: text for key, text in zip(keys, texts) if key not in scores}.items())
+        RERANK_CACHE_LOOKUPS.labels(result="hit").inc(len(keys) - len(missing))
+        RERANK_CACHE_LOOKUPS.labels(result="miss").inc(len(missing))
+        if missing:
+            self._load()
+            for i in range(0, len(missing), self.batch_size):
+                batch = missing[i:i + self.batch_size]
+                for (key, _), value in zip(batch, self._run_batch(query, [text for _, text in batch])):
+                    scores[key] = value
+
+            with self._lock:
+                for key, _ in missing:
+                    self._cache[key] = scores[key]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return [scores[key] for key in keys]
+
+    def rerank(self, query: str, documents: List[Document], k: int) -> List[Document]:
+        """
+        Keep the k documents most relevant to a query. Blocking.
+
+        Args:
+            query (str): The query.
+            documents (List[Document]): The candidates.
+            k (int): The number of documents kept.
+
+        Returns:
+            List[Document]: The best k documents, best first, with their score in the
+                `rerank_score` metadata.
+        """
+        if not documents:
+            return []
+        scores = self.score(query, [document.page_content for document in documents])
+        ranked = sorted(zip(documents, scores), key=lambda pair: pair[1], reverse=True)[:k]
+        for document, score in ranked:
+            document.metadata["rerank_score"] = score
+        return [document for document, _ in ranked]
+
+    async def arerank(self, query: str, documents: List[Document], k: int) -> List[Document]:
+        """
+        Like rerank, in the default executor; onnxruntime releases the GIL while it runs.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.rerank, query, documents, k)
+
+
+_reranker: Optional[CrossEncoderReranker] = None
+
+
+def get_reranker() -> CrossEncoderReranker:
+    """
+    Get the shared instance of the CrossEncoderReranker.
+
+    Returns:
+        CrossEncoderReranker: The instance of the CrossEncoderReranker.
+    """
+    global _reranker
+    if _reranker is None:
+        _reranker = CrossEncoderReranker()
+    return _reranker
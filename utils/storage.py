@@ -0,0 +1,168 @@
+import hashlib
+import os
+import uuid
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, List, Optional
+import anyio
+from fastapi import UploadFile
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the maximum upload size"""
+
+
+@dataclass
+class StoredFile:
+    path: Path
+    sha256: str
+    size: int
+
+
+@dataclass
+class ArchiveMember:
+    filename: str
+    stored: Optional[StoredFile] = None
+    error: Optional[str] = None
+
+
+def _move_to_storage(temp_path: Path, digest: str, upload_dir: Path, extension: str) -> Path:
+    file_path = upload_dir / digest[:2] / f"{digest}{extension}"
+
+    if file_path.exists():
+        temp_path.unlink()
+    else:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temp_path, file_path)
+
+    return file_path
+
+
+async def save_upload(
+    file: UploadFile,
+    upload_dir: Path,
+    extension: str,
+    max_size: int,
+    chunk_size: int = 1024 * 1024,
+) -> StoredFile:
+    """
+    Stream an upload to content-addressed storage.
+
+    The file is written to a temporary file in chunks while its sha256 is computed,
+    then moved to `<upload_dir>/<hash[:2]>/<hash><extension>`. If a file with the
+    same content is already stored, the new copy is discarded. The write is aborted
+    as soon as more than `max_size` bytes have been read.
+
+    Args:
+        file (UploadFile): The uploaded file.
+        upload_dir (Path): The root of the upload storage.
+        extension (str): The file extension, including the dot.
+        max_size (int): The maximum number of bytes accepted.
+        chunk_size (int): The number of bytes read per chunk.
+
+    Returns:
+        StoredFile: The stored path, the sha256 hex digest and the size in bytes.
+
+    Raises:
+        UploadTooLarge: If the upload is larger than max_size.
+    """
+    if file.size is not None and file.size > max_size:
+        raise UploadTooLarge(f"File exceeds the maximum upload size of {max_size} bytes")
+
+    temp_path = upload_dir / f".{uuid.uuid4().hex}.part"
+    hasher = hashlib.sha256()
+    size = 0
+
+    try:
+        async with await anyio.open_file(temp_path, "wb") as buffer:
+            while chunk := await file.read(chunk_size):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"File exceeds the maximum upload size of {max_size} bytes")
+                hasher.update(chunk)
+                await buffer.write(chunk)
+
+        digest = hasher.hexdigest()
+        file_path = _move_to_storage(temp_path, digest, upload_dir, extension)
+        return StoredFile(path=file_path, sha256=digest, size=size)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def extract_archive(
+    archive: BinaryIO,
+    upload_dir: Path,
+    allowed_extensions: set,
+    max_size: int,
+    max_files: int,
+    chunk_size: int = 1024 * 1024,
+) -> List[ArchiveMember]:
+    """
+    Extract the members of a zip archive to content-addressed storage.
+
+    Each member is streamed out and hashed like save_upload does. Members with an
+    unsupported extension or larger than `max_size` are reported with an error
+    instead of being stored; the size is checked on the bytes actually read, so a
+    member whose header understates its size is still stopped. Directories and
+    hidden files (e.g. `__MACOSX/`) are skipped. Blocking: run it in a thread.
+
+    Args:
+        archive (BinaryIO): The zip archive, opened in binary mode and seekable.
+        upload_dir (Path): The root of the upload storage.
+        allowed_extensions (set): The extensions accepted, including the dot.
+        max_size (int): The maximum number of bytes accepted per member.
+        max_files (int): The maximum number of members accepted.
+        chunk_size (int): The number of bytes read per chunk.
+
+    Returns:
+        List[ArchiveMember]: One entry per file in the archive, stored or with an error.
+
+    Raises:
+        zipfile.BadZipFile: If the archive is not a valid zip file.
+        ValueError: If the archive holds more than max_files files.
+    """
+    members = []
+
+    with zipfile.ZipFile(archive) as zip_file:
+        infos = [
+            info for info in zip_file.infolist()
+            if not info.is_dir() and not any(part.startswith((".", "__")) for part in Path(info.filename).parts)
+        ]
+        if len(infos) > max_files:
+            raise ValueError(f"Archive holds {len(infos)} files, the maximum is {max_files}")
+
+        for info in infos:
+            filename = Path(info.filename).name
+            extension = Path(filename).suffix.lower()
+            if extension not in allowed_extensions:
+                members.append(ArchiveMember(filename=filename, error=f"File type {extension} not supported"))
+                continue
+            if info.file_size > max_size:
+                members.append(ArchiveMember(filename=filename, error=f"File exceeds the maximum upload size of {max_size} bytes"))
+                continue
+
+            temp_path = upload_dir / f".{uuid.uuid4().hex}.part"
+            hasher = hashlib.sha256()
+            size = 0
+            try:
+                with zip_file.open(info) as source, open(temp_path, "wb") as buffer:
+                    while chunk := source.read(chunk_size):
+                        size += len(chunk)
+                        if size > max_size:
+                            raise UploadTooLarge(f"File exceeds the maximum upload size of {max_size} bytes")
+                        hasher.update(chunk)
+                        buffer.write(chunk)
+
+                digest = hasher.hexdigest()
+                file_path = _move_to_storage(temp_path, digest, upload_dir, extension)
+                members.append(ArchiveMember(filename=filename, stored=StoredFile(path=file_path, sha256=digest, size=size)))
+            except (UploadTooLarge, zipfile.BadZipFile, OSError) as e:
+                temp_path.unlink(missing_ok=True)
+                members.append(ArchiveMember(filename=filename, error=str(e)))
+            except BaseException:
+                temp_path.unlink(missing_ok=True)
+                raise
+
+    return members
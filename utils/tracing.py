@@ -0,0 +1,219 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor, SpanExporter
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import Link, Span, SpanKind, Status, StatusCode
+from utils.config import config
+from utils.logging_config import logger
+
+
+# Until setup_tracing installs a provider, this proxy hands out no-op spans, so the
+# spans below cost next to nothing with TRACING_ENABLED off.
+tracer = trace.get_tracer("mini-rag")
+
+_provider: Optional[TracerProvider] = None
+
+
+def create_exporter(name: str) -> SpanExporter:
+    """
+    Create the span exporter named by TRACING_EXPORTER.
+
+    Args:
+        name (str): "otlp", "console" or "memory".
+
+    Returns:
+        SpanExporter: The exporter.
+
+    Raises:
+        ValueError: If the exporter is unknown.
+    """
+    if name == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=config.TRACING_OTLP_ENDPOINT)
+    if name == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        return ConsoleSpanExporter()
+    if name == "memory":
+        return InMemorySpanExporter()
+    raise ValueError(f"Unknown tracing exporter: {name}, expected 'otlp', 'console' or 'memory'")
+
+
+def setup_tracing(
+    exporter: Optional[SpanExporter] = None,
+    sample_ratio: float = config.TRACING_SAMPLE_RATIO,
+) -> SpanExporter:
+    """
+    Install the tracer provider, the first time, and send its spans to an exporter.
+
+    Traces are sampled at `sample_ratio` by their root span; child spans, and requests
+    coming with a sampled traceparent, follow their parent's decision. Calling it again
+    adds another exporter to the same provider.
+
+    Args:
+        exporter (Optional[SpanExporter]): Where spans go, defaults to TRACING_EXPORTER.
+            An InMemorySpanExporter gets every span as soon as it ends, for tests.
+        sample_ratio (float): The share of traces recorded, from 0 to 1.
+
+    Returns:
+        SpanExporter: The exporter.
+    """
+    global _provider
+    if exporter is None:
+        exporter = create_exporter(config.TRACING_EXPORTER)
+    if _provider is None:
+        _provider = TracerProvider(
+            resource=Resource.create({"service.name": config.TRACING_SERVICE_NAME or config.APP_NAME}),
+            sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+        )
+        trace.set_tracer_provider(_provider)
+        logger.info(f"Tracing enabled, sampling {sample_ratio:.0%} of traces")
+    processor = SimpleSpanProcessor(exporter) if isinstance(exporter, InMemorySpanExporter) else BatchSpanProcessor(exporter)
+    _provider.add_span_processor(processor)
+    return exporter
+
+
+def shutdown_tracing() -> None:
+    """
+    Flush the spans still buffered and stop the exporters.
+    """
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def reset_tracing() -> None:
+    """
+    Stop the tracer provider and uninstall it, so spans are no-ops again until the
+    next setup_tracing, e.g. between tests.
+    """
+    global _provider, tracer
+    from opentelemetry.util._once import Once
+
+    shutdown_tracing()
+    _provider = None
+    # the OpenTelemetry API only lets a provider be installed once per process
+    trace._TRACER_PROVIDER = None
+    trace._TRACER_PROVIDER_SET_ONCE = Once()
+    tracer = trace.get_tracer("mini-rag")
+
+
+@contextmanager
+def start_span(name: str, links: Optional[List[Link]] = None, **attributes) -> Iterator[Span]:
+    """
+    Start a span as the current span, with the attributes that are not None.
+
+    Exceptions are recorded on the span and re-raised.
+
+    Args:
+        name (str): The name of the span.
+        links (Optional[List[Link]]): Spans this one follows from, in other traces.
+        **attributes: The attributes of the span.
+
+    Yields:
+        Span: The span, to add attributes known once the work is done.
+    """
+    with tracer.start_as_current_span(name, links=links) as span:
+        if span.is_recording():
+            for key, value in attributes.items():
+                if value is not None:
+                    span.set_attribute(key, value)
+        yield span
+
+
+def set_attributes(span: Span, **attributes) -> None:
+    """
+    Set the attributes that are not None on a span, if it is recorded.
+    """
+    if span.is_recording():
+        for key, value in attributes.items():
+            if value is not None:
+                span.set_attribute(key, value)
+
+
+def current_link() -> Optional[Link]:
+    """
+    Get a link to the current span, to follow it from work done outside its trace.
+
+    Returns:
+        Optional[Link]: The link, or None outside of a recorded span.
+    """
+    context = trace.get_current_span().get_span_context()
+    return Link(context) if context.is_valid and context.trace_flags.sampled else None
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware starting the root span of every HTTP request.
+
+    The span is continued from a W3C traceparent header when the client sends one,
+    named after the matched route, and ends once the response is fully sent, so a
+    streamed answer is covered to its last event.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        headers: Dict[str, str] = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        with tracer.start_as_current_span(
+            method, context=propagate.extract(headers), kind=SpanKind.SERVER
+        ) as span:
+            set_attributes(span, **{"http.request.method": method, "url.path": scope["path"]})
+
+            async def send_with_status(message) -> None:
+                if message["type"] == "http.response.start":
+                    set_attributes(span, **{"http.response.status_code": message["status"]})
+                    if message["status"] >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                if route is not None and span.is_recording():
+                    span.update_name(f"{method} {route.path}")
+                    span.set_attribute("http.route", route.path)
+
+
+def instrument_engine(engine) -> None:
+    """
+    Record a span for every statement run by a SQLAlchemy engine.
+
+    Args:
+        engine: The sync Engine, e.g. AsyncEngine.sync_engine.
+    """
+    from sqlalchemy import event
+
+    system = engine.dialect.name
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        span = tracer.start_span(statement.split(None, 1)[0].upper() if statement else "db", kind=SpanKind.CLIENT)
+        set_attributes(span, **{"db.system": system, "db.statement": statement[:1000]})
+        context._otel_span = span
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        span = getattr(context, "_otel_span", None)
+        if span is not None:
+            set_attributes(span, **{"db.rows": cursor.rowcount if cursor.rowcount >= 0 else None})
+            span.end()
+            context._otel_span = None
+
+    def handle_error(exception_context) -> None:
+        span = getattr(exception_context.execution_context, "_otel_span", None)
+        if span is not None:
+            span.record_exception(exception_context.original_exception)
+            span.set_status(Status(StatusCode.ERROR))
+            span.end()
+            exception_context.execution_context._otel_span = None
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)